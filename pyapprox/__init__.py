@@ -1,35 +1,122 @@
 """
 PyApprox : Sotware for model and data analysis
 
-Find way to avoid importing anything from matplotlib, scipy and other big
-pacakges. It increases overhead before function is run 
+The submodules are only imported when one of their attributes is first
+accessed, e.g. pyapprox.cartesian_product imports pyapprox.utilities, so
+that import pyapprox is fast. The attributes of the package are the public
+names of the modules in _submodules. If more than one module defines the
+same name the module listed last is used. Names imported, rather than
+defined, by the submodules are only attributes of the package if they are
+listed in _imported_attributes.
 """
-
+import os
+import re
+import importlib
+import importlib.util
 
 name = "pyapprox"
-# fast loads
-from pyapprox.utilities import *
-from pyapprox.random_variable_algebra import *
-from pyapprox.numerically_generate_orthonormal_polynomials_1d import *
-from pyapprox.models.wrappers import *
-from pyapprox.indexing import *
-from pyapprox.monomial import *
-from pyapprox.quantile_regression import *
-# slower loads
-from pyapprox.control_variate_monte_carlo import *
-from pyapprox.adaptive_polynomial_chaos import *
-from pyapprox.variable_transformations import *
-from pyapprox.variables import *
-from pyapprox.probability_measure_sampling import *
-from pyapprox.adaptive_sparse_grid import * 
-from pyapprox.univariate_quadrature import * 
-from pyapprox.visualization import *
-from pyapprox.optimization import *
-from pyapprox.density import *
-from pyapprox.arbitrary_polynomial_chaos import *
-from pyapprox.multivariate_polynomials import *
-from pyapprox.sensitivity_analysis import *
-from pyapprox.stochastic_dominance import * # very slow
-from pyapprox.gaussian_network import *
-from pyapprox.gaussian_process import *
 
+_submodules = [
+    # fast loads
+    'utilities',
+    'random_variable_algebra',
+    'numerically_generate_orthonormal_polynomials_1d',
+    'models.wrappers',
+    'indexing',
+    'monomial',
+    'quantile_regression',
+    # slower loads
+    'control_variate_monte_carlo',
+    'adaptive_polynomial_chaos',
+    'variable_transformations',
+    'variables',
+    'probability_measure_sampling',
+    'adaptive_sparse_grid',
+    'univariate_quadrature',
+    'visualization',
+    'optimization',
+    'density',
+    'arbitrary_polynomial_chaos',
+    'multivariate_polynomials',
+    'sensitivity_analysis',
+    'stochastic_dominance',  # very slow
+    'gaussian_network',
+    'gaussian_process',
+]
+
+# names imported, rather than defined, by the submodules that are also
+# attributes of the package and the submodules providing them
+_imported_attributes = {
+    'np': 'utilities',
+    'Matern': 'gaussian_process',
+    'evaluate_sparse_grid_subspace': 'adaptive_sparse_grid',
+    'get_1d_samples_weights': 'adaptive_sparse_grid',
+    'get_hierarchical_sample_indices': 'adaptive_sparse_grid',
+    'get_subspace_polynomial_indices': 'adaptive_sparse_grid',
+    'get_subspace_samples': 'adaptive_sparse_grid',
+}
+
+# the modules defining each public name. Built when first needed
+_attribute_modules = None
+
+
+def _get_attribute_modules():
+    """
+    Return a dictionary mapping the names of the functions, classes and
+    variables defined at the top level of each submodule to the submodules
+    defining them. The source is scanned rather than imported so that only
+    the submodule providing a requested attribute is imported.
+    """
+    global _attribute_modules
+    if _attribute_modules is not None:
+        return _attribute_modules
+    pattern = re.compile(
+        r'^(?:def|class)\s+([A-Za-z]\w*)|^([A-Za-z]\w*)\s*=', re.M)
+    attribute_modules = dict()
+    for submodule in _submodules:
+        filename = os.path.join(
+            os.path.dirname(__file__), *submodule.split('.'))+'.py'
+        with open(filename, 'r') as file_object:
+            source = file_object.read()
+        for function_name, variable_name in pattern.findall(source):
+            attribute_modules.setdefault(
+                function_name or variable_name, []).append(submodule)
+    _attribute_modules = attribute_modules
+    return _attribute_modules
+
+
+def _import_submodule(submodule):
+    return importlib.import_module(f'{__name__}.{submodule}')
+
+
+def __getattr__(attr):
+    if attr == '__all__':
+        # the scan can match assignments in docstrings so keep only the
+        # names the modules define
+        return sorted(
+            [key for key, submodules in _get_attribute_modules().items()
+             if any([hasattr(_import_submodule(submodule), key)
+                     for submodule in submodules])])
+    if attr.startswith('_'):
+        raise AttributeError(f"module '{__name__}' has no attribute '{attr}'")
+
+    for submodule in reversed(_get_attribute_modules().get(attr, [])):
+        module = _import_submodule(submodule)
+        if hasattr(module, attr):
+            value = getattr(module, attr)
+            globals()[attr] = value
+            return value
+
+    if importlib.util.find_spec(f'{__name__}.{attr}') is not None:
+        return _import_submodule(attr)
+
+    if attr in _imported_attributes:
+        value = getattr(_import_submodule(_imported_attributes[attr]), attr)
+        globals()[attr] = value
+        return value
+    raise AttributeError(f"module '{__name__}' has no attribute '{attr}'")
+
+
+def __dir__():
+    return sorted(set(globals().keys()).union(
+        _get_attribute_modules().keys()).union(_imported_attributes.keys()))
@@ -5,6 +5,7 @@ from pyapprox.adaptive_sparse_grid import SubSpaceRefinementManager
 from pyapprox.induced_sampling import increment_induced_samples_migliorati, \
     generate_induced_samples_migliorati_tolerance, christoffel_weights
 from scipy.linalg import solve_triangular
+from pyapprox.instrumentation import timer
 from pyapprox.utilities import add_columns_to_pivoted_lu_factorization, \
     continue_pivoted_lu_factorization, get_final_pivots_from_sequential_pivots,\
     split_lu_factorization_matrix, pivot_rows, hash_array, \
@@ -66,7 +67,8 @@ def solve_preconditioned_least_squares(basis_matrix_func,samples,values,
     basis_matrix = basis_matrix*weights[:,np.newaxis]
     rhs = values*weights[:,np.newaxis]
     #print(np.linalg.cond(basis_matrix))
-    coef = np.linalg.lstsq(basis_matrix,rhs,rcond=None)[0]
+    with timer('linear_solve'):
+        coef = np.linalg.lstsq(basis_matrix,rhs,rcond=None)[0]
     return coef
 
 def solve_preconditioned_orthogonal_matching_pursuit(basis_matrix_func,
@@ -201,6 +203,16 @@ class AdaptiveInducedPCE(SubSpaceRefinementManager):
     def __call__(self,samples):
         return self.pce(samples)
 
+    def refine_batch(self,batch_size,pool=None,recompute_priorities=False):
+        # the expansion is fit to all samples each time subspaces are added
+        # so samples cannot be integrated before the whole batch is evaluated
+        raise Exception('Batch refinement is not supported')
+
+    def write_checkpoint(self,filename,overwrite=False):
+        # the expansion and the factorizations used to generate samples
+        # are not part of the checkpoint records
+        raise Exception('Checkpointing is not supported')
+
     def get_active_unique_poly_indices(self):
         I = get_active_poly_array_indices(self)
         return self.poly_indices[:,I]
@@ -362,20 +374,21 @@ class AdaptiveLejaPCE(AdaptiveInducedPCE):
         num_new_subspace_samples = super(
             AdaptiveInducedPCE,self).add_new_subspaces(new_subspace_indices)
 
-        if self.factorization_type == 'fast':
-            it = self.samples.shape[1]
-            temp = solve_triangular(
-                self.LU_factor[:it, :it],
-                self.values*self.precond_weights[self.pivots],
-                lower=True, unit_diagonal=True)
-            coef = solve_triangular(self.LU_factor[:it, :it], temp, lower=False)
-            
-        else:
-            temp = solve_triangular(
-                self.L_factor,
-                self.values[self.pivots]*self.precond_weights,
-                lower=True)
-            coef = solve_triangular(self.U_factor, temp, lower=False)
+        with timer('linear_solve'):
+            if self.factorization_type == 'fast':
+                it = self.samples.shape[1]
+                temp = solve_triangular(
+                    self.LU_factor[:it, :it],
+                    self.values*self.precond_weights[self.pivots],
+                    lower=True, unit_diagonal=True)
+                coef = solve_triangular(
+                    self.LU_factor[:it, :it], temp, lower=False)
+            else:
+                temp = solve_triangular(
+                    self.L_factor,
+                    self.values[self.pivots]*self.precond_weights,
+                    lower=True)
+                coef = solve_triangular(self.U_factor, temp, lower=False)
         self.pce.set_coefficients(coef)
 
         return num_new_subspace_samples
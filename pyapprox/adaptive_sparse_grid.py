@@ -2,11 +2,14 @@ from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 from pyapprox.sparse_grid import *
 from pyapprox.models.wrappers import WorkTracker
+from pyapprox.instrumentation import timer, count
 import copy
 from pyapprox.utilities import lists_of_lists_of_arrays_equal, \
     lists_of_arrays_equal, partial_functions_equal
 import pickle
-from pyapprox.indexing import get_forward_neighbor, get_backward_neighbor
+import os
+from pyapprox.indexing import get_forward_neighbor, get_backward_neighbor, \
+    MultiIndexSet
 from functools import partial
 # try:
 #     # Python version < 3
@@ -61,6 +64,74 @@ def extract_items_from_priority_queue(pqueue):
         pqueue1.put(item)
     return items, pqueue1
   
+def get_array_increment(old_array,new_array):
+    """
+    Return the entries of a 1D array that changed, or were appended, since
+    the array was equal to old_array.
+
+    Returns
+    -------
+    increment : tuple (changed_idx, changed_values, new_values)
+        The indices and values of the entries of old_array that changed
+        and the entries appended to old_array.
+    """
+    num_old = old_array.shape[0]
+    changed_idx = np.where(new_array[:num_old]!=old_array)[0]
+    return changed_idx, new_array[changed_idx], new_array[num_old:].copy()
+
+
+def apply_array_increment(array,increment):
+    """
+    Apply an increment returned by get_array_increment to a 1D array.
+    """
+    changed_idx, changed_values, new_values = increment
+    array = np.concatenate([array,new_values])
+    array[changed_idx] = changed_values
+    return array
+
+
+def append_checkpoint_record(filename,record,mode='ab'):
+    """
+    Append a record to a checkpoint file. Records are pickled one after
+    another so existing records are never rewritten.
+    """
+    with open(filename,mode) as file_object:
+        pickle.dump(record,file_object,protocol=pickle.HIGHEST_PROTOCOL)
+        file_object.flush()
+        os.fsync(file_object.fileno())
+
+
+def read_checkpoint_records(filename):
+    """
+    Read the header and records of a checkpoint file written by
+    SubSpaceRefinementManager.write_checkpoint. An incomplete final record,
+    e.g. left by a process killed while writing, is ignored.
+
+    Returns
+    -------
+    header : dict
+        Information used to check the checkpoint is consistent with the
+        sparse grid being restored
+
+    records : list
+        The increments of the refinement state written at each step
+
+    nbytes : integer
+        The size in bytes of the header and the complete records
+    """
+    records = []
+    with open(filename,'rb') as file_object:
+        header = pickle.load(file_object)
+        nbytes = file_object.tell()
+        while True:
+            try:
+                records.append(pickle.load(file_object))
+            except (EOFError,pickle.UnpicklingError):
+                break
+            nbytes = file_object.tell()
+    return header, records, nbytes
+
+
 def update_smolyak_coefficients(new_index,subspace_indices,smolyak_coeffs):
     assert new_index.ndim==1
     assert subspace_indices.ndim==2
@@ -291,9 +362,9 @@ def variance_refinement_indicator_old(subspace_index,num_new_subspace_samples,
     
     #return subspace_index.sum()
     moments = sparse_grid.moments()
-    smolyak_coeffs = update_smolyak_coefficients(
-        subspace_index,sparse_grid.subspace_indices,
-        sparse_grid.smolyak_coefficients.copy())
+    smolyak_coeffs = \
+        sparse_grid.subspace_index_set.update_smolyak_coefficients(
+            subspace_index,sparse_grid.smolyak_coefficients.copy())
     new_moments = integrate_sparse_grid(
         sparse_grid.values,
         sparse_grid.poly_indices_dict,
@@ -343,9 +414,9 @@ def variance_refinement_indicator(subspace_index,num_new_subspace_samples,
     
     #return subspace_index.sum()
     moments = sparse_grid.moments()
-    smolyak_coeffs = update_smolyak_coefficients(
-        subspace_index,sparse_grid.subspace_indices,
-        sparse_grid.smolyak_coefficients.copy())
+    smolyak_coeffs = \
+        sparse_grid.subspace_index_set.update_smolyak_coefficients(
+            subspace_index,sparse_grid.smolyak_coefficients.copy())
 
     new_moments = sparse_grid.moments_(smolyak_coeffs)
 
@@ -387,9 +458,9 @@ def variance_refinement_indicator(subspace_index,num_new_subspace_samples,
 def cv_refinement_indicator(validation_samples,validation_values,
                             subspace_index,num_new_subspace_samples,
                             sparse_grid):
-    smolyak_coefficients = update_smolyak_coefficients(
-        subspace_index,sparse_grid.subspace_indices,
-        sparse_grid.smolyak_coefficients.copy())
+    smolyak_coefficients = \
+        sparse_grid.subspace_index_set.update_smolyak_coefficients(
+            subspace_index,sparse_grid.smolyak_coefficients.copy())
     approx_values = evaluate_sparse_grid(
         validation_samples[:sparse_grid.config_variables_idx,:],
         sparse_grid.values,
@@ -443,9 +514,9 @@ def compute_surpluses(subspace_index,sparse_grid,hierarchical=False):
         sparse_grid.subspace_values_indices_list,
         sparse_grid.config_variables_idx)
 
-    smolyak_coefficients = update_smolyak_coefficients(
-        subspace_index,sparse_grid.subspace_indices,
-        sparse_grid.smolyak_coefficients.copy())
+    smolyak_coefficients = \
+        sparse_grid.subspace_index_set.update_smolyak_coefficients(
+            subspace_index,sparse_grid.smolyak_coefficients.copy())
 
     new_approx_values = evaluate_sparse_grid(
         subspace_samples,
@@ -628,12 +699,18 @@ def extract_sparse_grid_quadrature_rule(asg):
 
 from pyapprox.adaptive_sparse_grid import mypriorityqueue
 class SubSpaceRefinementManager(object):
+    # attributes that can be recomputed from the other attributes and so
+    # are ignored when comparing two objects
+    cached_attribute_names = ['checkpoint_state']
+
     def __init__(self,num_vars):
         self.verbose=0
         self.num_vars = num_vars
         self.num_config_vars=0
         self.subspace_indices_dict = dict()
-        self.subspace_indices = np.zeros((self.num_vars,0),dtype=int)
+        # all subspace indices, active or not, in the order they were added
+        self.subspace_index_set = MultiIndexSet(self.num_vars)
+        self.subspace_is_active = []
         self.active_subspace_indices_dict = dict()
         self.active_subspace_queue = mypriorityqueue()
         self.admissibility_function = None
@@ -654,6 +731,11 @@ class SubSpaceRefinementManager(object):
         self.compact_univariate_growth_rule = None
         self.unique_poly_indices_idx=np.zeros((0),dtype=int)
         self.enforce_variable_ordering=False
+        self.checkpoint_state=None
+
+    @property
+    def subspace_indices(self):
+        return self.subspace_index_set.indices
 
     def initialize(self):
         self.poly_indices_dict = dict()
@@ -667,6 +749,10 @@ class SubSpaceRefinementManager(object):
         self.active_subspace_queue.put((-np.inf,self.error[0],0))
         
     def refine(self):
+        with timer('refine'):
+            return self._refine()
+
+    def _refine(self):
         if self.subspace_indices.shape[1]==0:
             self.initialize()
 
@@ -766,14 +852,24 @@ class SubSpaceRefinementManager(object):
         return new_active_subspace_indices
 
 
+    def subspace_index_is_admissible(self,subspace_index):
+        """
+        Return True if subspace_index is not in the sparse grid and all its
+        backward neighbors have been refined.
+        """
+        if subspace_index in self.subspace_index_set:
+            return False
+        for dd,neighbor_id in self.subspace_index_set.get_backward_neighbor_ids(
+                subspace_index):
+            if neighbor_id is None or self.subspace_is_active[neighbor_id]:
+                return False
+        return True
+
     def refine_subspace(self,subspace_index):
         new_active_subspace_indices = np.zeros((self.num_vars,0),dtype=int)
         for ii in range(self.num_vars):
             neighbor_index = get_forward_neighbor(subspace_index,ii)
-            if (subspace_index_is_admissible(
-                neighbor_index,self.subspace_indices_dict) and
-                    hash_array(neighbor_index) not in \
-                    self.active_subspace_indices_dict and
+            if (self.subspace_index_is_admissible(neighbor_index) and
                 self.admissibility_function(self,neighbor_index)):
                 new_active_subspace_indices = np.hstack(
                     (new_active_subspace_indices,neighbor_index[:,np.newaxis]))
@@ -788,25 +884,234 @@ class SubSpaceRefinementManager(object):
                     
         return new_active_subspace_indices
 
-    def build(self,callback=None):
+    def build(self,callback=None,checkpoint_filename=None,
+              overwrite_checkpoint=False):
         """
+        Refine the sparse grid until no admissible subspaces remain.
+
+        Parameters
+        ----------
+        callback : callable
+            Function with signature callback(sparse_grid) called after
+            each refinement
+
+        checkpoint_filename : string
+            If provided the refinement state is appended to this file after
+            each refinement. See write_checkpoint
+
+        overwrite_checkpoint : boolean
+            True - overwrite an existing checkpoint file
+            False - raise an exception if the checkpoint file exists and was
+            not loaded with load_checkpoint. Use resume to continue a build
+            from a checkpoint
         """
         while (not self.active_subspace_queue.empty() or
                self.subspace_indices.shape[1]==0):
             self.refine()
+            if checkpoint_filename is not None:
+                self.write_checkpoint(
+                    checkpoint_filename,overwrite_checkpoint)
             if callback is not None:
                 callback(self)
 
-    def refine_and_add_new_subspaces(self,best_active_subspace_index):
+    def update_checkpoint_state(self,filename,reset=False):
+        """
+        Store the parts of the refinement state needed to compute the next
+        checkpoint record. If reset is True the state of a sparse grid
+        with no subspaces is stored so the next record contains the
+        entire refinement state.
+        """
+        if reset:
+            self.checkpoint_state = {
+                'filename':filename,'num_subspaces':0,'num_samples':0,
+                'is_active':[],'error':np.zeros((0)),'queue':dict()}
+            return
+        self.checkpoint_state = {
+            'filename':filename,
+            'num_subspaces':self.subspace_indices.shape[1],
+            'num_samples':self.samples.shape[1],
+            'is_active':list(self.subspace_is_active),
+            'error':self.error.copy(),
+            'queue':dict([(item[2],item[0])
+                          for item in self.active_subspace_queue.list])}
+
+    def get_checkpoint_record(self):
+        """
+        Return the changes to the refinement state since the last
+        checkpoint.
+        """
+        state = self.checkpoint_state
+        num_subspaces = self.subspace_indices.shape[1]
+        was_active = np.asarray(state['is_active']+[True]*(
+            num_subspaces-state['num_subspaces']),dtype=bool)
+        refined_subspace_ids = np.where(
+            was_active&~np.asarray(self.subspace_is_active,dtype=bool))[0]
+        # queue items are identified by their subspace id and priority
+        queue_items = dict([(item[2],item) for item in
+                            self.active_subspace_queue.list])
+        queue_removed = [
+            subspace_id for subspace_id in state['queue'] if
+            (subspace_id not in queue_items or
+             queue_items[subspace_id][0]!=state['queue'][subspace_id])]
+        queue_added = [
+            queue_items[subspace_id] for subspace_id in sorted(queue_items)
+            if (subspace_id not in state['queue'] or
+                queue_items[subspace_id][0]!=state['queue'][subspace_id])]
+        values = None
+        if self.values is not None:
+            values = self.values[state['num_samples']:].copy()
+        postponed_subspace_indices = None
+        if hasattr(self,'postponed_subspace_indices'):
+            postponed_subspace_indices = self.postponed_subspace_indices
+        record = {
+            'subspace_indices':
+            self.subspace_indices[:,state['num_subspaces']:].copy(),
+            'refined_subspace_ids':refined_subspace_ids,
+            'samples':self.samples[:,state['num_samples']:].copy(),
+            'values':values,
+            'error':get_array_increment(state['error'],self.error),
+            'queue_removed':queue_removed,'queue_added':queue_added,
+            'num_equivalent_function_evaluations':
+            self.num_equivalent_function_evaluations,
+            'postponed_subspace_indices':postponed_subspace_indices}
+        return record
+
+    def set_checkpoint_record(self,record):
+        """
+        Update the refinement state with a record returned by
+        get_checkpoint_record.
+        """
+        new_subspace_indices = record['subspace_indices']
+        if new_subspace_indices.shape[1]>0:
+            self.initialize_subspaces(new_subspace_indices)
+            self.subspace_index_set.add_indices(new_subspace_indices)
+            self.subspace_is_active += [True]*new_subspace_indices.shape[1]
+        for subspace_id in record['refined_subspace_ids']:
+            key = hash_array(self.subspace_indices[:,subspace_id])
+            self.subspace_indices_dict[key] = \
+                self.active_subspace_indices_dict.pop(key)
+            self.subspace_is_active[subspace_id] = False
+
+        self.samples = np.hstack((self.samples,record['samples']))
+        if self.values is None:
+            self.values = record['values']
+        elif record['values'] is not None:
+            self.values = np.vstack((self.values,record['values']))
+        self.error = apply_array_increment(self.error,record['error'])
+
+        # pop items in priority order so replaying the records of
+        # serial refinement reproduces the queue exactly
+        removed_ids = set(record['queue_removed'])
+        kept_items = []
+        while len(removed_ids)>0 and not self.active_subspace_queue.empty():
+            item = self.active_subspace_queue.get()
+            if item[2] in removed_ids:
+                removed_ids.remove(item[2])
+            else:
+                kept_items.append(item)
+        for item in kept_items+record['queue_added']:
+            self.active_subspace_queue.put(item)
+
+        self.num_equivalent_function_evaluations = \
+            record['num_equivalent_function_evaluations']
+        if record['postponed_subspace_indices'] is not None:
+            self.postponed_subspace_indices = \
+                record['postponed_subspace_indices']
+
+    def write_checkpoint(self,filename,overwrite=False):
+        """
+        Append the changes to the refinement state since the last call to
+        a checkpoint file.
+
+        The first call for a given filename creates the file. The records
+        contain only arrays, lists and dictionaries so the function, the
+        refinement functions and the quadrature rules are not stored.
+        Use load_checkpoint or resume to restore the sparse grid.
+
+        Parameters
+        ----------
+        filename : string
+            The name of the checkpoint file
+
+        overwrite : boolean
+            True - the first call for a given filename overwrites an
+            existing file
+            False - raise an exception if the first call for a given
+            filename finds a non-empty file, unless it was loaded with
+            load_checkpoint
+        """
+        if (self.checkpoint_state is None or
+                self.checkpoint_state['filename']!=filename):
+            if (not overwrite and os.path.exists(filename) and
+                    os.path.getsize(filename)>0):
+                msg = f'Checkpoint {filename} exists. Use resume to continue '
+                msg += 'the build or pass overwrite=True to replace it'
+                raise Exception(msg)
+            header = {'class':type(self).__name__,'num_vars':self.num_vars,
+                      'config_variables_idx':self.config_variables_idx}
+            append_checkpoint_record(filename,header,'wb')
+            self.update_checkpoint_state(filename,reset=True)
+        append_checkpoint_record(filename,self.get_checkpoint_record())
+        self.update_checkpoint_state(filename)
+
+    def load_checkpoint(self,filename):
+        """
+        Restore the refinement state from a checkpoint file written by
+        write_checkpoint without evaluating the function.
+
+        The sparse grid must be configured, e.g. with the same function,
+        refinement functions and quadrature rules used to write the
+        checkpoint, but not yet refined. Any incomplete final record is
+        removed from the file and subsequent calls to write_checkpoint with
+        the same filename append to it.
+        """
+        if self.subspace_indices.shape[1]>0:
+            msg = 'load_checkpoint must be called before refinement starts'
+            raise Exception(msg)
+        header, records, nbytes = read_checkpoint_records(filename)
+        if (header['class']!=type(self).__name__ or
+            header['num_vars']!=self.num_vars or
+            header['config_variables_idx']!=self.config_variables_idx):
+            msg = f'Checkpoint {filename} is inconsistent with this object'
+            raise Exception(msg)
+        self.poly_indices_dict = dict()
+        self.samples = np.zeros((self.num_vars,0))
+        self.error = np.zeros((0))
+        for record in records:
+            self.set_checkpoint_record(record)
+        # remove any incomplete record so new records can be appended
+        if os.path.getsize(filename)>nbytes:
+            os.truncate(filename,nbytes)
+        self.update_checkpoint_state(filename)
+
+    def resume(self,filename,callback=None):
+        """
+        Restore the refinement state from a checkpoint file and continue
+        building the sparse grid, appending to the same file.
+        """
+        self.load_checkpoint(filename)
+        self.build(callback,filename)
+
+    def refine_active_subspace(self,best_active_subspace_index):
+        """
+        Move an active subspace into the set of refined subspaces and
+        return its admissible forward neighbors. The neighbors are not added
+        to the sparse grid.
+        """
         key = hash_array(best_active_subspace_index)
         self.subspace_indices_dict[key]=\
           self.active_subspace_indices_dict[key]
+        self.subspace_is_active[self.subspace_indices_dict[key]]=False
     
         # get all new active subspace indices
         new_active_subspace_indices = self.refine_subspace(
             best_active_subspace_index)
         del self.active_subspace_indices_dict[key]
+        return new_active_subspace_indices
 
+    def refine_and_add_new_subspaces(self,best_active_subspace_index):
+        new_active_subspace_indices = self.refine_active_subspace(
+            best_active_subspace_index)
         if new_active_subspace_indices.shape[1]>0:
             num_new_subspace_samples=self.add_new_subspaces(
                 new_active_subspace_indices)
@@ -875,29 +1180,237 @@ class SubSpaceRefinementManager(object):
             #cnt += 1
         return new_samples,num_new_subspace_samples
 
-    def add_new_subspaces(self,new_subspace_indices):
+    def allocate_new_subspaces(self,new_subspace_indices):
+        """
+        Add new subspaces and their samples to the sparse grid without
+        evaluating the function. The values of the new samples are set to
+        nan until set_new_subspace_values is called.
+        """
         new_samples, num_new_subspace_samples = self.create_new_subspaces_data(
             new_subspace_indices)
 
-        new_values = self.eval_function(new_samples)
-        self.subspace_indices = np.hstack(
-            (self.subspace_indices,new_subspace_indices))
+        self.subspace_index_set.add_indices(new_subspace_indices)
+        self.subspace_is_active += [True]*new_subspace_indices.shape[1]
         self.samples = np.hstack((self.samples,new_samples))
 
+        if self.values is not None:
+            self.values = np.vstack((self.values, np.full(
+                (new_samples.shape[1],self.values.shape[1]),np.nan)))
+
+        return new_samples, num_new_subspace_samples
+
+    def set_new_subspace_values(self,subspace_ids,sample_idx,new_values):
+        """
+        Set the values of the samples allocated when the subspaces with
+        the ids subspace_ids were added to the sparse grid.
+
+        Parameters
+        ----------
+        subspace_ids : np.ndarray (num_new_subspaces)
+            The indices of the subspaces in self.subspace_indices
+
+        sample_idx : integer
+            The index of the first new sample in self.samples
+
+        new_values : np.ndarray (num_new_samples,num_qoi)
+            The values of the new samples
+        """
         if self.values is None:
-            self.values = new_values
-        else:
-            self.values = np.vstack((self.values, new_values))
+            self.values = np.full(
+                (self.samples.shape[1],new_values.shape[1]),np.nan)
+        self.values[sample_idx:sample_idx+new_values.shape[0]] = new_values
 
+    def add_new_subspaces(self,new_subspace_indices):
+        num_current_subspaces = self.subspace_indices.shape[1]
+        new_samples, num_new_subspace_samples = self.allocate_new_subspaces(
+            new_subspace_indices)
+        new_values = self.eval_function(new_samples)
+        self.set_new_subspace_values(
+            np.arange(num_current_subspaces,self.subspace_indices.shape[1]),
+            self.samples.shape[1]-new_samples.shape[1],new_values)
+        # costs may only be known after the function is evaluated
         self.num_equivalent_function_evaluations += self.get_cost(
             new_subspace_indices,num_new_subspace_samples)        
-
         return num_new_subspace_samples
 
+    def refine_batch(self,batch_size,pool=None,recompute_priorities=False):
+        """
+        Refine the batch_size active subspaces with the highest priority.
+
+        The new subspaces of all refined subspaces are added to the sparse
+        grid before any function is evaluated. The samples added when
+        refining each subspace are then evaluated concurrently and
+        integrated in the order the subspaces were refined, as soon as
+        all the samples of the preceding subspaces have been evaluated.
+        When batch_size=1 the sparse grid is identical to the one obtained
+        by refine().
+
+        Parameters
+        ----------
+        batch_size : integer
+            The maximum number of active subspaces refined
+
+        pool : concurrent.futures.Executor
+            The pool used to evaluate self.function. If None the samples are
+            evaluated serially.
+
+        recompute_priorities : boolean
+            True - recompute the priorities of the subspaces remaining in the
+                   queue after refining more than one subspace. These
+                   priorities were computed before the other subspaces in
+                   the batch were refined and so may be stale
+            False - keep the existing priorities
+        """
+        with timer('refine'):
+            self._refine_batch(batch_size,pool,recompute_priorities)
+
+    def _refine_batch(self,batch_size,pool,recompute_priorities):
+        if self.subspace_indices.shape[1]==0:
+            self.initialize()
+
+        items = [self.active_subspace_queue.get() for ii in range(
+            min(batch_size,len(self.active_subspace_queue)))]
+        jobs = []
+        for priority,error,best_subspace_idx in items:
+            best_active_subspace_index = \
+                self.subspace_indices[:,best_subspace_idx]
+            if self.verbose>1:
+                msg = f'refining index {best_active_subspace_index} '
+                msg += f'with priority {priority}\n'
+                msg += 'The Current number of equivalent function '
+                msg += f'evaluations is {self.num_equivalent_function_evaluations}'
+                print(msg)
+            num_current_subspaces = self.subspace_indices.shape[1]
+            new_active_subspace_indices = self.refine_active_subspace(
+                best_active_subspace_index)
+            if new_active_subspace_indices.shape[1]>0:
+                new_samples, num_new_subspace_samples = \
+                    self.allocate_new_subspaces(new_active_subspace_indices)
+            else:
+                new_samples = np.empty((self.num_vars,0))
+                num_new_subspace_samples = np.empty((0),dtype=int)
+            jobs.append(
+                [best_subspace_idx,new_active_subspace_indices,
+                 num_current_subspaces,self.samples.shape[1]-
+                 new_samples.shape[1],new_samples,num_new_subspace_samples])
+
+        if pool is None:
+            for job in jobs:
+                self.integrate_batch_job(job,self.eval_function(job[4]))
+        else:
+            from concurrent.futures import as_completed
+            futures = dict()
+            results = [None]*len(jobs)
+            for jj,job in enumerate(jobs):
+                if job[4].shape[1]>0:
+                    count('nmodel_evaluations',job[4].shape[1])
+                    future = pool.submit(
+                        self.function,
+                        self.map_samples_from_canonical_space(job[4]))
+                    futures[future]=jj
+                else:
+                    results[jj] = np.empty((0,0))
+            next_job = 0
+            while (next_job<len(jobs) and results[next_job] is not None):
+                self.integrate_batch_job(jobs[next_job],results[next_job])
+                next_job += 1
+            for future in as_completed(futures):
+                # time spent waiting for the concurrent evaluations
+                with timer('model_evaluation'):
+                    results[futures[future]] = future.result()
+                while (next_job<len(jobs) and results[next_job] is not None):
+                    self.integrate_batch_job(jobs[next_job],results[next_job])
+                    next_job += 1
+
+        if recompute_priorities and len(items)>1:
+            self.recompute_active_subspace_priorities()
+
+    def integrate_batch_job(self,job,new_values):
+        """
+        Set the values of the subspaces added when refining a subspace in
+        refine_batch and prioritize the new subspaces.
+        """
+        best_subspace_idx,new_active_subspace_indices,num_current_subspaces,\
+            sample_idx,new_samples,num_new_subspace_samples = job
+        num_new_subspaces = new_active_subspace_indices.shape[1]
+        if num_new_subspaces>0:
+            self.set_new_subspace_values(
+                np.arange(num_current_subspaces,
+                          num_current_subspaces+num_new_subspaces),
+                sample_idx,new_values)
+            self.num_equivalent_function_evaluations += self.get_cost(
+                new_active_subspace_indices,num_new_subspace_samples)
+            self.prioritize_active_subspaces(
+                new_active_subspace_indices,num_new_subspace_samples,
+                num_current_subspaces)
+        self.error[best_subspace_idx]=0.0
+
+    def build_batch(self,batch_size,max_eval_concurrency=1,
+                    pool_type='thread',recompute_priorities=False,
+                    callback=None,checkpoint_filename=None,
+                    overwrite_checkpoint=False):
+        """
+        Build the sparse grid by refining batch_size subspaces at a time
+        and evaluating the function at the samples of each refinement
+        concurrently. See refine_batch.
+
+        Parameters
+        ----------
+        max_eval_concurrency : integer
+            The maximum number of concurrent evaluations of self.function
+
+        pool_type : string
+            The type of pool used when max_eval_concurrency>1.
+            'thread' - concurrent.futures.ThreadPoolExecutor
+            'process' - concurrent.futures.ProcessPoolExecutor. self.function
+                        must be picklable
+
+        checkpoint_filename : string
+            If provided the refinement state is appended to this file after
+            each batch. See write_checkpoint
+
+        overwrite_checkpoint : boolean
+            True - overwrite an existing checkpoint file
+            False - raise an exception if the checkpoint file exists and was
+            not loaded with load_checkpoint
+        """
+        if pool_type not in ['thread','process']:
+            raise Exception("pool_type must be ['thread','process']")
+        pool = None
+        if max_eval_concurrency>1:
+            from concurrent.futures import ThreadPoolExecutor, \
+                ProcessPoolExecutor
+            if pool_type=='thread':
+                pool = ThreadPoolExecutor(max_eval_concurrency)
+            else:
+                pool = ProcessPoolExecutor(max_eval_concurrency)
+        try:
+            while (not self.active_subspace_queue.empty() or
+                   self.subspace_indices.shape[1]==0):
+                self.refine_batch(batch_size,pool,recompute_priorities)
+                if checkpoint_filename is not None:
+                    self.write_checkpoint(
+                        checkpoint_filename,overwrite_checkpoint)
+                if callback is not None:
+                    callback(self)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
     def prioritize_active_subspaces(self,new_active_subspace_indices,
-                                    num_new_subspace_samples):
-        cnt = self.subspace_indices.shape[1]-\
-              new_active_subspace_indices.shape[1]
+                                    num_new_subspace_samples,
+                                    first_subspace_idx=None):
+        """
+        Compute the priorities of new active subspaces and add them to the
+        queue. first_subspace_idx is the index of the first new subspace in
+        self.subspace_indices. If None the new subspaces are assumed to be
+        the last subspaces added.
+        """
+        if first_subspace_idx is None:
+            cnt = self.subspace_indices.shape[1]-\
+                new_active_subspace_indices.shape[1]
+        else:
+            cnt = first_subspace_idx
         for ii in range(new_active_subspace_indices.shape[1]):
             subspace_index = new_active_subspace_indices[:,ii]
 
@@ -938,14 +1451,18 @@ class SubSpaceRefinementManager(object):
                 random_samples)
         return random_samples
 
-    def eval_function(self,canonical_samples):
+    def map_samples_from_canonical_space(self,canonical_samples):
         random_samples = self.map_random_samples_from_canonical_space(
             canonical_samples)
         config_samples = self.map_config_samples_from_canonical_space(
             canonical_samples)
-        samples = np .vstack((random_samples,config_samples))
-        values = self.function(samples)
-        
+        return np.vstack((random_samples,config_samples))
+
+    def eval_function(self,canonical_samples):
+        samples = self.map_samples_from_canonical_space(canonical_samples)
+        count('nmodel_evaluations',samples.shape[1])
+        with timer('model_evaluation'):
+            values = self.function(samples)
         return values
 
     def set_univariate_growth_rules(self,univariate_growth_rule,
@@ -1080,7 +1597,8 @@ class SubSpaceRefinementManager(object):
         base class.
         """
         member_names = [
-            m[0] for m in vars(self).items() if not m[0].startswith("__")]
+            m[0] for m in vars(self).items() if not m[0].startswith("__")
+            and m[0] not in self.cached_attribute_names]
         for m in member_names:
             attr = getattr(other,m)
             #print(m)
@@ -1200,6 +1718,9 @@ def get_sparse_grid_univariate_leja_quadrature_rules(
 
 
 class CombinationSparseGrid(SubSpaceRefinementManager):
+    cached_attribute_names = ['barycentric_weights_1d','evaluation_plan',
+                              'checkpoint_state']
+
     def __init__(self,num_vars):
         super(CombinationSparseGrid,self).__init__(num_vars)
 
@@ -1209,6 +1730,10 @@ class CombinationSparseGrid(SubSpaceRefinementManager):
         self.variable_transformation = None
         self.compact_univariate_quad_rule = None
         self.subspace_moments = None
+        self.barycentric_weights_1d = None
+        self.evaluation_plan = None
+        self.use_shared_univariate_basis = False
+        self.max_eval_chunk_size = None
 
     def setup(self,function,config_variables_idx,refinement_indicator,
               admissibility_function,univariate_growth_rule,
@@ -1277,15 +1802,18 @@ class CombinationSparseGrid(SubSpaceRefinementManager):
             self.compact_univariate_growth_rule,
             [max_level]*dd,self.config_variables_idx,
             self.unique_quadrule_indices)
+        self.barycentric_weights_1d = None
+        self.evaluation_plan = None
 
-    def refine_and_add_new_subspaces(self,best_active_subspace_index):
-        new_active_subspace_indices, num_new_subspace_samples = super(
-            CombinationSparseGrid,self).refine_and_add_new_subspaces(
+    def refine_active_subspace(self,best_active_subspace_index):
+        new_active_subspace_indices = super(
+            CombinationSparseGrid,self).refine_active_subspace(
             best_active_subspace_index)
-        self.smolyak_coefficients = update_smolyak_coefficients(
-            best_active_subspace_index,self.subspace_indices,
-            self.smolyak_coefficients)
-        return new_active_subspace_indices, num_new_subspace_samples
+        self.smolyak_coefficients = \
+            self.subspace_index_set.update_smolyak_coefficients(
+                best_active_subspace_index,self.smolyak_coefficients)
+        self.evaluation_plan = None
+        return new_active_subspace_indices
 
     def get_subspace_samples(self,subspace_index,unique_poly_indices):
         samples_1d,weights_1d = update_1d_samples_weights(
@@ -1301,6 +1829,46 @@ class CombinationSparseGrid(SubSpaceRefinementManager):
             unique_poly_indices,self.samples_1d,self.config_variables_idx)
 
 
+    def update_barycentric_weights_1d(self):
+        self.barycentric_weights_1d = update_sparse_grid_barycentric_weights_1d(
+            self.samples_1d,self.barycentric_weights_1d,
+            self.unique_quadrule_indices)
+        return self.barycentric_weights_1d
+
+    def get_evaluation_plan(self):
+        """
+        Return the data needed to evaluate the sparse grid. The data is
+        computed once and reused until the sparse grid is refined.
+        """
+        if self.evaluation_plan is None:
+            self.update_barycentric_weights_1d()
+            self.evaluation_plan = get_sparse_grid_evaluation_plan(
+                self.values,self.subspace_indices,self.smolyak_coefficients,
+                self.samples_1d,self.subspace_values_indices_list,
+                self.barycentric_weights_1d,self.config_variables_idx)
+        return self.evaluation_plan
+
+    def set_evaluation_options(self,use_shared_univariate_basis=False,
+                               max_eval_chunk_size=None):
+        """
+        Set the options used to evaluate the sparse grid.
+
+        Parameters
+        ----------
+        use_shared_univariate_basis : boolean
+            True - evaluate the univariate Lagrange basis of each unique 
+                   variable and level once and share it between subspaces. 
+                   This is typically faster for grids with many subspaces
+            False - evaluate each subspace interpolant independently
+
+        max_eval_chunk_size : integer
+            The maximum number of samples evaluated at once when 
+            use_shared_univariate_basis is True. If None all samples are 
+            evaluated at once.
+        """
+        self.use_shared_univariate_basis = use_shared_univariate_basis
+        self.max_eval_chunk_size = max_eval_chunk_size
+
     def __call__(self,samples):
         """
         config values are ignored. The sparse grid just returns its best 
@@ -1313,15 +1881,16 @@ class CombinationSparseGrid(SubSpaceRefinementManager):
                     samples[:self.config_variables_idx,:])
         else:
             canonical_samples = samples[:self.config_variables_idx,:]
+
+        if self.use_shared_univariate_basis:
+            return evaluate_sparse_grid_from_evaluation_plan_using_shared_basis(
+                canonical_samples[:self.config_variables_idx,:],
+                self.get_evaluation_plan(),self.values.shape[1],
+                self.max_eval_chunk_size)
         
-        return evaluate_sparse_grid(
+        return evaluate_sparse_grid_from_evaluation_plan(
             canonical_samples[:self.config_variables_idx,:],
-            self.values,
-            self.poly_indices_dict,self.subspace_indices,
-            self.subspace_poly_indices_list,
-            self.smolyak_coefficients,self.samples_1d,
-            self.subspace_values_indices_list,
-            self.config_variables_idx)
+            self.get_evaluation_plan(),self.values.shape[1])
 
     def moments_(self,smolyak_coefficients):
         return integrate_sparse_grid_from_subspace_moments(
@@ -1355,9 +1924,9 @@ class CombinationSparseGrid(SubSpaceRefinementManager):
         # coefficients
         for ii in range(len(pairs)):
             subspace_index = self.subspace_indices[:,pairs[ii][-1]]
-            smolyak_coefficients = update_smolyak_coefficients(
-                subspace_index,self.subspace_indices,
-                smolyak_coefficients)
+            smolyak_coefficients = \
+                self.subspace_index_set.update_smolyak_coefficients(
+                    subspace_index,smolyak_coefficients)
         
         if self.variable_transformation is not None:
             canonical_samples = \
@@ -1374,35 +1943,86 @@ class CombinationSparseGrid(SubSpaceRefinementManager):
             self.subspace_poly_indices_list,
             smolyak_coefficients,self.samples_1d,
             self.subspace_values_indices_list,
-            self.config_variables_idx)
+            self.config_variables_idx,
+            barycentric_weights_1d=self.update_barycentric_weights_1d())
         return approx_values
 
-    def add_new_subspaces(self,new_subspace_indices):
-        num_new_subspaces = new_subspace_indices.shape[1]
-        num_current_subspaces = self.subspace_indices.shape[1]
-        num_new_subspace_samples = super(
-            CombinationSparseGrid,self).add_new_subspaces(new_subspace_indices)
-        
-        cnt = num_current_subspaces
-        new_subspace_moments = np.empty(
-            (num_new_subspaces,self.values.shape[1],2),dtype=float)
-        for ii in range(num_new_subspaces):
-            subspace_index = new_subspace_indices[:,ii]
+    def set_new_subspace_values(self,subspace_ids,sample_idx,new_values):
+        super(CombinationSparseGrid,self).set_new_subspace_values(
+            subspace_ids,sample_idx,new_values)
+        self.evaluation_plan = None
+
+        num_subspaces = self.subspace_indices.shape[1]
+        if self.subspace_moments is None:
+            self.subspace_moments = np.full(
+                (num_subspaces,self.values.shape[1],2),np.nan)
+        elif self.subspace_moments.shape[0]<num_subspaces:
+            self.subspace_moments = np.vstack(
+                (self.subspace_moments,np.full(
+                    (num_subspaces-self.subspace_moments.shape[0],
+                     self.values.shape[1],2),np.nan)))
+
+        for ii in subspace_ids:
+            subspace_index = self.subspace_indices[:,ii]
             subspace_values = get_subspace_values(
-                self.values, self.subspace_values_indices_list[cnt])
+                self.values, self.subspace_values_indices_list[ii])
             subspace_moments = integrate_sparse_grid_subspace(
                 subspace_index,subspace_values,self.weights_1d,
                 self.config_variables_idx)
-            new_subspace_moments[ii,:,:] = subspace_moments.T
-            cnt += 1
-
+            self.subspace_moments[ii,:,:] = subspace_moments.T
+
+    def update_checkpoint_state(self,filename,reset=False):
+        super(CombinationSparseGrid,self).update_checkpoint_state(
+            filename,reset)
+        if reset:
+            self.checkpoint_state['smolyak_coefficients'] = np.zeros((0))
+            self.checkpoint_state['num_levels_1d'] = [0]*len(self.samples_1d)
+        else:
+            self.checkpoint_state['smolyak_coefficients'] = \
+                self.smolyak_coefficients.copy()
+            # the univariate rules of each level are only ever appended
+            self.checkpoint_state['num_levels_1d'] = [
+                len(samples_1d_dd) for samples_1d_dd in self.samples_1d]
+
+    def get_checkpoint_record(self):
+        record = super(CombinationSparseGrid,self).get_checkpoint_record()
+        record['smolyak_coefficients'] = get_array_increment(
+            self.checkpoint_state['smolyak_coefficients'],
+            self.smolyak_coefficients)
+        record['subspace_moments'] = self.subspace_moments[
+            self.checkpoint_state['num_subspaces']:].copy()
+        # only store the univariate rules of the levels added since the
+        # last checkpoint
+        num_levels_1d = self.checkpoint_state['num_levels_1d']
+        record['num_levels_1d'] = num_levels_1d
+        record['samples_1d'] = [
+            samples_1d_dd[num_levels_1d[dd]:]
+            for dd, samples_1d_dd in enumerate(self.samples_1d)]
+        record['weights_1d'] = [
+            weights_1d_dd[num_levels_1d[dd]:]
+            for dd, weights_1d_dd in enumerate(self.weights_1d)]
+        return record
+
+    def set_checkpoint_record(self,record):
+        super(CombinationSparseGrid,self).set_checkpoint_record(record)
+        self.smolyak_coefficients = apply_array_increment(
+            self.smolyak_coefficients,record['smolyak_coefficients'])
         if self.subspace_moments is None:
-            self.subspace_moments = new_subspace_moments
+            self.subspace_moments = record['subspace_moments']
         else:
             self.subspace_moments = np.vstack(
-                (self.subspace_moments,new_subspace_moments))
-
-        return num_new_subspace_samples
+                (self.subspace_moments,record['subspace_moments']))
+        # the rules of the levels in the record replace any rules of the
+        # same levels created when the sparse grid was set up
+        num_levels_1d = record['num_levels_1d']
+        self.samples_1d = [
+            list(self.samples_1d[dd][:num_levels_1d[dd]])+samples_1d_dd
+            for dd, samples_1d_dd in enumerate(record['samples_1d'])]
+        self.weights_1d = [
+            list(self.weights_1d[dd][:num_levels_1d[dd]])+weights_1d_dd
+            for dd, weights_1d_dd in enumerate(record['weights_1d'])]
+        self.barycentric_weights_1d = None
+        self.evaluation_plan = None
 
     def save(self,filename):
         try:
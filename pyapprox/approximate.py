@@ -6,6 +6,7 @@ from pyapprox.adaptive_sparse_grid import variance_refinement_indicator, \
 from pyapprox.variables import IndependentMultivariateRandomVariable
 from pyapprox.variable_transformations import AffineRandomVariableTransformation
 from functools import partial
+from pyapprox.instrumentation import instrument as _instrument, timer, timed
 
 from scipy.optimize import OptimizeResult
 class ApproximateResult(OptimizeResult):
@@ -262,7 +263,7 @@ def adaptive_approximate_polynomial_chaos(fun,univariate_variables,callback=None
         # Todo implement default for non-bounded variables that uses induced
         # sampling
         # candidate samples must be in canonical domain
-        from pyapprox import halton_sequence
+        from pyapprox.utilities import halton_sequence
         candidate_samples = -np.cos(
             np.pi*halton_sequence(nvars,1,int(ncandidate_samples+1)))
         #candidate_samples = -np.cos(
@@ -340,7 +341,7 @@ def compute_l2_error(f,g,variable,nsamples,rel=False):
         error /=np.linalg.norm(validation_vals,axis=0)
     return error
 
-def adaptive_approximate(fun,variable,method,options=None):
+def adaptive_approximate(fun,variable,method,options=None,instrument=False):
     r"""
     Adaptive approximation of a scalar or vector-valued function of one or 
     more variables. These methods choose the samples to at which to 
@@ -363,6 +364,15 @@ def adaptive_approximate(fun,variable,method,options=None):
         - 'sparse_grid'
         - 'polynomial_chaos'
         - 'gaussian_process'
+
+    instrument : boolean or string
+        False - do not record timings
+        True - store the wall time and number of calls of each phase of the
+               construction, e.g. refinement, basis matrix construction,
+               linear solves and model evaluations, in the attribute
+               ``profile`` of the result.
+               See :class:`pyapprox.instrumentation.PhaseProfiler`
+        'memory' - also record the bytes allocated during each phase
         
     Returns
     -------
@@ -385,7 +395,21 @@ def adaptive_approximate(fun,variable,method,options=None):
 
     if options is None:
         options = {}
-    return methods[method](fun,variable,**options)
+    return call_instrumented(
+        instrument,methods[method],fun,variable,**options)
+
+def call_instrumented(instrument,fun,*args,**kwargs):
+    """
+    Call a function returning an ApproximateResult and, if requested, store
+    the timings of its phases in the attribute profile of the result.
+    """
+    if not instrument:
+        return fun(*args,**kwargs)
+    with _instrument(track_memory=(instrument=='memory')) as profiler:
+        with timer('total'):
+            result = fun(*args,**kwargs)
+    result.profile = profiler.summary()
+    return result
 
 def approximate_polynomial_chaos(train_samples,train_vals,verbosity=0,
                                  basis_type='expanding_basis',
@@ -448,7 +472,8 @@ def approximate_polynomial_chaos(train_samples,train_vals,verbosity=0,
     res = funcs[basis_type](poly, train_samples, train_vals, **options)
     return res
 
-def approximate(train_samples,train_vals,method,options=None):
+def approximate(train_samples,train_vals,method,options=None,
+                instrument=False):
     r"""
     Approximate a scalar or vector-valued function of one or 
     more variables from a set of points provided by the user
@@ -467,6 +492,11 @@ def approximate(train_samples,train_vals,method,options=None):
         - 'polynomial_chaos'
         - 'gaussian_process'
 
+    instrument : boolean or string
+        Record the wall time of each phase of the construction in the
+        attribute ``profile`` of the result.
+        See :func:`pyapprox.approximate.adaptive_approximate`
+
     Returns
     -------
     result : :class:`pyapprox.approximate.ApproximateResult`
@@ -484,13 +514,14 @@ def approximate(train_samples,train_vals,method,options=None):
 
     if options is None:
         options = {}
-    return methods[method](train_samples,train_vals,**options)
-
+    return call_instrumented(
+        instrument,methods[method],train_samples,train_vals,**options)
 
-from sklearn.linear_model import LassoCV, LassoLarsCV, LarsCV, \
-    OrthogonalMatchingPursuitCV
 
+@timed('linear_solve')
 def fit_linear_model(basis_matrix, train_vals, solver_type, **kwargs):
+    from sklearn.linear_model import LassoCV, LassoLarsCV, LarsCV, \
+        OrthogonalMatchingPursuitCV
     solvers = {'lasso_lars':LassoLarsCV(cv=kwargs['cv']).fit,
                'lasso':LassoCV(cv=kwargs['cv']).fit,
                'lars':LarsCV(cv=kwargs['cv']).fit,
@@ -512,7 +543,7 @@ def fit_linear_model(basis_matrix, train_vals, solver_type, **kwargs):
     return coef, cv_score
 
 import copy
-from pyapprox import compute_hyperbolic_indices
+from pyapprox.indexing import compute_hyperbolic_indices
 def cross_validate_pce_degree(
         pce, train_samples, train_vals, min_degree=1, max_degree=3,
         hcross_strength=1, cv=10, solver_type='lars', verbosity=0):
@@ -661,7 +692,8 @@ def restrict_basis(indices,coefficients,tol):
         restricted_indices = np.concatenate([indices[:J],restrict_indices])
     return restricted_indices
 
-from pyapprox import hash_array, get_forward_neighbor, get_backward_neighbor
+from pyapprox.utilities import hash_array
+from pyapprox.indexing import get_forward_neighbor, get_backward_neighbor
 def expand_basis(indices):
     nvars,nindices=indices.shape
     indices_set = set()
@@ -928,5 +960,6 @@ def approximate_gaussian_process(train_samples,train_vals,nu=np.inf,n_restarts_o
     length_scale = np.array([1]*nvars)
     kernel += WhiteKernel(length_scale,noise_level_bounds=(1e-8, 1))
     gp = GaussianProcess(kernel,n_restarts_optimizer=n_restarts_optimizer)
-    gp.fit(train_samples,train_vals)
+    with timer('gaussian_process_fit'):
+        gp.fit(train_samples,train_vals)
     return ApproximateResult({'approx':gp})
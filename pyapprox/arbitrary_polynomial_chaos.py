@@ -4,7 +4,6 @@ from __future__ import (absolute_import, division,
 import numpy as np
 from pyapprox.multivariate_polynomials import PolynomialChaosExpansion, \
      evaluate_multivariate_orthonormal_polynomial
-from matplotlib import pyplot as plt
 from pyapprox.utilities import cartesian_product, outer_product,\
     get_tensor_product_quadrature_rule
 from pyapprox.indexing import set_difference
@@ -101,6 +100,12 @@ class APC(PolynomialChaosExpansion):
             samples)
         return self.canonical_basis_matrix(canonical_samples,opts)
 
+    def value(self,samples):
+        # the rotated basis cannot be evaluated by summing over the
+        # coefficients one dimension at a time
+        basis_matrix = self.basis_matrix(samples)
+        return np.dot(basis_matrix,self.coefficients)
+
     # def basis_matrix(self,samples):
     #     if self.compute_moment_matrix_function is not None:
     #         return np.dot(self.unrotated_basis_matrix(samples),self.R_inv)
@@ -348,6 +348,68 @@ def multivariate_barycentric_lagrange_interpolation(
         active_abscissa_indices_1d)
     
 
+def evaluate_univariate_barycentric_lagrange_basis(x,abscissa_1d,
+                                                  barycentric_weights_1d):
+    """
+    Evaluate the univariate Lagrange basis functions at a set of samples
+    using the barycentric formula.
+
+    Parameters
+    ----------
+    x : np.ndarray (num_samples)
+        The samples at which to evaluate the basis
+
+    abscissa_1d : np.ndarray (num_abscissa)
+        The interpolation nodes
+
+    barycentric_weights_1d : np.ndarray (num_abscissa)
+        The barycentric weights of the interpolation nodes
+
+    Returns
+    -------
+    basis_matrix : np.ndarray (num_samples,num_abscissa)
+        The values of each Lagrange basis at each sample
+    """
+    eps = 2*np.finfo(float).eps
+    diff = x[:,np.newaxis]-abscissa_1d[np.newaxis,:]
+    # samples which coincide with an abscissa
+    I,J = np.where(np.absolute(diff)<eps)
+    diff[I,J] = 1.
+    basis_matrix = barycentric_weights_1d[np.newaxis,:]/diff
+    basis_matrix /= basis_matrix.sum(axis=1)[:,np.newaxis]
+    basis_matrix[I,:] = 0.
+    basis_matrix[I,J] = 1.
+    return basis_matrix
+
+def tensor_product_barycentric_lagrange_interpolation_from_basis(
+        basis_matrices_1d,fn_vals):
+    """
+    Evaluate a tensor-product Lagrange interpolant from the values of the
+    univariate Lagrange basis at the evaluation samples.
+
+    Parameters
+    ----------
+    basis_matrices_1d : [np.ndarray (num_samples,num_abscissa_1d)]
+        The univariate basis matrices of each active dimension. 
+
+    fn_vals : np.ndarray (num_abscissa,num_qoi)
+        The function values at each of the interpolation nodes, ordered 
+        as generated by the function cartesian_product.
+
+    Returns
+    -------
+    result : np.ndarray (num_samples,num_qoi)
+        The values of the interpolant at the samples
+    """
+    shape = [basis.shape[1] for basis in basis_matrices_1d]
+    assert np.prod(shape)==fn_vals.shape[0]
+    # cartesian_product varies the first dimension fastest
+    tensor_vals = fn_vals.reshape(shape+[fn_vals.shape[1]],order='F')
+    result = np.tensordot(basis_matrices_1d[0],tensor_vals,axes=(1,0))
+    for basis in basis_matrices_1d[1:]:
+        result = np.einsum('ij,ij...->i...',basis,result)
+    return result
+
 def clenshaw_curtis_barycentric_weights( level ):
     if ( level == 0 ):
         return np.array( [0.5], np.float )
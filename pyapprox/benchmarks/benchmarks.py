@@ -213,7 +213,7 @@ def setup_rosenbrock_function(nvars):
         ``jac(z) -> np.ndarray``
 
         where ``z`` is a 2D np.ndarray with shape (nvars,nsamples) and the
-        output is a 2D np.ndarray with shape (nvars,1)
+        output is a 2D np.ndarray with shape (nvars,nsamples)
 
     hessp : callable
         Hessian of  ``fun`` times an arbitrary vector p with signature
@@ -272,6 +272,13 @@ def setup_rosenbrock_function(nvars):
                       'loglike_grad':lambda x: -benchmark['jac'](x)})
     return benchmark
 
+def genz_jacobian(genz,samples):
+    """
+    Return the gradients (nvars,nsamples) of a Genz function at a set of
+    samples (nvars,nsamples).
+    """
+    return genz(samples,{'eval_type':'grad'}).T
+
 def setup_genz_function(nvars,test_name,coefficients=None):
     r"""
     Setup the Genz Benchmarks.
@@ -282,7 +289,7 @@ def setup_genz_function(nvars,test_name,coefficients=None):
     >>> from pyapprox.benchmarks.benchmarks import setup_benchmark
     >>> benchmark=setup_benchmark('genz',nvars=2,test_name='oscillatory')
     >>> print(benchmark.keys())
-    dict_keys(['fun', 'mean', 'variable'])
+    dict_keys(['fun', 'jac', 'mean', 'variable'])
 
     Parameters
     ----------
@@ -303,7 +310,10 @@ def setup_genz_function(nvars,test_name,coefficients=None):
     Returns
     -------
     benchmark : pya.Benchmark
-       Object containing the benchmark attributes
+       Object containing the benchmark attributes. ``fun`` and ``jac``
+       evaluate the values (nsamples,1) and gradients (nvars,nsamples) of
+       all samples at once. The gradients have the same shape as those of
+       the other benchmarks.
 
     References
     ----------
@@ -344,7 +354,8 @@ def setup_genz_function(nvars,test_name,coefficients=None):
         genz.set_coefficients(1,'squared-exponential-decay',0)
     else:
         genz.c,genz.w = coefficients
-    attributes = {'fun':genz,'mean':genz.integrate(),'variable':variable}
+    attributes = {'fun':genz,'jac':partial(genz_jacobian,genz),
+                  'mean':genz.integrate(),'variable':variable}
     if test_name=='corner-peak':
         attributes['variance']=genz.variance()
         from scipy.optimize import OptimizeResult
@@ -0,0 +1,594 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the computational cost of the hot paths of pyapprox.
+
+The benchmarks in PERFORMANCE_BENCHMARKS record the wall time and peak
+memory of each hot path for a grid of dimensions and sample sizes. The
+results are stored as JSON so that regressions can be found by comparing
+the results of two commits, e.g.
+
+    python -m pyapprox.benchmarks.performance_benchmarks --output new.json \
+        --compare old.json
+
+The remaining benchmarks compare alternative implementations of the same
+hot path. Print them with the --implementations flag.
+"""
+import time
+import json
+import platform
+import datetime
+import itertools
+import subprocess
+import tracemalloc
+import os
+import numpy as np
+import scipy
+from scipy import stats
+
+from pyapprox.indexing import compute_hyperbolic_indices
+from pyapprox.multivariate_polynomials import PolynomialChaosExpansion, \
+    define_poly_options_from_variable_transformation
+from pyapprox.variable_transformations import \
+    define_iid_random_variable_transformation
+
+
+def time_function(fun, *args, nrepeats=3):
+    """
+    Return the smallest wall time in seconds of nrepeats calls to
+    fun(*args) and the value returned by the last call.
+    """
+    wall_times = []
+    for ii in range(nrepeats):
+        t0 = time.perf_counter()
+        result = fun(*args)
+        wall_times.append(time.perf_counter()-t0)
+    return min(wall_times), result
+
+
+def time_and_memory_function(fun, *args, nrepeats=3):
+    """
+    Return the smallest wall time in seconds of nrepeats calls to
+    fun(*args), the peak memory in bytes allocated during an additional
+    call and the value returned by the last call.
+
+    The memory is measured in a separate call because tracing allocations
+    slows down the function.
+    """
+    wall_time, result = time_function(fun, *args, nrepeats=nrepeats)
+    tracemalloc.start()
+    fun(*args)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return wall_time, peak_memory, result
+
+
+def setup_pce(nvars, degree, hcross_strength, nqoi=1):
+    var_trans = define_iid_random_variable_transformation(
+        stats.uniform(-1, 2), nvars)
+    poly = PolynomialChaosExpansion()
+    poly.configure(define_poly_options_from_variable_transformation(
+        var_trans))
+    poly.set_indices(compute_hyperbolic_indices(
+        nvars, degree, hcross_strength))
+    poly.set_coefficients(np.random.normal(0, 1, (poly.num_terms(), nqoi)))
+    return poly
+
+
+def benchmark_pce_evaluation(nvars_list=[2, 5, 10], degree=4,
+                             hcross_strength=1., nsamples=10000, nqoi=1):
+    """
+    Compare the wall time of evaluating a polynomial chaos expansion by
+    forming the basis matrix with evaluating the expansion by summing over
+    the coefficients one dimension at a time.
+
+    Parameters
+    ----------
+    hcross_strength : float
+        The hyperbolic cross parameter of the index set. Use 1 for total
+        degree index sets.
+
+    Returns
+    -------
+    results : list
+        A dictionary for each number of variables containing the number of
+        terms and the wall times of each implementation
+    """
+    results = []
+    for nvars in nvars_list:
+        poly = setup_pce(nvars, degree, hcross_strength, nqoi)
+        samples = np.random.uniform(-1, 1, (nvars, nsamples))
+        basis_matrix_time, values = time_function(
+            lambda x: poly.basis_matrix(x).dot(poly.coefficients), samples)
+        contraction_time, contraction_values = time_function(
+            poly.value_using_coefficient_contraction, samples)
+        assert np.allclose(values, contraction_values)
+        results.append(
+            {'nvars': nvars, 'nterms': poly.num_terms(),
+             'basis_matrix': basis_matrix_time,
+             'coefficient_contraction': contraction_time})
+    return results
+
+
+def benchmark_polynomial_kernels(nvars_list=[2, 5, 10], degree=3,
+                                 nsamples_list=[1000, 10000, 100000],
+                                 deriv_order=0):
+    """
+    Compare the wall time of evaluating a multivariate orthonormal
+    polynomial basis with the numba kernels and with numpy.
+
+    Returns
+    -------
+    results : list
+        A dictionary for each number of variables and samples containing
+        the wall times of each implementation. Empty if numba is not
+        installed.
+    """
+    from pyapprox import orthonormal_polynomials_1d
+    from pyapprox.orthonormal_polynomials_1d import jacobi_recurrence, \
+        get_numba_polynomial_kernels
+    from pyapprox.multivariate_polynomials import \
+        evaluate_multivariate_orthonormal_polynomial
+    if get_numba_polynomial_kernels() is None:
+        return []
+
+    numba_min_num_samples = orthonormal_polynomials_1d.numba_min_num_samples
+    ab = jacobi_recurrence(degree+1, 0, 0, True)
+    results = []
+    try:
+        for nvars in nvars_list:
+            indices = compute_hyperbolic_indices(nvars, degree, 1.)
+            for nsamples in nsamples_list:
+                samples = np.random.uniform(-1, 1, (nvars, nsamples))
+                orthonormal_polynomials_1d.numba_min_num_samples = np.inf
+                numpy_time, values = time_function(
+                    evaluate_multivariate_orthonormal_polynomial, samples,
+                    indices, ab, deriv_order)
+                orthonormal_polynomials_1d.numba_min_num_samples = 0
+                # compile the kernels before timing
+                evaluate_multivariate_orthonormal_polynomial(
+                    samples[:, :1], indices, ab, deriv_order)
+                numba_time, numba_values = time_function(
+                    evaluate_multivariate_orthonormal_polynomial, samples,
+                    indices, ab, deriv_order)
+                assert np.allclose(values, numba_values)
+                results.append(
+                    {'nvars': nvars, 'nsamples': nsamples,
+                     'nterms': indices.shape[1], 'numpy': numpy_time,
+                     'numba': numba_time})
+    finally:
+        orthonormal_polynomials_1d.numba_min_num_samples = \
+            numba_min_num_samples
+    return results
+
+
+def benchmark_pce_basis_matrix(nvars, degree, nsamples, nrepeats=3):
+    """
+    Time the evaluation of the basis matrix of a total degree polynomial
+    chaos expansion.
+    """
+    poly = setup_pce(nvars, degree, 1.)
+    samples = np.random.uniform(-1, 1, (nvars, nsamples))
+    wall_time, peak_memory, __ = time_and_memory_function(
+        poly.basis_matrix, samples, nrepeats=nrepeats)
+    return {'wall_time': wall_time, 'peak_memory': peak_memory,
+            'nterms': poly.num_terms()}
+
+
+def setup_sparse_grid(nvars, max_level, refinement_indicator, function):
+    from functools import partial
+    from pyapprox.adaptive_sparse_grid import CombinationSparseGrid, \
+        max_level_admissibility_function
+    from pyapprox.univariate_quadrature import clenshaw_curtis_rule_growth, \
+        clenshaw_curtis_in_polynomial_order
+    admissibility_function = partial(
+        max_level_admissibility_function, max_level, None, None, None)
+    sparse_grid = CombinationSparseGrid(nvars)
+    sparse_grid.set_refinement_functions(
+        refinement_indicator, admissibility_function,
+        clenshaw_curtis_rule_growth)
+    sparse_grid.set_univariate_rules(clenshaw_curtis_in_polynomial_order)
+    sparse_grid.set_function(function)
+    return sparse_grid
+
+
+def sparse_grid_benchmark_function(samples):
+    return np.cos(samples.sum(axis=0))[:, np.newaxis]
+
+
+def benchmark_sparse_grid_evaluation(nvars, level, nsamples, nrepeats=3):
+    """
+    Time the evaluation of an isotropic sparse grid.
+    """
+    from pyapprox.adaptive_sparse_grid import isotropic_refinement_indicator
+    sparse_grid = setup_sparse_grid(
+        nvars, level, isotropic_refinement_indicator,
+        sparse_grid_benchmark_function)
+    sparse_grid.build()
+    samples = np.random.uniform(-1, 1, (nvars, nsamples))
+    # exclude the cost of computing the cached evaluation plan
+    sparse_grid(samples[:, :1])
+    wall_time, peak_memory, __ = time_and_memory_function(
+        sparse_grid, samples, nrepeats=nrepeats)
+    return {'wall_time': wall_time, 'peak_memory': peak_memory,
+            'nsparse_grid_samples': sparse_grid.samples.shape[1]}
+
+
+def benchmark_adaptive_sparse_grid_build(nvars, max_level, nrepeats=3):
+    """
+    Time the construction of a sparse grid refined using the variance
+    refinement indicator.
+    """
+    from pyapprox.adaptive_sparse_grid import variance_refinement_indicator
+
+    def build():
+        sparse_grid = setup_sparse_grid(
+            nvars, max_level, variance_refinement_indicator,
+            sparse_grid_benchmark_function)
+        sparse_grid.build()
+        return sparse_grid
+    wall_time, peak_memory, sparse_grid = time_and_memory_function(
+        build, nrepeats=nrepeats)
+    return {'wall_time': wall_time, 'peak_memory': peak_memory,
+            'nsparse_grid_samples': sparse_grid.samples.shape[1],
+            'nsubspaces': sparse_grid.subspace_indices.shape[1]}
+
+
+def benchmark_gaussian_process(nvars, ntrain_samples, nsamples, nrepeats=3):
+    """
+    Time the fitting, including the optimization of the kernel
+    hyper-parameters, and the prediction of a Gaussian process.
+    """
+    from sklearn.gaussian_process.kernels import Matern
+    from pyapprox.gaussian_process import GaussianProcess
+    train_samples = np.random.uniform(-1, 1, (nvars, ntrain_samples))
+    train_values = sparse_grid_benchmark_function(train_samples)
+    samples = np.random.uniform(-1, 1, (nvars, nsamples))
+    gp = GaussianProcess(Matern(length_scale=np.ones(nvars), nu=2.5))
+    fit_time, fit_memory, __ = time_and_memory_function(
+        gp.fit, train_samples, train_values, nrepeats=nrepeats)
+    predict_time, predict_memory, __ = time_and_memory_function(
+        lambda x: gp(x, return_std=True), samples, nrepeats=nrepeats)
+    return {'fit_wall_time': fit_time, 'fit_peak_memory': fit_memory,
+            'predict_wall_time': predict_time,
+            'predict_peak_memory': predict_memory}
+
+
+def benchmark_pivoted_cholesky_sampling(nvars, ncandidate_samples, nsamples,
+                                        nrepeats=3):
+    """
+    Time the selection of nsamples from a set of candidate samples using a
+    pivoted Cholesky factorization of the kernel matrix.
+    """
+    from sklearn.gaussian_process.kernels import Matern
+    from pyapprox.utilities import pivoted_cholesky_decomposition
+    candidate_samples = np.random.uniform(
+        -1, 1, (nvars, ncandidate_samples))
+    kernel_matrix = Matern(length_scale=0.5, nu=2.5)(candidate_samples.T)
+    wall_time, peak_memory, __ = time_and_memory_function(
+        pivoted_cholesky_decomposition, kernel_matrix, nsamples,
+        nrepeats=nrepeats)
+    return {'wall_time': wall_time, 'peak_memory': peak_memory}
+
+
+def benchmark_pivoted_lu_sampling(nvars, degree, ncandidate_samples,
+                                  nrepeats=3):
+    """
+    Time the selection of Leja samples from a set of candidate samples using
+    a truncated pivoted LU factorization of a polynomial basis matrix.
+    """
+    from pyapprox.utilities import truncated_pivoted_lu_factorization
+    poly = setup_pce(nvars, degree, 1.)
+    candidate_samples = np.random.uniform(
+        -1, 1, (nvars, ncandidate_samples))
+    basis_matrix = poly.basis_matrix(candidate_samples)
+    wall_time, peak_memory, __ = time_and_memory_function(
+        truncated_pivoted_lu_factorization, basis_matrix, poly.num_terms(),
+        nrepeats=nrepeats)
+    return {'wall_time': wall_time, 'peak_memory': peak_memory,
+            'nterms': poly.num_terms()}
+
+
+def benchmark_induced_sampling(nvars, degree, nsamples, nrepeats=3):
+    """
+    Time drawing samples from the measure induced by a polynomial chaos
+    expansion. The tables of the CDFs of the univariate induced measures
+    are built during the first repetition and reused afterwards.
+    """
+    from pyapprox.induced_sampling import generate_induced_samples
+    poly = setup_pce(nvars, degree, 1.)
+    wall_time, peak_memory, __ = time_and_memory_function(
+        generate_induced_samples, poly, nsamples, nrepeats=nrepeats)
+    return {'wall_time': wall_time, 'peak_memory': peak_memory}
+
+
+def benchmark_acv_allocation(nmodels, ntarget_costs, nrepeats=3):
+    """
+    Time the optimal allocation of samples of an approximate control
+    variate estimator for a set of target costs.
+    """
+    from pyapprox.control_variate_monte_carlo import ACVMF
+    samples = np.random.uniform(0, 1, (1, 10000))
+    values = np.hstack([samples.T**(nmodels-ii) for ii in range(nmodels)])
+    cov = np.cov(values, rowvar=False)
+    costs = np.logspace(0, -nmodels+1, nmodels)
+    estimator = ACVMF(cov, costs)
+    target_costs = np.logspace(2, 4, ntarget_costs)
+    wall_time, peak_memory, __ = time_and_memory_function(
+        estimator.allocate_samples_sweep, target_costs, nrepeats=nrepeats)
+    return {'wall_time': wall_time, 'peak_memory': peak_memory}
+
+
+def benchmark_optimal_experimental_design_criteria(
+        nfactors_list=[10, 50, 100], ndesign_pts_list=[1000, 10000],
+        criteria='I'):
+    """
+    Compare the wall time and peak memory of evaluating the value and
+    gradient of an optimality criterion using the outer products of the
+    design factors with computing the criterion directly from the design
+    factors. The time and memory needed to form the outer products is
+    included.
+
+    Returns
+    -------
+    results : list
+        A dictionary for each number of factors and design points containing
+        the wall times and peak memory of each implementation
+    """
+    from pyapprox.optimal_experimental_design import \
+        compute_homoscedastic_outer_products, ioptimality_criterion, \
+        doptimality_criterion
+    results = []
+    for nfactors in nfactors_list:
+        for ndesign_pts in ndesign_pts_list:
+            design_factors = np.random.normal(0, 1, (ndesign_pts, nfactors))
+            pred_factors = np.random.normal(0, 1, (100, nfactors))
+            design_prob_measure = np.ones(ndesign_pts)/ndesign_pts
+            if criteria == 'I':
+                def criterion(homog_outer_prods):
+                    return ioptimality_criterion(
+                        homog_outer_prods, design_factors, pred_factors,
+                        design_prob_measure)
+            else:
+                def criterion(homog_outer_prods):
+                    return doptimality_criterion(
+                        homog_outer_prods, design_factors,
+                        design_prob_measure)
+            outer_products_time, outer_products_memory, values = \
+                time_and_memory_function(
+                    lambda: criterion(compute_homoscedastic_outer_products(
+                        design_factors)))
+            factored_time, factored_memory, factored_values = \
+                time_and_memory_function(lambda: criterion(None))
+            assert np.allclose(values[0], factored_values[0])
+            assert np.allclose(values[1], factored_values[1])
+            results.append(
+                {'nfactors': nfactors, 'ndesign_pts': ndesign_pts,
+                 'outer_products': outer_products_time,
+                 'factored': factored_time,
+                 'outer_products_memory': outer_products_memory,
+                 'factored_memory': factored_memory})
+    return results
+
+
+# name: (benchmark function, grid of parameters, small grid of parameters)
+PERFORMANCE_BENCHMARKS = {
+    'pce_basis_matrix': (
+        benchmark_pce_basis_matrix,
+        {'nvars': [2, 5, 10], 'degree': [3, 6], 'nsamples': [1000, 100000]},
+        {'nvars': [2], 'degree': [3], 'nsamples': [100]}),
+    'sparse_grid_evaluation': (
+        benchmark_sparse_grid_evaluation,
+        {'nvars': [2, 5], 'level': [3, 5], 'nsamples': [1000, 100000]},
+        {'nvars': [2], 'level': [2], 'nsamples': [100]}),
+    'adaptive_sparse_grid_build': (
+        benchmark_adaptive_sparse_grid_build,
+        {'nvars': [2, 5, 10], 'max_level': [3, 5]},
+        {'nvars': [2], 'max_level': [2]}),
+    'gaussian_process': (
+        benchmark_gaussian_process,
+        {'nvars': [2, 5], 'ntrain_samples': [100, 500],
+         'nsamples': [10000]},
+        {'nvars': [2], 'ntrain_samples': [10], 'nsamples': [100]}),
+    'pivoted_cholesky_sampling': (
+        benchmark_pivoted_cholesky_sampling,
+        {'nvars': [2, 5], 'ncandidate_samples': [1000, 5000],
+         'nsamples': [100, 500]},
+        {'nvars': [2], 'ncandidate_samples': [100], 'nsamples': [10]}),
+    'pivoted_lu_sampling': (
+        benchmark_pivoted_lu_sampling,
+        {'nvars': [2, 5], 'degree': [5, 10], 'ncandidate_samples': [10000]},
+        {'nvars': [2], 'degree': [3], 'ncandidate_samples': [100]}),
+    'induced_sampling': (
+        benchmark_induced_sampling,
+        {'nvars': [2, 5], 'degree': [5, 10], 'nsamples': [10000, 100000]},
+        {'nvars': [2], 'degree': [2], 'nsamples': [100]}),
+    'acv_allocation': (
+        benchmark_acv_allocation,
+        {'nmodels': [3, 5], 'ntarget_costs': [10]},
+        {'nmodels': [3], 'ntarget_costs': [2]}),
+}
+
+
+def run_performance_benchmarks(names=None, quick=False, nrepeats=3,
+                               verbose=True):
+    """
+    Run the benchmarks in PERFORMANCE_BENCHMARKS for each combination of
+    their parameters.
+
+    Parameters
+    ----------
+    names : iterable
+        The names of the benchmarks to run. If None run all benchmarks
+
+    quick : boolean
+        True - run each benchmark for a single small set of parameters.
+               Useful for checking the benchmarks run
+        False - run each benchmark for the full grid of parameters
+
+    Returns
+    -------
+    results : list
+        A dictionary for each benchmark and set of parameters with the keys
+        'benchmark', 'params' and 'metrics'
+    """
+    if names is None:
+        names = list(PERFORMANCE_BENCHMARKS.keys())
+    results = []
+    for name in names:
+        if name not in PERFORMANCE_BENCHMARKS:
+            msg = f'Benchmark "{name}" not found. Available benchmarks are '
+            msg += f'{list(PERFORMANCE_BENCHMARKS.keys())}'
+            raise Exception(msg)
+        benchmark, param_grid, quick_param_grid = PERFORMANCE_BENCHMARKS[name]
+        if quick:
+            param_grid = quick_param_grid
+        for param_values in itertools.product(*param_grid.values()):
+            params = dict(zip(param_grid.keys(), param_values))
+            # use the same data for every commit
+            np.random.seed(1)
+            metrics = benchmark(**params, nrepeats=nrepeats)
+            results.append(
+                {'benchmark': name, 'params': params, 'metrics': metrics})
+            if verbose:
+                print(name, params, metrics)
+    return results
+
+
+def get_benchmark_environment():
+    """
+    Return information about the code and machine used to run the
+    benchmarks.
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (subprocess.CalledProcessError, OSError):
+        commit = None
+    return {'commit': commit,
+            'date': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__, 'scipy': scipy.__version__,
+            'machine': platform.platform(),
+            'processor': platform.processor(),
+            'ncpus': os.cpu_count()}
+
+
+def save_performance_benchmark_results(results, filename):
+    """
+    Save the results of run_performance_benchmarks and the environment
+    used to produce them to a JSON file.
+    """
+    with open(filename, 'w') as file_object:
+        json.dump({'environment': get_benchmark_environment(),
+                   'results': results}, file_object, indent=1)
+
+
+def load_performance_benchmark_results(filename):
+    with open(filename, 'r') as file_object:
+        return json.load(file_object)
+
+
+def compare_performance_benchmark_results(baseline, results, rtol=0.2,
+                                          verbose=True):
+    """
+    Compare the metrics of two runs of the benchmarks.
+
+    Parameters
+    ----------
+    baseline : dict
+        The results, loaded with load_performance_benchmark_results, used
+        as the reference
+
+    results : dict
+        The results being compared with the baseline
+
+    rtol : float
+        The relative increase of a metric considered a regression
+
+    Returns
+    -------
+    regressions : list
+        Tuples (benchmark, params, metric, baseline_value, value) of the
+        wall times and peak memories that increased by more than rtol
+    """
+    baseline_metrics = dict(
+        [((result['benchmark'], json.dumps(result['params'], sort_keys=True)),
+          result['metrics']) for result in baseline['results']])
+    regressions = []
+    for result in results['results']:
+        key = (result['benchmark'],
+               json.dumps(result['params'], sort_keys=True))
+        if key not in baseline_metrics:
+            continue
+        for metric, value in result['metrics'].items():
+            if 'wall_time' not in metric and 'peak_memory' not in metric:
+                continue
+            baseline_value = baseline_metrics[key][metric]
+            ratio = value/max(baseline_value, np.finfo(float).tiny)
+            if verbose:
+                print('{:>28} {:>50} {:>20} {:>8.3f}'.format(
+                    result['benchmark'], key[1], metric, ratio))
+            if ratio > 1+rtol:
+                regressions.append(
+                    (result['benchmark'], result['params'], metric,
+                     baseline_value, value))
+    return regressions
+
+
+def print_benchmark_results(results):
+    if len(results) == 0:
+        print('No results')
+        return
+    keys = list(results[0].keys())
+    print(('{:>24}'*len(keys)).format(*keys))
+    for result in results:
+        print(''.join(['{:>24.4g}'.format(result[key]) for key in keys]))
+
+
+def print_implementation_benchmark_results():
+    print('PCE evaluation (total degree)')
+    print_benchmark_results(benchmark_pce_evaluation(degree=4))
+    print('PCE evaluation (hyperbolic cross)')
+    print_benchmark_results(benchmark_pce_evaluation(
+        degree=8, hcross_strength=0.5))
+    print('Multivariate orthonormal polynomial kernels')
+    print_benchmark_results(benchmark_polynomial_kernels())
+    print('I-optimality criterion')
+    print_benchmark_results(benchmark_optimal_experimental_design_criteria())
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Benchmark the hot paths of pyapprox')
+    parser.add_argument('--benchmarks', nargs='*', default=None,
+                        help='the names of the benchmarks to run')
+    parser.add_argument('--output', default=None,
+                        help='the JSON file used to store the results')
+    parser.add_argument('--compare', default=None,
+                        help='a JSON file of results used as a baseline')
+    parser.add_argument('--rtol', type=float, default=0.2,
+                        help='the relative increase flagged as a regression')
+    parser.add_argument('--nrepeats', type=int, default=3)
+    parser.add_argument('--quick', action='store_true',
+                        help='run each benchmark with small parameters')
+    parser.add_argument('--implementations', action='store_true',
+                        help='compare alternative implementations instead')
+    args = parser.parse_args()
+
+    if args.implementations:
+        print_implementation_benchmark_results()
+    else:
+        results = {'environment': get_benchmark_environment(),
+                   'results': run_performance_benchmarks(
+                       args.benchmarks, args.quick, args.nrepeats)}
+        if args.output is not None:
+            save_performance_benchmark_results(
+                results['results'], args.output)
+        if args.compare is not None:
+            regressions = compare_performance_benchmark_results(
+                load_performance_benchmark_results(args.compare), results,
+                args.rtol)
+            for regression in regressions:
+                print('Regression', regression)
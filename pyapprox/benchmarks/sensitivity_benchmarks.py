@@ -160,12 +160,15 @@ def ishigami_function(samples,a=7,b=0.1):
     return vals[:,np.newaxis]
 
 def ishigami_function_jacobian(samples,a=7,b=0.1):
+    """
+    Return the gradients (nvars,nsamples) of the Ishigami function at
+    each sample.
+    """
     if samples.ndim==1:
         samples = samples[:,np.newaxis]
-    assert samples.shape[1]==1
     nvars=3
     assert samples.shape[0]==nvars
-    jac = np.empty((nvars,1))
+    jac = np.empty((nvars,samples.shape[1]))
     jac[0] = np.cos(samples[0,:]) + b*samples[2,:]**4*np.cos(samples[0,:])
     jac[1] = 2*a*np.sin(samples[1,:])*np.cos(samples[1,:])
     jac[2] = 4*b*samples[2,:]**3*np.sin(samples[0,:])
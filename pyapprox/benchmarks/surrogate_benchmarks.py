@@ -4,7 +4,10 @@ def rosenbrock_function(samples):
     return rosen(samples)[:,np.newaxis]
 
 def rosenbrock_function_jacobian(samples):
-    assert samples.shape[1]==1
+    """
+    Return the gradients (nvars,nsamples) of the Rosenbrock function at
+    each sample.
+    """
     return rosen_der(samples)
 
 def rosenbrock_function_hessian_prod(samples,vec):
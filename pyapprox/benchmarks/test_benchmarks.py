@@ -81,6 +81,86 @@ class TestBenchmarks(unittest.TestCase):
         
         
 
+    def test_genz_function_values_and_gradients(self):
+        from pyapprox.models.genz import GenzFunction
+        np.random.seed(1)
+        nvars = 3
+        c = np.random.uniform(0.5,1.5,nvars)
+        w = np.random.uniform(0.2,0.8,nvars)
+        samples = np.random.uniform(0,1,(nvars,100))
+        mc_samples = np.random.uniform(0,1,(nvars,int(1e6)))
+        for name in ['oscillatory','product-peak','corner-peak',
+                     'gaussian-peak','continuous','discontinuous',
+                     'corner-peak-second-order']:
+            genz = GenzFunction(name,nvars,c=c,w=w)
+            values = genz(samples)
+            grads = genz(samples,{'eval_type':'grad'})
+            assert values.shape==(samples.shape[1],1)
+            assert grads.shape==(samples.shape[1],nvars)
+            assert np.allclose(
+                genz(samples,{'eval_type':'value-grad'}),
+                np.hstack((values,grads)))
+            for ii in range(3):
+                assert np.allclose(
+                    genz.value_(samples[:,ii]),
+                    np.concatenate((values[ii],grads[ii])))
+
+            # compare gradients with centered finite differences
+            eps = 1e-6
+            fd_grads = np.empty_like(grads)
+            for dd in range(nvars):
+                perturbed_samples = samples.copy()
+                perturbed_samples[dd] += eps
+                fd_grads[:,dd] = genz(perturbed_samples)[:,0]
+                perturbed_samples[dd] -= 2*eps
+                fd_grads[:,dd] -= genz(perturbed_samples)[:,0]
+            fd_grads /= 2*eps
+            assert np.allclose(grads,fd_grads,atol=1e-6)
+
+            if name!='gaussian-peak':
+                assert np.allclose(
+                    genz(mc_samples).mean(),genz.integrate(),rtol=1e-2)
+
+        # the benchmark jacobian returns (nvars,nsamples) like the jacobians
+        # of the other benchmarks
+        for name,kwargs in [('genz',{'nvars':nvars,'test_name':'oscillatory'}),
+                            ('ishigami',{'a':7,'b':0.1}),
+                            ('rosenbrock',{'nvars':4})]:
+            benchmark = setup_benchmark(name,**kwargs)
+            jac_samples = np.random.uniform(
+                0,1,(benchmark.variable.num_vars(),10))
+            assert benchmark.jac(jac_samples).shape==jac_samples.shape
+
+    def test_performance_benchmarks(self):
+        import os, tempfile
+        from pyapprox.benchmarks.performance_benchmarks import \
+            run_performance_benchmarks, save_performance_benchmark_results,\
+            load_performance_benchmark_results, \
+            compare_performance_benchmark_results
+        names = ['pce_basis_matrix','sparse_grid_evaluation']
+        results = run_performance_benchmarks(
+            names,quick=True,nrepeats=1,verbose=False)
+        assert [r['benchmark'] for r in results]==names
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir,'benchmarks.json')
+            save_performance_benchmark_results(results,filename)
+            baseline = load_performance_benchmark_results(filename)
+        assert baseline['results']==results
+        assert 'commit' in baseline['environment']
+
+        slower = {'results':[dict(r) for r in results]}
+        slower['results'][0]['metrics'] = dict(
+            results[0]['metrics'],wall_time=results[0]['metrics'][
+                'wall_time']*2)
+        regressions = compare_performance_benchmark_results(
+            baseline,slower,rtol=0.5,verbose=False)
+        assert len(regressions)==1
+        assert regressions[0][:3]==(
+            'pce_basis_matrix',results[0]['params'],'wall_time')
+
+        self.assertRaises(
+            Exception,run_performance_benchmarks,['unknown'],quick=True)
+
 if __name__== "__main__":    
     benchmarks_test_suite = unittest.TestLoader().loadTestsFromTestCase(
          TestBenchmarks)
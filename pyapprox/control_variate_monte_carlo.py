@@ -3,17 +3,16 @@ Functions for estimating expectations using frequentist control-variate Monte-Ca
 """
 import numpy as np, os
 from scipy.optimize import minimize
-try:
-    #use torch to compute gradients for sample allocation optimization
-    import torch
-    use_torch=True
-except:
-    #msg = 'Could not import Torch'
-    #print(msg)
-    use_torch=False
+from importlib.util import find_spec
+from pyapprox.utilities import get_all_sample_combinations, LazyModule
+#use torch to compute gradients for sample allocation optimization.
+#torch is slow to import so only import it when it is first used
+use_torch = find_spec('torch') is not None
+torch = LazyModule('torch')
     
-import copy
-from pyapprox.utilities import get_all_sample_combinations
+import copy, time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+    as_completed
 from functools import partial
 
 def compute_correlations_from_covariance(cov):
@@ -471,6 +470,13 @@ def get_discrepancy_covariances_IS(cov,nsample_ratios,pkg=np):
         high-fidelity model.
     """
     nmodels = cov.shape[0]
+    if pkg==np:
+        ratios = np.asarray(nsample_ratios)
+        fdiag = (ratios-1)/ratios
+        F = np.outer(fdiag,fdiag)
+        np.fill_diagonal(F,fdiag)
+        return cov[1:,1:]*F, fdiag*cov[1:,0]
+
     F = pkg.zeros((nmodels-1, nmodels-1), dtype=pkg.double)
     for ii in range(nmodels-1):
         F[ii, ii]=(nsample_ratios[ii]-1)/nsample_ratios[ii]
@@ -511,6 +517,12 @@ def get_discrepancy_covariances_MF(cov,nsample_ratios,pkg=np):
         high-fidelity model.
     """
     nmodels = cov.shape[0]
+    if pkg==np:
+        ratios = np.asarray(nsample_ratios)
+        rr = np.minimum.outer(ratios,ratios)
+        F = (rr-1)/rr
+        return cov[1:,1:]*F, np.diag(F)*cov[1:,0]
+
     F = pkg.zeros((nmodels-1, nmodels-1), dtype=pkg.double)
     for ii in range(nmodels-1):
         for jj in range(nmodels-1):
@@ -969,6 +981,406 @@ def generate_samples_and_values_mfmc(nhf_samples,nsample_ratios,functions,
 
     return samples,values
 
+def get_control_variate_sample_partitions(nhf_samples,nsample_ratios,
+                                          estimator_type='acvmf',K=None,
+                                          L=None):
+    r"""
+    Get the indices of the samples used by each model of a control variate
+    estimator within a single stream of random samples.
+
+    The samples are those generated by the functions 
+    generate_samples_and_values_mfmc (estimator_type='mfmc' or 'acvmf'),
+    generate_samples_and_values_mlmc ('mlmc'), 
+    generate_samples_and_values_acv_KL ('acvkl') and
+    generate_samples_and_values_acv_IS ('acvis') when the samples are 
+    drawn, in order, from the same stream.
+
+    Parameters
+    ----------
+    nhf_samples : integer
+        The number of samples of the high fidelity model
+
+    nsample_ratios : np.ndarray (nmodels-1)
+        The sample ratios r used to specify the number of samples of the 
+        lower fidelity models, e.g. N_i = r_i*nhf_samples, i=1,...,nmodels-1
+
+    estimator_type : string
+        The type of estimator ['mfmc','acvmf','mlmc','acvkl','acvis']
+
+    K, L : integer
+        The parameters of the ACV-KL estimator. 
+        See generate_samples_and_values_acv_KL
+
+    Returns
+    -------
+    partitions : list (nmodels)
+        Each entry [intervals1,intervals2] contains the lists of intervals 
+        (start,end) of the sample stream used to compute the means of the 
+        values1 and values2 of each model. intervals2 is None for the 
+        high-fidelity model
+
+    nstream_samples : integer
+        The total number of samples in the stream
+    """
+    nsample_ratios = np.asarray(nsample_ratios)
+    nlf_samples = validate_nsample_ratios(nhf_samples,nsample_ratios)
+    nhf_samples = int(nhf_samples)
+    nmodels = nsample_ratios.shape[0]+1
+    partitions = [[[(0,nhf_samples)],None]]
+    if estimator_type in ['mfmc','acvmf']:
+        nprev_samples = nhf_samples
+        for ii in range(1,nmodels):
+            partitions.append([[(0,nprev_samples)],[(0,nlf_samples[ii-1])]])
+            if estimator_type=='mfmc':
+                nprev_samples = nlf_samples[ii-1]
+        nstream_samples = nlf_samples.max()
+    elif estimator_type=='acvkl':
+        assert L<=K+1 and L>=1 and K<nmodels
+        nprev_samples = nhf_samples
+        for ii in range(1,nmodels):
+            partitions.append([[(0,nprev_samples)],[(0,nlf_samples[ii-1])]])
+            if ii<=K-1:
+                nprev_samples = nhf_samples
+            else:
+                nprev_samples = nlf_samples[L-1]
+        nstream_samples = nlf_samples.max()
+    elif estimator_type=='mlmc':
+        prev_interval = (0,nhf_samples)
+        nstream_samples = nhf_samples
+        for ii in range(1,nmodels):
+            nnew_samples = nlf_samples[ii-1]-(
+                prev_interval[1]-prev_interval[0])
+            new_interval = (nstream_samples,nstream_samples+nnew_samples)
+            partitions.append([[prev_interval],[new_interval]])
+            prev_interval = new_interval
+            nstream_samples += nnew_samples
+    elif estimator_type=='acvis':
+        nstream_samples = nhf_samples
+        for ii in range(1,nmodels):
+            nnew_samples = nlf_samples[ii-1]-nhf_samples
+            partitions.append(
+                [[(0,nhf_samples)],
+                 [(0,nhf_samples),
+                  (nstream_samples,nstream_samples+nnew_samples)]])
+            nstream_samples += nnew_samples
+    else:
+        raise Exception(f'estimator_type {estimator_type} not supported')
+    return partitions, int(nstream_samples)
+
+def get_sample_partition_batch_mask(intervals,start,end):
+    r"""
+    Return a boolean mask of the samples in the batch [start,end) of a sample
+    stream that are contained in a list of intervals (start,end).
+    """
+    mask = np.zeros(end-start,dtype=bool)
+    for lb,ub in intervals:
+        lb,ub = max(lb,start),min(ub,end)
+        if lb<ub:
+            mask[lb-start:ub-start]=True
+    return mask
+
+def count_sample_partition_overlap(intervals1,intervals2,end):
+    r"""
+    Count the number of samples in [0,end) of a sample stream shared by
+    two lists of non-overlapping intervals (start,end).
+    """
+    count = 0
+    for lb1,ub1 in intervals1:
+        for lb2,ub2 in intervals2:
+            count += max(0,min(ub1,ub2,end)-max(lb1,lb2))
+    return count
+
+class OnlineCovariance(object):
+    r"""
+    Estimate the mean and covariance of a set of random variables from
+    batches of samples using constant memory.
+
+    Values may be missing (NaN), e.g. when not all models are evaluated at
+    every sample. The covariance between two variables is estimated from
+    the samples at which both variables are observed. The moments of each 
+    batch are merged with the running moments using the pairwise update
+    of Chan, Golub and LeVeque.
+    """
+    def __init__(self,nvars):
+        self.nvars=nvars
+        # entry [i,j] of each array is computed using the samples at which
+        # both variable i and j are observed
+        self.nsamples = np.zeros((nvars,nvars))
+        self.means = np.zeros((nvars,nvars))
+        self.comoments = np.zeros((nvars,nvars))
+        self.shift = None
+
+    def update(self,values):
+        r"""
+        Update the running moments with a batch of samples
+
+        Parameters
+        ----------
+        values : np.ndarray (nbatch_samples,nvars)
+            The values of the variables. Missing values are NaN.
+        """
+        assert values.ndim==2 and values.shape[1]==self.nvars
+        observed = np.isfinite(values)
+        if self.shift is None:
+            # shift all values by the first observed value of each variable
+            # to reduce the round-off error of the batch moments
+            II = np.argmax(observed,axis=0)
+            self.shift = np.where(
+                observed.any(axis=0),values[II,np.arange(self.nvars)],0.)
+        obs = observed.astype(float)
+        vals = np.where(observed,values-self.shift,0.)
+        batch_nsamples = obs.T.dot(obs)
+        batch_means = np.divide(
+            vals.T.dot(obs),batch_nsamples,
+            out=np.zeros_like(batch_nsamples),where=batch_nsamples>0)
+        batch_comoments = vals.T.dot(vals)-(
+            batch_nsamples*batch_means*batch_means.T)
+
+        nsamples = self.nsamples+batch_nsamples
+        ratio = np.divide(batch_nsamples,nsamples,
+                          out=np.zeros_like(nsamples),where=nsamples>0)
+        delta = batch_means-self.means
+        self.comoments += batch_comoments+(
+            delta*delta.T*self.nsamples*ratio)
+        self.means += delta*ratio
+        self.nsamples = nsamples
+
+    def mean(self):
+        r"""
+        Return the mean of each variable. NaN if a variable has not been
+        observed.
+        """
+        means = np.diag(self.means)+self.shift
+        return np.where(np.diag(self.nsamples)>0,means,np.nan)
+
+    def covariance(self):
+        r"""
+        Return the covariance between the variables. Entries are NaN if 
+        two variables have been observed at fewer than two shared samples.
+        """
+        return np.divide(self.comoments,self.nsamples-1,
+                         out=np.full_like(self.comoments,np.nan),
+                         where=self.nsamples>1)
+
+class StreamingControlVariateMeanEstimator(object):
+    r"""
+    Compute a control variate estimate of the mean of a high-fidelity model
+    and its variance from batches of samples using constant memory.
+
+    The samples are consumed, in order, from a single stream of random 
+    samples. Only the running means of the values in each partition
+    of the samples and the running covariance between the models are 
+    stored so that the estimate can be checked at any point of the sampling
+    campaign. Before all the samples have been processed the estimate uses 
+    the partitions truncated to the samples processed so far.
+    """
+    def __init__(self,partitions,weights,cov=None):
+        r"""
+        Parameters
+        ----------
+        partitions : list (nmodels)
+            The intervals of the samples used by each model. See
+            get_control_variate_sample_partitions
+
+        weights : np.ndarray (nmodels-1)
+            The control variate weights
+
+        cov : np.ndarray (nmodels,nmodels)
+            The covariance between the models used to compute the variance
+            of the estimator. If None the covariance is estimated from the
+            values processed so far.
+        """
+        self.partitions=partitions
+        self.nmodels = len(partitions)
+        self.weights = np.asarray(weights)
+        assert self.weights.shape[0]==self.nmodels-1
+        self.cov=cov
+        self.nstream_samples = max(
+            [ub for partition in partitions for intervals in partition
+             if intervals is not None for lb,ub in intervals])
+        self.nprocessed_samples = 0
+        self.partition_means = np.zeros((self.nmodels,2))
+        self.partition_nsamples = np.zeros((self.nmodels,2),dtype=int)
+        self.online_cov = OnlineCovariance(self.nmodels)
+
+    def get_batch_model_indices(self,start,end):
+        r"""
+        Return the indices, relative to start, of the samples in the batch 
+        [start,end) at which each model must be evaluated.
+        """
+        indices = []
+        for partition in self.partitions:
+            mask = np.zeros(end-start,dtype=bool)
+            for intervals in partition:
+                if intervals is not None:
+                    mask |= get_sample_partition_batch_mask(
+                        intervals,start,end)
+            indices.append(np.where(mask)[0])
+        return indices
+
+    def update(self,start,end,model_values):
+        r"""
+        Update the estimator with the values of the models at the batch 
+        [start,end) of the sample stream.
+
+        Parameters
+        ----------
+        model_values : list (nmodels)
+            The values np.ndarray (nbatch_samples_i,1) of each model at the
+            samples with indices get_batch_model_indices(start,end)[i]
+        """
+        if start!=self.nprocessed_samples:
+            raise Exception('Batches must be processed in order')
+        batch_indices = self.get_batch_model_indices(start,end)
+        batch_values = np.full((end-start,self.nmodels),np.nan)
+        for ii in range(self.nmodels):
+            assert model_values[ii].shape==(batch_indices[ii].shape[0],1)
+            batch_values[batch_indices[ii],ii] = model_values[ii][:,0]
+            for jj,intervals in enumerate(self.partitions[ii]):
+                if intervals is None:
+                    continue
+                mask = get_sample_partition_batch_mask(intervals,start,end)
+                nbatch_samples = mask.sum()
+                if nbatch_samples==0:
+                    continue
+                self.partition_nsamples[ii,jj] += nbatch_samples
+                self.partition_means[ii,jj] += (
+                    batch_values[mask,ii].sum()-
+                    nbatch_samples*self.partition_means[ii,jj])/(
+                        self.partition_nsamples[ii,jj])
+        self.online_cov.update(batch_values)
+        self.nprocessed_samples = end
+
+    def get_covariance(self):
+        if self.cov is not None:
+            return self.cov
+        return self.online_cov.covariance()
+
+    def __call__(self):
+        r"""
+        Return the estimate of the mean and its variance using the samples
+        processed so far.
+
+        Returns
+        -------
+        est : float
+            The control variate estimate of the mean
+
+        variance : float
+            The variance of the estimator
+        """
+        if self.partition_nsamples[0,0]==0:
+            raise Exception('No high-fidelity samples have been processed')
+        # the terms (model id, partition id, weight) of the estimator. 
+        # Control variates with an empty partition are ignored
+        terms = [(0,0,1.)]
+        for ii in range(1,self.nmodels):
+            if np.all(self.partition_nsamples[ii]>0):
+                terms += [(ii,0,self.weights[ii-1]),
+                          (ii,1,-self.weights[ii-1])]
+        est = np.sum([w*self.partition_means[ii,jj] for ii,jj,w in terms])
+
+        cov = self.get_covariance()
+        variance = 0.
+        for ii,jj,w1 in terms:
+            for kk,ll,w2 in terms:
+                noverlap = count_sample_partition_overlap(
+                    self.partitions[ii][jj],self.partitions[kk][ll],
+                    self.nprocessed_samples)
+                if noverlap==0:
+                    continue
+                variance += w1*w2*cov[ii,kk]*noverlap/(
+                    self.partition_nsamples[ii,jj]*
+                    self.partition_nsamples[kk,ll])
+        return est, variance
+
+def evaluate_models_at_batch_samples(functions,samples,indices):
+    r"""
+    Evaluate each model at a subset of a batch of samples.
+
+    Parameters
+    ----------
+    functions : list of callables or callable
+        The functions used to evaluate each model or a callable that 
+        evaluates samples with an appended model id, e.g. ModelEnsemble
+
+    samples : np.ndarray (nvars,nbatch_samples)
+        The samples of the batch
+
+    indices : list (nmodels)
+        The indices of the samples at which to evaluate each model
+
+    Returns
+    -------
+    values : list (nmodels)
+        The values np.ndarray (indices[i].shape[0],nqoi) of each model
+    """
+    nmodels = len(indices)
+    if not callable(functions):
+        assert len(functions)==nmodels
+        return [functions[ii](samples[:,I]) if I.shape[0]>0 else
+                np.empty((0,1)) for ii,I in enumerate(indices)]
+
+    # evaluate all models in one call, e.g. so a ModelEnsemble
+    # can evaluate them concurrently
+    samples_with_id = np.hstack(
+        [np.vstack([samples[:,I],ii*np.ones((1,I.shape[0]))])
+         for ii,I in enumerate(indices)])
+    values_flattened = functions(samples_with_id)
+    values, cnt = [], 0
+    for I in indices:
+        values.append(values_flattened[cnt:cnt+I.shape[0]])
+        cnt += I.shape[0]
+    return values
+
+def stream_control_variate_mean_estimate(estimator,functions,
+                                         generate_samples,batch_size,
+                                         callback=None):
+    r"""
+    Compute a control variate estimate of the mean by evaluating the models
+    at batches of samples so the memory used does not grow with the 
+    number of samples.
+
+    Parameters
+    ----------
+    estimator : StreamingControlVariateMeanEstimator
+        The estimator. Sampling resumes from the last sample processed by
+        the estimator
+
+    functions : list of callables or callable
+        The functions used to evaluate each model or a callable that 
+        evaluates samples with an appended model id, e.g. ModelEnsemble
+
+    generate_samples : callable
+        Function used to generate realizations of the random variables with
+        call signature samples = generate_samples(nsamples)
+
+    batch_size : integer
+        The maximum number of samples generated at once
+
+    callback : callable
+        Function called after each batch with signature 
+        callback(estimator), e.g. to monitor the estimate
+
+    Returns
+    -------
+    est : float
+        The control variate estimate of the mean
+
+    variance : float
+        The variance of the estimator
+    """
+    for start in range(estimator.nprocessed_samples,
+                       estimator.nstream_samples,batch_size):
+        end = min(start+batch_size,estimator.nstream_samples)
+        samples = generate_samples(end-start)
+        indices = estimator.get_batch_model_indices(start,end)
+        values = evaluate_models_at_batch_samples(functions,samples,indices)
+        estimator.update(start,end,values)
+        if callback is not None:
+            callback(estimator)
+    return estimator()
+
 def acv_sample_allocation_cost_constraint(ratios, nhf, costs, target_cost):
     cost = nhf*(costs[0] + np.dot(ratios, costs[1:]))
     return target_cost - cost
@@ -1169,22 +1581,67 @@ def allocate_samples_acv(cov, costs, target_cost, estimator,
     log10_variance : float
         The base 10 logarithm of the variance of the estimator
     """
-    initial_guess=get_initial_guess(
-        initial_guess, cov, costs, target_cost)
-    if optim_method=='trust-constr':
-        opt = solve_allocate_samples_acv_trust_region_optimization(
-            estimator,costs,target_cost,initial_guess,optim_options)
-    else:
-        opt = solve_allocate_samples_acv_slsqp_optimization(
-            estimator,costs,target_cost,initial_guess,optim_options)
-    nhf_samples, nsample_ratios = opt.x[0], opt.x[1:]
+    return allocate_samples_acv_sweep(
+        cov, costs, [target_cost], estimator, standardize, initial_guess,
+        optim_options, optim_method)[0]
 
-    if standardize:
-        nhf_samples, nsample_ratios = standardize_sample_ratios(
-            nhf_samples, nsample_ratios)
-    var = estimator.get_variance(nhf_samples,nsample_ratios)
-    log10_var = np.log10(var.item())
-    return nhf_samples, nsample_ratios, log10_var
+def allocate_samples_acv_sweep(cov, costs, target_costs, estimator,
+                               standardize=True, initial_guess=None,
+                               optim_options=None, optim_method='SLSQP'):
+    r"""
+    Determine the samples to be allocated to each model for a set of 
+    target costs.
+
+    The target costs are solved in increasing order. Each optimization is
+    started from the solution for the previous target cost with the number
+    of high-fidelity samples scaled by the ratio of the target costs. 
+    Unless the lower bounds on the number of samples are active the optimal 
+    sample ratios do not depend on the target cost, so these solves
+    converge in very few iterations.
+
+    Parameters
+    ----------
+    target_costs : iterable (ntarget_costs)
+        The total cost budgets
+
+    initial_guess : np.ndarray (nmodels)
+        The initial guess of the optimization for the smallest target cost.
+        If None use the MFMC sample allocation
+
+    See allocate_samples_acv for the remaining parameters
+
+    Returns
+    -------
+    results : list (ntarget_costs)
+        The tuples (nhf_samples, nsample_ratios, log10_variance) 
+        returned by allocate_samples_acv for each target cost
+    """
+    target_costs = np.asarray(target_costs)
+    results = [None for ii in range(target_costs.shape[0])]
+    prev_x, prev_target_cost = None, None
+    for ii in np.argsort(target_costs):
+        target_cost = target_costs[ii]
+        if prev_x is not None:
+            initial_guess = prev_x.copy()
+            initial_guess[0] *= target_cost/prev_target_cost
+        initial_guess=get_initial_guess(
+            initial_guess, cov, costs, target_cost)
+        if optim_method=='trust-constr':
+            opt = solve_allocate_samples_acv_trust_region_optimization(
+                estimator,costs,target_cost,initial_guess,optim_options)
+        else:
+            opt = solve_allocate_samples_acv_slsqp_optimization(
+                estimator,costs,target_cost,initial_guess,optim_options)
+        prev_x, prev_target_cost = opt.x, target_cost
+        nhf_samples, nsample_ratios = opt.x[0], opt.x[1:]
+
+        if standardize:
+            nhf_samples, nsample_ratios = standardize_sample_ratios(
+                nhf_samples, nsample_ratios)
+        var = estimator.get_variance(nhf_samples,nsample_ratios)
+        log10_var = np.log10(var.item())
+        results[ii] = (nhf_samples, nsample_ratios, log10_var)
+    return results
 
 def get_rsquared_acv_KL_best(cov, nsample_ratios):
     r""" 
@@ -1209,42 +1666,178 @@ def get_rsquared_acv_KL_best(cov, nsample_ratios):
 def allocate_samples_acv_best_kl(cov,costs,target_cost,standardize=True,
                                  initial_guess=None,optim_options=None,
                                  optim_method='SLSQP'):
+    return allocate_samples_acv_best_kl_sweep(
+        cov,costs,[target_cost],standardize,initial_guess,optim_options,
+        optim_method)[0][:3]
+
+def get_acv_kl_estimators(cov,costs,target_cost=None):
+    r"""
+    Return the ACVMFKL estimators for all valid combinations of K and L
+    ordered by K then L.
+    """
     nmodels = len(costs)
-    sol, KL, opt_log10_var = None, None, np.inf
+    return [ACVMFKL(cov,costs,target_cost,K,L)
+            for K in range(1,nmodels) for L in range(1,K+1)]
 
-    for K in range(1,nmodels):
-        for L in range(1, K+1):
-            estimator = ACVMFKL(cov, costs,target_cost, K, L)
-            nhf_samples, nsample_ratios, log10_var = allocate_samples_acv(
-                cov, costs, target_cost, estimator,standardize,
-                initial_guess,optim_options,optim_method)
-            #print("K, L = ", K, L)
-            #print("\t ", log10_var)
-            if log10_var < opt_log10_var:
-                opt_log10_var = log10_var
-                sol = (nhf_samples, nsample_ratios)
-                KL  = (K, L)
-
-    return sol[0], sol[1], opt_log10_var
+def allocate_samples_sweep_pool_wrapper(target_costs,estimator,kwargs):
+    r"""
+    Create interface that can be pickled and used with multiprocessing pool
+    """
+    return estimator.allocate_samples_sweep(target_costs,**kwargs)
+
+def allocate_samples_estimators_sweep(estimators,target_costs,
+                                      max_eval_concurrency=1,**kwargs):
+    r"""
+    Determine the samples to be allocated to each model of a set of 
+    estimators for a set of target costs.
+
+    Parameters
+    ----------
+    estimators : list
+        The estimators, e.g. ACVMF, MFMC, MLMC
+
+    target_costs : iterable (ntarget_costs)
+        The total cost budgets
+
+    max_eval_concurrency : integer
+        The number of processes used to allocate the samples of the 
+        estimators concurrently
+
+    kwargs : dict
+        Options passed to the allocate_samples_sweep method of each estimator
+
+    Returns
+    -------
+    results : list (nestimators)
+        The output of allocate_samples_sweep for each estimator
+    """
+    func = partial(allocate_samples_sweep_pool_wrapper,target_costs,
+                   kwargs=kwargs)
+    if max_eval_concurrency>1:
+        from multiprocessing import Pool
+        with Pool(max_eval_concurrency) as pool:
+            return pool.map(func,estimators)
+    return [func(est) for est in estimators]
+
+def allocate_samples_acv_best_kl_sweep(cov,costs,target_costs,
+                                       standardize=True,initial_guess=None,
+                                       optim_options=None,
+                                       optim_method='SLSQP',
+                                       max_eval_concurrency=1):
+    r"""
+    Determine the samples to be allocated to each model of the best ACVMFKL
+    estimator for a set of target costs.
+
+    The samples of the estimators for all combinations of K and L are 
+    allocated for all target costs with allocate_samples_acv_sweep, 
+    optionally in parallel.
+
+    Returns
+    -------
+    results : list (ntarget_costs)
+        The tuples (nhf_samples, nsample_ratios, log10_variance, (K,L)) 
+        of the best estimator for each target cost
+    """
+    estimators = get_acv_kl_estimators(cov,costs)
+    if initial_guess is None:
+        # share the initial guess between estimators
+        initial_guess = get_initial_guess(
+            initial_guess,cov,costs,np.min(target_costs))
+    estimator_results = allocate_samples_estimators_sweep(
+        estimators,target_costs,max_eval_concurrency,
+        standardize=standardize,initial_guess=initial_guess,
+        optim_options=optim_options,optim_method=optim_method)
+    results = []
+    for ii in range(len(target_costs)):
+        # use the first estimator attaining the minimum variance
+        jj = np.argmin([res[ii][2] for res in estimator_results])
+        results.append(
+            estimator_results[jj][ii]+((estimators[jj].K,estimators[jj].L),))
+    return results
 
 class ModelEnsemble(object):
     r"""
     Wrapper class to allow easy one-dimensional 
     indexing of models in an ensemble.
     """
-    def __init__(self,functions,names=None):
+    def __init__(self,functions,names=None,max_eval_concurrency=1,
+                 costs=None,pool_type='thread'):
         r"""
         Parameters
         ----------
         functions : list of callable
             A list of functions defining the model ensemble. The functions must
             have the call signature values=function(samples)
+
+        max_eval_concurrency : integer
+            The maximum number of groups of samples evaluated at once.
+            If greater than one, the samples of different models, and
+            subsets of the samples of expensive models, are evaluated 
+            concurrently
+
+        costs : np.ndarray (nmodels)
+            The relative cost of evaluating each model at one sample, e.g.
+            the costs used to allocate samples to ACV estimators. Used to 
+            balance work when max_eval_concurrency is greater than one.
+            If None all models are assumed to have the same cost.
+
+        pool_type : string
+            The type of pool used to evaluate the models concurrently.
+            'thread' - use a thread pool. Best when the functions release 
+            the GIL, e.g. call external codes or use compiled kernels
+            'process' - use a process pool. The functions must be picklable
         """
         self.functions=functions
         self.nmodels = len(self.functions)
         if names is None:
             names = ['f%d'%ii for ii in range(self.nmodels)]
         self.names=names
+        self.max_eval_concurrency=max_eval_concurrency
+        if costs is None:
+            costs = np.ones(self.nmodels)
+        self.costs = np.asarray(costs,dtype=float)
+        assert self.costs.shape[0]==self.nmodels
+        if pool_type not in ['thread','process']:
+            raise Exception("pool_type must be ['thread','process']")
+        self.pool_type=pool_type
+
+    def get_work_groups(self,model_ids):
+        r"""
+        Group the samples by the model used to evaluate them.
+
+        When max_eval_concurrency is greater than one, groups costing more 
+        than an equal share of the total cost are split so that the work
+        can be balanced, and the groups are ordered by decreasing cost so
+        that the most expensive groups are started first.
+
+        Parameters
+        ----------
+        model_ids : np.ndarray (nsamples)
+            The id of the model used to evaluate each sample
+
+        Returns
+        -------
+        groups : list
+            The tuples (model_id, sample_indices) of each group
+        """
+        active_model_ids = np.unique(model_ids).astype(int)
+        groups = [(model_id, np.where(model_ids==model_id)[0])
+                  for model_id in active_model_ids]
+        if self.max_eval_concurrency==1:
+            return groups
+
+        group_costs = [self.costs[model_id]*I.shape[0]
+                       for model_id,I in groups]
+        target_cost = np.sum(group_costs)/self.max_eval_concurrency
+        split_groups = []
+        for (model_id,I),cost in zip(groups,group_costs):
+            nsplits = min(I.shape[0],max(1,int(np.ceil(cost/target_cost))))
+            split_groups += [(model_id,J) for J in np.array_split(I,nsplits)]
+        split_group_costs = [self.costs[model_id]*I.shape[0]
+                             for model_id,I in split_groups]
+        # use stable sort so groups with equal cost remain ordered by model id
+        II = np.argsort(-np.asarray(split_group_costs),kind='stable')
+        return [split_groups[ii] for ii in II]
     
     def __call__(self,samples):
         r"""
@@ -1264,18 +1857,35 @@ class ModelEnsemble(object):
         model_ids = samples[-1,:]
         #print(model_ids.max(),self.nmodels)
         assert model_ids.max()<self.nmodels
-        active_model_ids = np.unique(model_ids).astype(int)
-        active_model_id=active_model_ids[0]
-        I = np.where(model_ids==active_model_id)[0]
-        values_0 = self.functions[active_model_id](samples[:-1,I])
-        assert values_0.ndim==2
-        nqoi = values_0.shape[1]
-        values = np.empty((samples.shape[1],nqoi))
-        values[I,:]=values_0
-        for ii in range(1,active_model_ids.shape[0]):
-            active_model_id=active_model_ids[ii]
-            I = np.where(model_ids==active_model_id)[0]
-            values[I] = self.functions[active_model_id](samples[:-1,I])
+        groups = self.get_work_groups(model_ids)
+        nsamples = samples.shape[1]
+        values = None
+        if self.max_eval_concurrency==1:
+            for model_id,I in groups:
+                values = self.set_group_values(
+                    values,nsamples,I,self.functions[model_id](samples[:-1,I]))
+            return values
+
+        if self.pool_type=='thread':
+            pool_cls = ThreadPoolExecutor
+        else:
+            pool_cls = ProcessPoolExecutor
+        with pool_cls(self.max_eval_concurrency) as pool:
+            futures = dict()
+            for model_id,I in groups:
+                future = pool.submit(self.functions[model_id],samples[:-1,I])
+                futures[future]=I
+            # store the values of each group as soon as it finishes
+            for future in as_completed(futures):
+                values = self.set_group_values(
+                    values,nsamples,futures[future],future.result())
+        return values
+
+    def set_group_values(self,values,nsamples,I,group_values):
+        assert group_values.ndim==2
+        if values is None:
+            values = np.empty((nsamples,group_values.shape[1]))
+        values[I] = group_values
         return values
 
 def estimate_model_ensemble_covariance(npilot_samples,generate_samples,
@@ -1323,6 +1933,30 @@ def estimate_model_ensemble_covariance(npilot_samples,generate_samples,
     cov = np.cov(pilot_values,rowvar=False)
     return cov, pilot_random_samples, pilot_values
 
+def estimate_model_ensemble_covariance_online(npilot_samples,generate_samples,
+                                              model_ensemble,batch_size):
+    r"""
+    Estimate the covariance of a model ensemble from a set of pilot samples
+    evaluated in batches so the pilot samples and values are not stored.
+
+    See estimate_model_ensemble_covariance
+
+    Returns
+    -------
+    cov : np.ndarray (nqoi,nqoi)
+        The covariance between the model qoi
+    """
+    config_vars = np.arange(model_ensemble.nmodels)[np.newaxis,:]
+    online_cov = OnlineCovariance(model_ensemble.nmodels)
+    for start in range(0,npilot_samples,batch_size):
+        nbatch_samples = min(batch_size,npilot_samples-start)
+        batch_samples = get_all_sample_combinations(
+            generate_samples(nbatch_samples),config_vars)
+        batch_values = model_ensemble(batch_samples)
+        online_cov.update(np.reshape(
+            batch_values,(nbatch_samples,model_ensemble.nmodels)))
+    return online_cov.covariance()
+
 class ACVMF(object):
     def __init__(self,cov,costs):
         self.cov=cov
@@ -1376,6 +2010,10 @@ class ACVMF(object):
         return allocate_samples_acv(self.cov, self.costs, target_cost, self,
                                     **kwargs)
 
+    def allocate_samples_sweep(self,target_costs,**kwargs):
+        return allocate_samples_acv_sweep(
+            self.cov, self.costs, target_costs, self, **kwargs)
+
     def get_nsamples(self,nhf_samples,nsample_ratios):
         return np.concatenate([[nhf_samples],nsample_ratios*nhf_samples])
 
@@ -1398,6 +2036,21 @@ class ACVMF(object):
     def __call__(self,values):
         eta = get_mfmc_control_variate_weights(self.get_covariance())
         return compute_approximate_control_variate_mean_estimate(eta,values)
+
+    def stream_estimate(self,nhf_samples,nsample_ratios,generate_samples,
+                        model_ensemble,batch_size,callback=None):
+        r"""
+        Compute the estimate of the mean and its variance from the
+        samples generated by generate_data, consuming them in batches.
+        See stream_control_variate_mean_estimate
+        """
+        partitions = get_control_variate_sample_partitions(
+            nhf_samples,nsample_ratios,'acvmf')[0]
+        cov = self.get_covariance()
+        eta = get_mfmc_control_variate_weights(cov)
+        estimator = StreamingControlVariateMeanEstimator(partitions,eta,cov)
+        return stream_control_variate_mean_estimate(
+            estimator,model_ensemble,generate_samples,batch_size,callback)
     
         
 
@@ -1412,6 +2065,10 @@ class MC(object):
     def allocate_samples(self,target_cost):
         return np.floor(target_cost/self.costs[0]),None,None
 
+    def allocate_samples_sweep(self,target_costs,**kwargs):
+        return [self.allocate_samples(target_cost)
+                for target_cost in target_costs]
+
     def get_nsamples(self,nhf_samples,nsample_ratios):
         return np.concatenate([[nhf_samples],np.zeros(self.cov.shape[0]-1)])
 
@@ -1454,6 +2111,10 @@ class ACVMFKLBest(ACVMF):
             initial_guess=None,optim_options=None,
             optim_method='SLSQP')
 
+    def allocate_samples_sweep(self,target_costs,**kwargs):
+        return [result[:3] for result in allocate_samples_acv_best_kl_sweep(
+            self.cov,self.costs,target_costs,**kwargs)]
+
 
 class MFMC(ACVMF):
     def __init__(self,cov,costs):
@@ -1467,6 +2128,10 @@ class MFMC(ACVMF):
         return allocate_samples_mfmc(
             self.get_covariance(), self.costs, target_cost)
 
+    def allocate_samples_sweep(self,target_costs,**kwargs):
+        return [self.allocate_samples(target_cost)
+                for target_cost in target_costs]
+
 
 class MLMC(ACVMF):
     def use_lagrange_formulation(self,flag):
@@ -1498,6 +2163,10 @@ class MLMC(ACVMF):
     def allocate_samples(self,target_cost):
         return allocate_samples_mlmc(self.cov, self.costs, target_cost)
 
+    def allocate_samples_sweep(self,target_costs,**kwargs):
+        return [self.allocate_samples(target_cost)
+                for target_cost in target_costs]
+
 def compute_single_fidelity_and_approximate_control_variate_mean_estimates(
         nhf_samples,nsample_ratios,
         model_ensemble,generate_samples,
@@ -1681,6 +2350,192 @@ def get_pilot_covariance(nmodels,variable,model_ensemble,npilot_samples):
     cov_matrix = np.cov(pilot_values,rowvar=False)
     return cov_matrix,pilot_samples,pilot_values
 
+def get_bootstrap_blocks(partitions):
+    r"""
+    Split a sample stream into the blocks of samples that are shared by the 
+    same partitions of a control variate estimator and find the rows of the 
+    values of each partition that correspond to each block.
+
+    Parameters
+    ----------
+    partitions : list (nmodels)
+        The intervals of the samples used by each model. See
+        get_control_variate_sample_partitions
+
+    Returns
+    -------
+    blocks : np.ndarray (nblocks,2)
+        The intervals (start,end) of each block
+
+    partition_blocks : list (nmodels)
+        Each entry [blocks1,blocks2] contains the list of tuples 
+        (block id, row of the first sample of the block) of the values1 and 
+        values2 of each model. blocks2 is None for the high-fidelity model
+    """
+    bounds = np.unique([bound for partition in partitions
+                        for intervals in partition if intervals is not None
+                        for interval in intervals for bound in interval])
+    blocks = np.array([bounds[:-1],bounds[1:]]).T
+    partition_blocks = []
+    for partition in partitions:
+        partition_blocks.append([])
+        for intervals in partition:
+            if intervals is None:
+                partition_blocks[-1].append(None)
+                continue
+            row, blocks_jj = 0, []
+            for lb,ub in intervals:
+                for kk in np.where((blocks[:,0]>=lb)&(blocks[:,1]<=ub))[0]:
+                    blocks_jj.append((kk,row))
+                    row += blocks[kk,1]-blocks[kk,0]
+            partition_blocks[-1].append(blocks_jj)
+    return blocks, partition_blocks
+
+def bootstrap_control_variate_estimates(values,weights,partitions,
+                                        nbootstraps,seed=None):
+    r"""
+    Compute bootstrap realizations of a control variate estimate of the mean.
+
+    The samples in each block of the sample stream (see get_bootstrap_blocks)
+    are resampled with replacement so that samples shared by the
+    partitions of different models remain shared. The number of times each
+    sample is drawn by each bootstrap, i.e. a multinomial count, is 
+    stored so that the estimates of all bootstraps are computed with 
+    matrix products.
+
+    Parameters
+    ----------
+    values : list (nmodels)
+        The values of each model ordered as the output of 
+        generate_samples_and_values_mfmc
+
+    weights : np.ndarray (nmodels-1)
+        The control variate weights
+
+    partitions : list (nmodels)
+        The intervals of the samples used by each model. See
+        get_control_variate_sample_partitions
+
+    nbootstraps : integer
+        The number of bootstraps
+
+    seed : integer
+        The seed of the random number generator used to draw the resamples
+
+    Returns
+    -------
+    estimates : np.ndarray (nbootstraps)
+        The bootstrap estimates of the mean
+    """
+    random_state = np.random.default_rng(seed)
+    blocks, partition_blocks = get_bootstrap_blocks(partitions)
+    # the partitions (model id, partition id, row) containing each block
+    block_partitions = [[] for kk in range(blocks.shape[0])]
+    for ii in range(len(values)):
+        for jj,blocks_jj in enumerate(partition_blocks[ii]):
+            if blocks_jj is not None:
+                for kk,row in blocks_jj:
+                    block_partitions[kk].append((ii,jj,row))
+
+    sums = np.zeros((len(values),2,nbootstraps))
+    for kk,(lb,ub) in enumerate(blocks):
+        nblock_samples = ub-lb
+        indices = random_state.integers(
+            0,nblock_samples,(nbootstraps,nblock_samples))
+        # count the number of times each sample is drawn by each bootstrap
+        indices += nblock_samples*np.arange(nbootstraps)[:,np.newaxis]
+        counts = np.bincount(
+            indices.ravel(),minlength=nbootstraps*nblock_samples).reshape(
+                nbootstraps,nblock_samples)
+        block_values = np.array(
+            [values[ii][jj][row:row+nblock_samples].squeeze(axis=-1)
+             if values[ii][jj].ndim==2 else
+             values[ii][jj][row:row+nblock_samples]
+             for ii,jj,row in block_partitions[kk]]).T
+        # the resampled sums of all partitions sharing the block are
+        # computed with one matrix product
+        block_sums = counts.dot(block_values)
+        for ll,(ii,jj,row) in enumerate(block_partitions[kk]):
+            sums[ii,jj] += block_sums[:,ll]
+
+    estimates = sums[0,0]/values[0][0].shape[0]
+    for ii in range(1,len(values)):
+        estimates += weights[ii-1]*(
+            sums[ii,0]/values[ii][0].shape[0]-
+            sums[ii,1]/values[ii][1].shape[0])
+    return estimates
+
+def bootstrap_control_variate_estimator(values,weights,partitions,
+                                        nbootstraps=10,verbose=True,
+                                        max_chunk_size=int(1e7),
+                                        max_eval_concurrency=1):
+    r"""
+    Approximate the mean and variance of a control variate estimator of
+    the mean using bootstrapping.
+
+    Parameters
+    ----------
+    values : list (nmodels)
+        The values of each model ordered as the output of 
+        generate_samples_and_values_mfmc
+
+    weights : np.ndarray (nmodels-1)
+        The control variate weights
+
+    partitions : list (nmodels)
+        The intervals of the samples used by each model. See
+        get_control_variate_sample_partitions
+
+    nbootstraps : integer
+        The number of boostraps used to compute estimator variance
+
+    verbose : boolean
+        If True print the estimator mean, +/- 2 standard deviation interval
+        and the number of bootstraps computed per second
+
+    max_chunk_size : integer
+        The maximum number of resample counts stored at once by each 
+        process. The bootstraps are computed in chunks of 
+        max_chunk_size/nsamples bootstraps
+
+    max_eval_concurrency : integer
+        The number of processes used to compute the chunks of bootstraps
+
+    Returns
+    -------
+    bootstrap_mean : float
+        The bootstrap estimate of the estimator mean
+
+    bootstrap_variance : float
+        The bootstrap estimate of the estimator variance
+    """
+    nstream_samples = get_bootstrap_blocks(partitions)[0][-1,1]
+    chunk_size = max(1,min(nbootstraps,max_chunk_size//nstream_samples))
+    chunk_sizes = [chunk_size]*(nbootstraps//chunk_size)
+    if nbootstraps%chunk_size>0:
+        chunk_sizes.append(nbootstraps%chunk_size)
+    # seed each chunk so the results do not depend on the number of processes
+    seeds = np.random.randint(0,np.iinfo(np.int32).max,len(chunk_sizes))
+    func = partial(bootstrap_control_variate_estimates,values,weights,
+                   partitions)
+
+    t0 = time.time()
+    if max_eval_concurrency>1:
+        from multiprocessing import Pool
+        with Pool(max_eval_concurrency) as pool:
+            estimates = pool.starmap(func,zip(chunk_sizes,seeds))
+    else:
+        estimates = [func(nn,seed) for nn,seed in zip(chunk_sizes,seeds)]
+    estimates = np.concatenate(estimates)
+    bootstrap_mean = estimates.mean()
+    bootstrap_variance = np.var(estimates)
+    if verbose:
+        print('No. samples', nstream_samples)
+        print('Mean',bootstrap_mean)
+        print('Mean +/- 2 sigma', [bootstrap_mean-2*np.sqrt(bootstrap_variance),bootstrap_mean+2*np.sqrt(bootstrap_variance)])
+        print('Bootstraps per second',nbootstraps/(time.time()-t0))
+    return bootstrap_mean, bootstrap_variance
+
 def bootstrap_monte_carlo_estimator(values,nbootstraps=10,verbose=True):
     """
     Approxiamte the variance of the Monte Carlo estimate of the mean using 
@@ -1708,20 +2563,13 @@ def bootstrap_monte_carlo_estimator(values,nbootstraps=10,verbose=True):
     values = values.squeeze()
     assert values.ndim==1
     nsamples = values.shape[0]
-    bootstrap_values = np.random.choice(
-        values,size=(nsamples,nbootstraps),replace=True)
-    bootstrap_means = bootstrap_values.mean(axis=0)
-    bootstrap_mean = bootstrap_means.mean()
-    bootstrap_variance = np.var(bootstrap_means)
-    if verbose:
-        print('No. samples', values.shape[0])
-        print('Mean',bootstrap_mean)
-        print('Mean +/- 2 sigma', [bootstrap_mean-2*np.sqrt(bootstrap_variance),bootstrap_mean+2*np.sqrt(bootstrap_variance)])
-
-    return bootstrap_mean, bootstrap_variance
+    return bootstrap_control_variate_estimator(
+        [[values[:,np.newaxis],None]],[],[[[(0,nsamples)],None]],
+        nbootstraps,verbose)
 
 def bootstrap_mfmc_estimator(values,weights,nbootstraps=10,
-                             verbose=True,acv_modification=True):
+                             verbose=True,acv_modification=True,
+                             max_chunk_size=int(1e7),max_eval_concurrency=1):
     r"""
     Boostrap the approximate MFMC estimate of the mean of 
     high-fidelity data with low-fidelity models with unknown means
@@ -1750,6 +2598,17 @@ def bootstrap_mfmc_estimator(values,weights,nbootstraps=10,
     verbose:
         If True print the estimator mean and +/- 2 standard deviation interval
 
+    acv_modification : boolean
+        True if the values were generated by 
+        generate_samples_and_values_mfmc with acv_modification=True
+
+    max_chunk_size : integer
+        The maximum number of resample counts stored at once by each 
+        process. See bootstrap_control_variate_estimator
+
+    max_eval_concurrency : integer
+        The number of processes used to compute the bootstraps
+
     Returns
     -------
     bootstrap_mean : float
@@ -1758,36 +2617,20 @@ def bootstrap_mfmc_estimator(values,weights,nbootstraps=10,
     bootstrap_variance : float
         The bootstrap estimate of the estimator variance
     """
-    assert acv_modification
-    nmodels = len(values)
-    assert len(values)==nmodels
-    # high fidelity monte carlo estimate of mean
-    bootstrap_means = []
-    for jj in range(nbootstraps):
-        vals = values[0][0]; nhf_samples=vals.shape[0]
-        I1 = np.random.choice(
-            np.arange(nhf_samples),size=(nhf_samples),replace=True)
-        est = vals[I1].mean()
-        nprev_samples=nhf_samples
-        for ii in range(nmodels-1):
-            vals1 = values[ii+1][0]; nsamples1=vals1.shape[0]
-            vals2 = values[ii+1][1]; nsamples2=vals2.shape[0]
-            assert nsamples1==nhf_samples
-            I2 = np.random.choice(
-                np.arange(nhf_samples,nsamples2),size=(nsamples2-nhf_samples),
-                replace=True)
-            #maks sure same shared samples are still used.
-            vals2_boot = np.vstack([vals2[I1],vals2[I2]])
-            est += weights[ii]*(vals1[I1].mean()-vals2_boot.mean())
-            if acv_modification:
-                nprev_samples = nhf_samples
-            else:
-                nprev_samples=nsamples2
-        bootstrap_means.append(est)
-    bootstrap_means = np.array(bootstrap_means)
-    bootstrap_mean = np.mean(bootstrap_means)
-    bootstrap_variance = np.var(bootstrap_means)
-    return bootstrap_mean, bootstrap_variance
+    nhf_samples = values[0][0].shape[0]
+    nsample_ratios = np.array(
+        [v[1].shape[0] for v in values[1:]])/nhf_samples
+    if acv_modification:
+        estimator_type = 'acvmf'
+    else:
+        estimator_type = 'mfmc'
+    partitions = get_control_variate_sample_partitions(
+        nhf_samples,nsample_ratios,estimator_type)[0]
+    for ii in range(1,len(values)):
+        assert values[ii][0].shape[0]==partitions[ii][0][0][1]
+    return bootstrap_control_variate_estimator(
+        values,weights,partitions,nbootstraps,verbose,max_chunk_size,
+        max_eval_concurrency)
 
 def compute_covariance_from_control_variate_samples(values):
     r"""
@@ -1820,12 +2663,15 @@ def compute_covariance_from_control_variate_samples(values):
     #print(cov,'\n',cov_matrix)
     return cov
 
-def compare_estimator_variances(target_costs,estimators,cov_matrix,model_costs):
+def compare_estimator_variances(target_costs,estimators,cov_matrix,model_costs,
+                                max_eval_concurrency=1):
+    ests = [estimator(cov_matrix,model_costs) for estimator in estimators]
+    results = allocate_samples_estimators_sweep(
+        ests,target_costs,max_eval_concurrency)
     variances, nsamples_history = [],[]
-    for target_cost in target_costs:
-        for estimator in estimators:
-            est = estimator(cov_matrix,model_costs)
-            nhf_samples,nsample_ratios = est.allocate_samples(target_cost)[:2]
+    for ii in range(len(target_costs)):
+        for est,result in zip(ests,results):
+            nhf_samples,nsample_ratios = result[ii][:2]
             variances.append(est.get_variance(nhf_samples,nsample_ratios))
             nsamples_history.append(
                 est.get_nsamples(nhf_samples,nsample_ratios))
@@ -2,11 +2,10 @@
 import numpy as np
 import copy
 from scipy.optimize import minimize, Bounds
-import matplotlib.pyplot as plt
 from sklearn.gaussian_process import GaussianProcessRegressor
 from sklearn.gaussian_process.kernels import Matern, RBF, Product, Sum, \
     ConstantKernel
-from pyapprox import get_polynomial_from_variable, \
+from pyapprox.multivariate_polynomials import get_polynomial_from_variable, \
     get_univariate_quadrature_rules_from_variable
 from pyapprox.utilities import cartesian_product, outer_product, \
     cholesky_solve_linear_system, update_cholesky_factorization
@@ -541,6 +540,59 @@ def generate_candidate_samples(nvars, num_candidate_samples,
     return candidate_samples
 
 
+class LazyKernelMatrix(object):
+    """
+    A kernel matrix :math:`K(X, X)` whose columns are only computed when
+    requested. Use with :func:`pyapprox.utilities.pivoted_cholesky_decomposition`
+    to avoid storing the entire matrix.
+
+    Parameters
+    ----------
+    kernel : callable
+        Function with signature
+
+        ``K(X, Y) -> np.ndarray(X.shape[0], Y.shape[0])``
+
+        and function ``K.diag(X) -> np.ndarray(X.shape[0])``,
+        e.g. a sklearn kernel, where X and Y are samples with shape
+        (nsamples_X, nvars) and (nsamples_Y, nvars).
+
+    samples : np.ndarray (nvars, nsamples)
+        The samples X
+
+    nugget : float
+        A constant added to the diagonal of the matrix
+
+    cache_columns : boolean
+        True - store the columns computed so they are only computed once
+        False - recompute columns each time they are requested
+    """
+    def __init__(self, kernel, samples, nugget=0, cache_columns=False):
+        self.kernel = kernel
+        self.samples = samples
+        self.nugget = nugget
+        self.cache_columns = cache_columns
+        self.shape = (samples.shape[1], samples.shape[1])
+        self.columns = dict()
+
+    def diagonal(self):
+        return self.kernel.diag(self.samples.T)+self.nugget
+
+    def column(self, index):
+        if index in self.columns:
+            return self.columns[index]
+        column = self.kernel(
+            self.samples.T, self.samples[:, index:index+1].T)[:, 0]
+        column[index] += self.nugget
+        if self.cache_columns:
+            self.columns[index] = column
+        return column
+
+    def __getitem__(self, key):
+        rows, index = key
+        return self.column(index)[rows]
+
+
 class CholeskySampler(object):
     """
     Compute samples for kernel based approximation using the power-function
@@ -584,10 +636,22 @@ class CholeskySampler(object):
     econ : boolean
         True - pivot based upon diagonal of schur complement
         False - pivot to minimize trace norm of low-rank approximation
+
+    lazy_kernel_matrix : boolean
+        True - only compute the columns of the kernel matrix of the candidate
+        samples needed by the pivoted Cholesky factorization. Memory and 
+        cost are then proportional to num_candidate_samples times the number
+        of samples generated. Only supported when econ is True.
+        False - compute and store the entire kernel matrix
+
+    cache_kernel_columns : boolean
+        True - store the kernel matrix columns computed when 
+        lazy_kernel_matrix is True
     """
     def __init__(self, num_vars, num_candidate_samples, variables=None,
                  generate_random_samples=None, init_pivots=None,
-                 nugget=0, econ=True):
+                 nugget=0, econ=True, lazy_kernel_matrix=False,
+                 cache_kernel_columns=False):
         self.nvars = num_vars
         self.kernel_theta = None
         self.chol_flag = None
@@ -601,6 +665,10 @@ class CholeskySampler(object):
         self.set_init_pivots(init_pivots)
         self.nugget = nugget
         self.econ = econ
+        if lazy_kernel_matrix and not econ:
+            raise Exception('lazy_kernel_matrix requires econ=True')
+        self.lazy_kernel_matrix = lazy_kernel_matrix
+        self.cache_kernel_columns = cache_kernel_columns
         
     def add_nugget(self):
         self.Kmatrix[np.arange(self.Kmatrix.shape[0]),
@@ -643,14 +711,19 @@ class CholeskySampler(object):
         
         if (self.weight_function_changed or self.kernel_changed or
             self.init_pivots_changed):
-            self.Kmatrix = self.kernel(self.candidate_samples.T)
+            if self.lazy_kernel_matrix:
+                self.Kmatrix = LazyKernelMatrix(
+                    self.kernel, self.candidate_samples, self.nugget,
+                    self.cache_kernel_columns)
+            else:
+                self.Kmatrix = self.kernel(self.candidate_samples.T)
             if self.econ is False and self.pivot_weights is not None:
                 weights = np.sqrt(self.pivot_weights)
-                assert np.allclose(np.diag(weights).dot(self.Kmatrix.dot(np.diag(weights))), weights[:, np.newaxis]*self.Kmatrix*weights)
-                self.Kmatrix = weights[:, np.newaxis]*self.Kmatrix*weights
+                self.Kmatrix *= weights[:, np.newaxis]
+                self.Kmatrix *= weights
                 self.pivot_weights = None
                     
-            if self.nugget > 0:
+            if self.nugget > 0 and not self.lazy_kernel_matrix:
                 self.add_nugget()
             self.L, self.pivots, error, self.chol_flag, self.diag, \
                 self.init_error, self.ntraining_samples = \
@@ -1380,11 +1453,18 @@ class GreedyVarianceOfMeanSampler(object):
 
     ncandidate_samples : integer
         The number of samples used by the greedy downselection procedure
+
+    candidate_block_size : integer
+        The maximum number of candidates for which the objective is 
+        evaluated at once when econ is False. Memory is proportional to 
+        candidate_block_size times the number of samples selected. If None
+        all candidates are evaluated at once.
     """
     def __init__(self, num_vars, nquad_samples,
                  ncandidate_samples, generate_random_samples, variables=None,
                  use_gauss_quadrature=False, econ=True,
-                 compute_cond_nums=False, nugget=0):
+                 compute_cond_nums=False, nugget=0,
+                 candidate_block_size=None):
         self.nvars = num_vars
         self.nquad_samples = nquad_samples
         self.variables = variables
@@ -1403,6 +1483,7 @@ class GreedyVarianceOfMeanSampler(object):
         self.compute_cond_nums = compute_cond_nums
         self.init_pivots = None
         self.nugget = nugget
+        self.candidate_block_size = candidate_block_size
         self.initialize()
         self.best_obj_vals = []
         self.pred_samples = None
@@ -1414,6 +1495,40 @@ class GreedyVarianceOfMeanSampler(object):
             self.y_1 = np.zeros((0))
             self.candidate_y_2 = np.empty(self.candidate_samples.shape[1])
 
+    def update_cholesky_factor(self, pivot):
+        """
+        Add pivot to the Cholesky factor self.L of the kernel matrix of the
+        pivots.
+
+        self.L is stored as the pivot rows of a low-rank pivoted Cholesky
+        factor self.candidate_L of the kernel matrix of all the candidates.
+        The row of self.candidate_L of a candidate is 
+        :math:`L_{12}^T=(L_{11}^{-1}A_{12})^T` and self.schur_diag stores the
+        Schur complement of each candidate, so adding a pivot only requires
+        computing one column of the kernel matrix.
+
+        Returns
+        -------
+        success : boolean
+            False if the Schur complement of the pivot is not positive
+        """
+        npivots = self.L.shape[0]
+        if npivots == 0:
+            self.candidate_L = np.zeros((self.candidate_samples.shape[1], 0))
+            self.chol_pivots = np.arange(self.candidate_samples.shape[1])
+            self.schur_diag = np.diagonal(self.A).astype(float)
+            self.init_error = np.absolute(self.schur_diag).sum()
+        chol_pivots = np.concatenate([self.pivots, [pivot]]).astype(int)
+        self.candidate_L, self.chol_pivots, self.schur_diag, chol_flag, \
+            __, __ = continue_pivoted_cholesky_decomposition(
+                self.A, self.candidate_L, npivots+1, chol_pivots, 0., False,
+                None, self.chol_pivots, self.schur_diag, npivots,
+                self.init_error, econ=True)
+        if chol_flag > 0:
+            return False
+        self.L = self.candidate_L[chol_pivots, :npivots+1]
+        return True
+
     # def monte_carlo_objective(self, new_sample_index):
     #     train_samples = np.hstack(
     #         [self.training_samples,
@@ -1482,10 +1597,48 @@ class GreedyVarianceOfMeanSampler(object):
         return -tau.T.dot(cholesky_solve_linear_system(L, tau))
 
     def objective_vals(self):
-        obj_vals = np.inf*np.ones(self.candidate_samples.shape[1])
-        for mm in range(self.candidate_samples.shape[1]):
-            if mm not in self.pivots:
-                obj_vals[mm] = self.objective(mm)
+        """
+        Evaluate the objective for every candidate at once.
+
+        The kernel matrix of the pivots and each candidate is factorized
+        using a rank-one update of the Cholesky factor of the kernel matrix
+        of the pivots. Candidates for which the Schur complement of this
+        matrix is not positive, i.e. the updated matrix is not positive 
+        definite, have infinite objective.
+        """
+        ncandidates = self.candidate_samples.shape[1]
+        obj_vals = np.inf*np.ones(ncandidates)
+        pivots = np.asarray(self.pivots, dtype=int)
+        L = None
+        if pivots.shape[0] > 0:
+            try:
+                L = np.linalg.cholesky(self.A[np.ix_(pivots, pivots)])
+            except np.linalg.LinAlgError:
+                return obj_vals
+        precomputed_data = self.precompute_schur_complement_objective(
+            L, pivots)
+
+        block_size = self.candidate_block_size
+        if block_size is None:
+            block_size = ncandidates
+        for lb in range(0, ncandidates, block_size):
+            ub = min(lb+block_size, ncandidates)
+            indices = np.arange(lb, ub)
+            if L is None:
+                L_12 = np.zeros((0, ub-lb))
+            else:
+                L_12 = solve_triangular(
+                    L, self.A[np.ix_(pivots, indices)], lower=True)
+            schur_complement = self.A[indices, indices]-np.sum(
+                L_12*L_12, axis=0)
+            useful_candidates = schur_complement > 0
+            useful_candidates[pivots[(pivots >= lb) & (pivots < ub)]-lb] = \
+                False
+            obj_vals[indices[useful_candidates]] = \
+                self.schur_complement_objective_vals(
+                    L, pivots, indices[useful_candidates],
+                    L_12[:, useful_candidates],
+                    schur_complement[useful_candidates], precomputed_data)
         # assert np.allclose(self.candidate_samples[:,self.pivots],self.training_samples)
         # if len(self.pivots)>22:
         #     I = np.argsort(self.candidate_samples[0,:])
@@ -1496,6 +1649,21 @@ class GreedyVarianceOfMeanSampler(object):
         #     plt.show()
         return obj_vals
     
+    def precompute_schur_complement_objective(self, L, pivots):
+        if L is None:
+            return 0, np.zeros(0)
+        y_1 = solve_triangular(L, self.tau[pivots], lower=True)
+        return y_1.dot(y_1), y_1
+
+    def schur_complement_objective_vals(self, L, pivots, indices, L_12,
+                                        schur_complement, precomputed_data):
+        # tau^T A^{-1} tau for the pivots and each candidate is the sum of
+        # the value for the pivots and the square of the new entry of
+        # y = L^{-1} tau
+        obj_val_11, y_1 = precomputed_data
+        y_2 = (self.tau[indices]-L_12.T.dot(y_1))/np.sqrt(schur_complement)
+        return -(obj_val_11+y_2**2)
+
     def refine_naive(self):
         if (self.init_pivots is not None and
             len(self.pivots) < len(self.init_pivots)):
@@ -1520,26 +1688,8 @@ class GreedyVarianceOfMeanSampler(object):
 
         assert np.isfinite(obj_vals[pivot])
 
-        if self.L.shape[0]==0:
-            self.L = np.atleast_2d(self.A[pivot, pivot])
-        else:
-            A_12 = self.A[self.pivots, pivot:pivot+1]
-            L_12 = solve_triangular(self.L, A_12, lower=True)
-            L_22_sq = self.A[pivot, pivot] - L_12.T.dot(L_12)
-            if L_22_sq <= 0:
-                # recompute Cholesky from scratch to make sure roundoff error
-                # is not causing L_22_sq to be negative
-                indices = np.concatenate([self.pivots, [pivot]]).astype(int)
-                try:
-                    self.L = np.linalg.cholesky(
-                        self.A[np.ix_(indices, indices)])
-                except:
-                    return -1, np.inf
-
-            L_22 = np.sqrt(L_22_sq)
-            self.L = np.block(
-                [[self.L, np.zeros(L_12.shape)],
-                 [L_12.T, L_22]])
+        if not self.update_cholesky_factor(pivot):
+            return -1, np.inf
             
         assert np.isfinite(self.candidate_y_2[pivot])
         self.y_1 = np.concatenate([self.y_1, [self.candidate_y_2[pivot]]])
@@ -1561,17 +1711,7 @@ class GreedyVarianceOfMeanSampler(object):
             self.candidate_y_2 = self.tau/L
             return -vals
 
-        A_12 = np.atleast_2d(self.A[self.pivots, :])
-        L_12 = solve_triangular(self.L, A_12, lower=True)
-        J = np.where((np.diagonal(self.A)-np.sum(L_12*L_12, axis=0)) <= 0)[0]
-        self.temp = np.diagonal(self.A)-np.sum(L_12*L_12, axis=0)
-        useful_candidates = np.ones(
-            (self.candidate_samples.shape[1]), dtype=bool)
-        useful_candidates[J] = False
-        useful_candidates[self.pivots] = False
-        L_12 = L_12[:, useful_candidates]
-        L_22 = np.sqrt(np.diagonal(self.A)[useful_candidates] - np.sum(
-            L_12*L_12, axis=0))
+        L_12, L_22, useful_candidates = self.get_candidate_schur_complements()
         y_2 = (self.tau[useful_candidates]-L_12.T.dot(self.y_1))/L_22
         self.candidate_y_2[useful_candidates] = y_2
         self.candidate_y_2[~useful_candidates] = np.inf
@@ -1584,6 +1724,27 @@ class GreedyVarianceOfMeanSampler(object):
                 solve_triangular(self.L.T, L_12*z_2, lower=False)))
         return vals
 
+    def get_candidate_schur_complements(self):
+        """
+        Return :math:`L_{12}=L_{11}^{-1}A_{12}` and the square root of the
+        Schur complement :math:`L_{22}` of the candidates, which are not 
+        already pivots, for which the Schur complement is positive. Also
+        return the boolean mask of these candidates.
+        """
+        npivots = self.L.shape[0]
+        useful_candidates = self.schur_diag > 0
+        useful_candidates[self.pivots] = False
+        L_12 = self.candidate_L[useful_candidates, :npivots].T
+        L_22 = np.sqrt(self.schur_diag[useful_candidates])
+        return L_12, L_22, useful_candidates
+
+    def get_candidate_cholesky_factor_row(self, new_sample_index):
+        npivots = self.L.shape[0]
+        L_12 = self.candidate_L[new_sample_index:new_sample_index+1,
+                                :npivots].T
+        L_22 = np.sqrt(np.atleast_2d(self.schur_diag[new_sample_index]))
+        return L_12, L_22
+
     def objective_econ(self, new_sample_index):
         if self.L.shape[0] == 0:
             L = np.sqrt(self.A[new_sample_index, new_sample_index])
@@ -1592,10 +1753,7 @@ class GreedyVarianceOfMeanSampler(object):
                 new_sample_index, new_sample_index]
             return -val
 
-        A_12 = self.A[self.pivots, new_sample_index:new_sample_index+1]
-        L_12 = solve_triangular(self.L, A_12, lower=True)
-        L_22 = np.sqrt(
-            self.A[new_sample_index, new_sample_index] - L_12.T.dot(L_12))
+        L_12, L_22 = self.get_candidate_cholesky_factor_row(new_sample_index)
         y_2 = (self.tau[new_sample_index]-L_12.T.dot(self.y_1))/L_22[0, 0]
         self.candidate_y_2[new_sample_index] = y_2
         z_2 = y_2/L_22[0, 0]
@@ -1691,8 +1849,9 @@ class GreedyVarianceOfMeanSampler(object):
                     self.cond_nums.append(
                         np.linalg.cond(
                             self.A[np.ix_(self.pivots, self.pivots)]))
-            print(np.linalg.cond(
-                self.A[np.ix_(self.pivots, self.pivots)]))
+            if verbosity>1:
+                print(np.linalg.cond(
+                    self.A[np.ix_(self.pivots, self.pivots)]))
 
         new_samples = self.training_samples[:,ntraining_samples:]
         self.ntraining_samples = self.training_samples.shape[1]
@@ -1796,16 +1955,33 @@ class GreedyIntegratedVarianceSampler(GreedyVarianceOfMeanSampler):
         
         return -np.trace(A_inv.dot(P))
 
+    def precompute_schur_complement_objective(self, L, pivots):
+        if L is None:
+            return 0, None
+        P_11 = self.P[np.ix_(pivots, pivots)]
+        return np.trace(cholesky_solve_linear_system(L, P_11)), P_11
+
+    def schur_complement_objective_vals(self, L, pivots, indices, L_12,
+                                        schur_complement, precomputed_data):
+        # Let B = A_11^{-1}A_12. The inverse of the kernel matrix of the 
+        # pivots and a candidate is
+        # [[A_11^{-1}+B B^T/S, -B/S], [-B^T/S, 1/S]]
+        # where S is the Schur complement
+        obj_val_11, P_11 = precomputed_data
+        vals = np.diagonal(self.P)[indices].copy()
+        if L is not None:
+            B = solve_triangular(L.T, L_12, lower=False)
+            vals += np.sum(B*P_11.dot(B), axis=0)
+            vals -= 2*np.sum(B*self.P[np.ix_(pivots, indices)], axis=0)
+        return -(obj_val_11+vals/schur_complement)
+
     def objective_econ(self, new_sample_index):
         if self.L_inv.shape[0] == 0:
             val = self.P[new_sample_index, new_sample_index]/self.A[
                 new_sample_index, new_sample_index]
             return -val
 
-        A_12 = self.A[self.pivots, new_sample_index:new_sample_index+1]
-        L_12 = solve_triangular(self.L, A_12, lower=True)
-        L_22 = np.sqrt(
-            self.A[new_sample_index, new_sample_index] - L_12.T.dot(L_12))
+        L_12, L_22 = self.get_candidate_cholesky_factor_row(new_sample_index)
         C = -np.dot(L_12.T/L_22, self.L_inv)
        
         # TODO set self.P_11 when pivot is chosen so do not constantly
@@ -1823,17 +1999,7 @@ class GreedyIntegratedVarianceSampler(GreedyVarianceOfMeanSampler):
             vals = np.diagonal(self.P)/np.diagonal(self.A)
             return -vals
 
-        A_12 = np.atleast_2d(self.A[self.pivots, :])
-        L_12 = solve_triangular(self.L, A_12, lower=True)
-        J = np.where((np.diagonal(self.A)-np.sum(L_12*L_12, axis=0)) <= 0)[0]
-        self.temp = np.diagonal(self.A)-np.sum(L_12*L_12, axis=0)
-        useful_candidates = np.ones(
-            (self.candidate_samples.shape[1]), dtype=bool)
-        useful_candidates[J] = False
-        useful_candidates[self.pivots] = False
-        L_12 = L_12[:, useful_candidates]
-        L_22 = np.sqrt(np.diagonal(self.A)[useful_candidates] - np.sum(
-            L_12*L_12, axis=0))
+        L_12, L_22, useful_candidates = self.get_candidate_schur_complements()
 
         P_11 = self.P[np.ix_(self.pivots, self.pivots)]
         P_12 = self.P[np.ix_(self.pivots, useful_candidates)]
@@ -1867,32 +2033,11 @@ class GreedyIntegratedVarianceSampler(GreedyVarianceOfMeanSampler):
             return -1, np.inf
         
 
-        if self.L_inv.shape[0]==0:
-            self.L = np.atleast_2d(self.A[pivot, pivot])
-            self.L_inv = np.atleast_2d(1/self.A[pivot, pivot])
-            return pivot, obj_val
-
-        A_12 = self.A[self.pivots, pivot:pivot+1]
-        L_12 = solve_triangular(self.L, A_12, lower=True)
-        L_22_sq = self.A[pivot, pivot] - L_12.T.dot(L_12)
-        if L_22_sq <= 0:
-            # recompute Cholesky from scratch to make sure roundoff error
-            # is not causing L_22_sq to be negative
-            indices = np.concatenate([self.pivots, [pivot]]).astype(int)
-            try:
-                self.L = np.linalg.cholesky(self.A[np.ix_(indices, indices)])
-            except:
-                return -1, np.inf
-            self.L_inv = np.linalg.inv(self.L)
-            return pivot, obj_val
-        
-        L_22 = np.sqrt(L_22_sq)
+        if not self.update_cholesky_factor(pivot):
+            return -1, np.inf
 
-        self.L = np.block(
-            [[self.L, np.zeros(L_12.shape)],
-             [L_12.T, L_22]])
-        indices = np.concatenate([self.pivots, [pivot]]).astype(int)
-        L_22_inv = np.linalg.inv(L_22)
+        L_12 = self.L[-1:, :-1].T
+        L_22_inv = 1/self.L[-1:, -1:]
         self.L_inv = np.block(
             [[self.L_inv, np.zeros(L_12.shape)],
              [-np.dot(L_22_inv.dot(L_12.T), self.L_inv), L_22_inv]])
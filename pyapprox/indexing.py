@@ -296,6 +296,154 @@ def get_forward_neighbor(subspace_index,var_num):
     neighbor[var_num] += 1
     return neighbor
 
+class MultiIndexSet(object):
+    r"""
+    A set of multivariate indices supporting constant time insertion and 
+    lookup.
+
+    Each index is encoded as an integer key whose base :math:`2^{16}` digits
+    are the entries of the index. The keys of the forward and backward 
+    neighbors of an index are obtained by adding or subtracting a power 
+    of two from the key of the index, without creating new arrays. 
+    The indices are stored in the order they are added in an array whose 
+    capacity doubles when full, so adding an index has amortized 
+    constant cost.
+    """
+    # the number of bits used to store each entry of an index
+    entry_nbits = 16
+
+    def __init__(self,num_vars,init_capacity=16):
+        self.num_vars = num_vars
+        self.nindices = 0
+        self.storage = np.empty((num_vars,init_capacity),dtype=int)
+        self.key_to_id = dict()
+        self.unit_keys = [1<<(self.entry_nbits*dd) for dd in range(num_vars)]
+
+    @property
+    def indices(self):
+        r"""
+        The indices np.ndarray (num_vars,num_indices) in the order they 
+        were added
+        """
+        return self.storage[:,:self.nindices]
+
+    def __len__(self):
+        return self.nindices
+
+    def __contains__(self,index):
+        return self.get_key(index) in self.key_to_id
+
+    def __eq__(self,other):
+        return (isinstance(other,MultiIndexSet) and 
+                np.array_equal(self.indices,other.indices))
+
+    def __ne__(self,other):
+        return not self.__eq__(other)
+
+    def get_key(self,index):
+        r"""
+        Return the integer key of an index.
+        """
+        index = np.asarray(index)
+        assert index.shape==(self.num_vars,)
+        if index.min()<0 or index.max()>=2**self.entry_nbits:
+            raise Exception(f'Entries of {index} are out of range')
+        return int.from_bytes(index.astype('<u2').tobytes(),'little')
+
+    def get_id(self,index):
+        r"""
+        Return the position of an index in the set or None if the index is 
+        not in the set.
+        """
+        return self.key_to_id.get(self.get_key(index))
+
+    def add(self,index):
+        r"""
+        Add an index to the set if it is not already present.
+
+        Returns
+        -------
+        index_id : integer
+            The position of the index in the set
+        """
+        key = self.get_key(index)
+        index_id = self.key_to_id.get(key)
+        if index_id is not None:
+            return index_id
+        if self.nindices==self.storage.shape[1]:
+            self.storage = np.hstack(
+                [self.storage,np.empty_like(self.storage)])
+        self.storage[:,self.nindices] = index
+        self.key_to_id[key] = self.nindices
+        self.nindices += 1
+        return self.nindices-1
+
+    def add_indices(self,indices):
+        r"""
+        Add the columns of indices np.ndarray (num_vars,num_indices) to the 
+        set and return their positions in the set.
+        """
+        return np.array([self.add(index) for index in indices.T],dtype=int)
+
+    def get_backward_neighbor_ids(self,index):
+        r"""
+        Return the positions in the set of the backward neighbors of an index.
+        The position is None if a neighbor is not in the set. Only the 
+        neighbors in the dimensions with non-zero entries are returned.
+
+        Returns
+        -------
+        neighbor_ids : list
+            The tuples (dimension, position) of each backward neighbor
+        """
+        key = self.get_key(index)
+        return [(dd,self.key_to_id.get(key-self.unit_keys[dd]))
+                for dd in np.where(index>0)[0]]
+
+    def get_forward_neighbor_ids(self,index):
+        r"""
+        Return the positions in the set of the forward neighbors of an index.
+        The position is None if a neighbor is not in the set.
+        """
+        key = self.get_key(index)
+        return [self.key_to_id.get(key+unit_key)
+                for unit_key in self.unit_keys]
+
+    def update_smolyak_coefficients(self,new_index,smolyak_coeffs):
+        r"""
+        Update the Smolyak coefficients of the indices in the set 
+        when new_index is added to the combination technique.
+
+        Only the coefficients of the indices new_index-e, 
+        e in {0,1}^num_vars, change so the cost is proportional to two 
+        to the power of the number of non-zero entries of new_index and 
+        does not depend on the number of indices in the set.
+
+        Parameters
+        ----------
+        new_index : np.ndarray (num_vars)
+            The index being added
+
+        smolyak_coeffs : np.ndarray (num_indices)
+            The Smolyak coefficients of each index in the set. 
+            Modified in place
+
+        Returns
+        -------
+        smolyak_coeffs : np.ndarray (num_indices)
+            The updated Smolyak coefficients
+        """
+        keys, signs = [self.get_key(new_index)], [1.]
+        for dd in np.where(new_index>0)[0]:
+            unit_key = self.unit_keys[dd]
+            keys += [key-unit_key for key in keys]
+            signs += [-sign for sign in signs]
+        for key,sign in zip(keys,signs):
+            index_id = self.key_to_id.get(key)
+            if index_id is not None:
+                smolyak_coeffs[index_id] += sign
+        return smolyak_coeffs
+
 def compute_downward_closed_indices(num_vars,admissibility_criteria):
     indices = np.zeros((num_vars,0),dtype=int)
     active_indices = np.zeros((num_vars,1),dtype=int)
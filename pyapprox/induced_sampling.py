@@ -901,8 +901,35 @@ def continuous_induced_measure_cdf(pdf,ab,ii,lb,ub,tol,x):
 
 from pyapprox.random_variable_algebra import invert_monotone_function
 from pyapprox.variables import get_distribution_info
-def continuous_induced_measure_ppf(var,ab,ii,u_samples,
-                                   quad_tol=1e-8,opt_tol=1e-6):
+import hashlib
+from scipy.interpolate import PchipInterpolator
+from pyapprox.orthonormal_polynomials_1d import gauss_quadrature
+
+# the induced measure CDF tables already computed by this process.
+# See get_induced_measure_cdf_table
+_induced_measure_cdf_tables = dict()
+# directory used to share tables between processes and sessions
+_induced_measure_cdf_table_cache_dir = None
+
+
+def set_induced_measure_cdf_table_cache_dir(cache_dir):
+    """
+    Set the directory in which the tables of the CDFs of induced measures
+    are stored so that they can be reused by other processes. Set 
+    cache_dir=None to only store tables in memory.
+    """
+    global _induced_measure_cdf_table_cache_dir
+    if cache_dir is not None and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    _induced_measure_cdf_table_cache_dir = cache_dir
+
+
+def get_continuous_induced_measure_pdf(var):
+    r"""
+    Return the bounds of the canonical domain of the polynomials
+    orthonormal with respect to a continuous variable and the 
+    probability density function of the variable on that domain.
+    """
     if is_bounded_continuous_variable(var):
         # canonical domain of bounded variables does not coincide with scipy
         # variable canonical pdf domain with loc,scale=0,1
@@ -914,11 +941,286 @@ def continuous_induced_measure_ppf(var,ab,ii,u_samples,
     shapes=get_distribution_info(var)[2]
 
     # need to map x from canonical polynomial domain to canonical domain of pdf
-    pdf = lambda x: var.dist._pdf((x-loc)/scale,**shapes)/scale
     def pdf(x):
         vals = var.dist._pdf((x-loc)/scale,**shapes)/scale
         #print('x',x,(x-loc)/scale,vals)
         return  vals
+    return lb, ub, pdf
+
+
+def get_induced_measure_table_bounds(density,ab,ii,lb,ub,tol=1e-16):
+    r"""
+    Return finite bounds outside of which the density of the induced
+    measure is less than tol times its maximum on the interval 
+    containing the Gauss quadrature points of degree ii+1.
+    """
+    nodes = gauss_quadrature(ab,ii+1)[0]
+    scale = max(nodes.max()-nodes.min(),ab[min(1,ab.shape[0]-1),1],1e-2)
+    bounds = [lb,ub]
+    max_density = density(
+        np.linspace(nodes.min()-scale,nodes.max()+scale,101)).max()
+    for kk,(bound,sign) in enumerate([(lb,-1),(ub,1)]):
+        if np.isfinite(bound):
+            continue
+        bound = [nodes.min(),nodes.max()][kk]
+        for it in range(1000):
+            bound += sign*scale
+            if density(np.atleast_1d(bound))[0] < tol*max_density:
+                break
+        bounds[kk] = bound
+    return bounds
+
+
+def get_induced_measure_table_mesh(lb,ub,nintervals,lb_finite,ub_finite,
+                                   nrefinements=10):
+    r"""
+    Return the mesh, clustered like the zeros of orthonormal polynomials
+    towards the ends of the interval [lb,ub], used to tabulate the CDF
+    of an induced measure. The mesh is geometrically graded towards the 
+    finite bounds of the support to resolve singularities of the density.
+    """
+    mesh = (lb+ub)/2-(ub-lb)/2*np.cos(np.linspace(0,np.pi,nintervals+1))
+    # the smallest interval must be large enough that the quadrature
+    # points inside it are not rounded to the bounds
+    nrefinements = int(min(
+        nrefinements,np.log10((mesh[1]-mesh[0])/(1e-12*(ub-lb)))))
+    grading = np.logspace(-nrefinements,-1,nrefinements)
+    if lb_finite:
+        mesh = np.concatenate(
+            [mesh[:1],mesh[0]+(mesh[1]-mesh[0])*grading,mesh[1:]])
+    if ub_finite:
+        mesh = np.concatenate(
+            [mesh[:-1],mesh[-1]-(mesh[-1]-mesh[-2])*grading[::-1],mesh[-1:]])
+    return mesh
+
+
+class InducedMeasureCDFTable(object):
+    r"""
+    A table of the cumulative distribution function (CDF) of the measure 
+    induced by the orthonormal polynomial of a given degree, i.e. 
+    the measure with density :math:`p_n(x)^2\rho(x)`, which is used to 
+    draw samples from the induced measure by inverse transform sampling.
+
+    The integral of the density over each interval of a mesh is computed
+    with Gauss-Legendre quadrature. The inverse of the CDF is approximated 
+    by monotone piecewise cubic (PCHIP) interpolation of the tabulated 
+    values, which can be refined with safeguarded Newton steps that 
+    evaluate the CDF exactly, up to the accuracy of the quadrature rule.
+
+    Parameters
+    ----------
+    mesh : np.ndarray (nmesh_points)
+        The mesh of the support of the induced measure
+
+    cdf_vals : np.ndarray (nmesh_points)
+        The values of the CDF at the mesh points
+
+    density : callable
+        Function with the signature
+       
+        `density(x) -> np.ndarray (nx)`
+
+        where x is a np.ndarray (nx) returning the unnormalized density
+        of the induced measure
+
+    normalization : float
+        The integral of density over the mesh
+
+    nquad_samples : integer
+        The number of Gauss-Legendre points used in each interval of the mesh
+    """
+    def __init__(self,mesh,cdf_vals,density,normalization,nquad_samples):
+        self.mesh = mesh
+        self.cdf_vals = cdf_vals
+        self.density = density
+        self.normalization = normalization
+        self.quad_x,self.quad_w = np.polynomial.legendre.leggauss(
+            nquad_samples)
+        # the inverse CDF is only defined where the CDF is strictly
+        # increasing
+        II = np.concatenate([[True],np.diff(cdf_vals)>0])
+        self.ppf_interpolant = PchipInterpolator(cdf_vals[II],mesh[II])
+
+    def integrate(self,lb,ub):
+        """
+        Integrate the normalized density over the intervals [lb,ub]
+        """
+        x = ((ub-lb)[:,np.newaxis]*(self.quad_x+1)/2+
+             lb[:,np.newaxis])
+        vals = self.density(x.flatten()).reshape(x.shape).dot(self.quad_w)
+        return vals*(ub-lb)/2/self.normalization
+
+    def cdf(self,x):
+        x = np.clip(np.atleast_1d(x),self.mesh[0],self.mesh[-1])
+        II = np.clip(
+            np.searchsorted(self.mesh,x,side='right')-1,0,
+            self.mesh.shape[0]-2)
+        return self.cdf_vals[II]+self.integrate(self.mesh[II],x)
+
+    def ppf(self,u_samples,tol=1e-12,maxiters=100):
+        """
+        Evaluate the inverse of the CDF.
+
+        The values of the interpolant of the inverse of the CDF are refined
+        with Newton iterations. Iterations that leave the interval known to 
+        bracket the solution are replaced by bisection.
+
+        Parameters
+        ----------
+        u_samples : np.ndarray (nsamples)
+            Samples in [0,1]
+
+        tol : float
+            Stop refining a value when the change made by an iteration is
+            smaller than tol. If tol is None the values are not refined
+
+        maxiters : integer
+            The maximum number of iterations
+        """
+        u_samples = np.atleast_1d(u_samples).astype(float)
+        samples = np.clip(
+            self.ppf_interpolant(u_samples),self.mesh[0],self.mesh[-1])
+        if tol is None:
+            return samples
+        JJ = np.clip(np.searchsorted(self.cdf_vals,u_samples),1,
+                     self.mesh.shape[0]-1)
+        lb, ub = self.mesh[JJ-1], self.mesh[JJ]
+        samples = np.clip(samples,lb,ub)
+        active = np.arange(u_samples.shape[0])
+        for it in range(maxiters):
+            if active.shape[0]==0:
+                break
+            x = samples[active]
+            residuals = self.cdf(x)-u_samples[active]
+            II = residuals<0
+            lb[active[II]] = x[II]
+            ub[active[~II]] = x[~II]
+            derivs = self.density(x)/self.normalization
+            with np.errstate(divide='ignore',invalid='ignore'):
+                new_x = x-residuals/derivs
+            JJ = (~np.isfinite(new_x)|(new_x<lb[active])|(new_x>ub[active]))
+            new_x[JJ] = (lb[active[JJ]]+ub[active[JJ]])/2
+            samples[active] = new_x
+            active = active[(np.absolute(new_x-x)>tol)&(residuals!=0)]
+        return samples
+
+
+def get_induced_measure_cdf_table(var,ab,ii,nintervals=None,
+                                  nquad_samples=10):
+    r"""
+    Return the table of the CDF of the measure induced by the polynomial 
+    of degree ii orthonormal with respect to a continuous random variable.
+
+    Tables are only computed the first time they are requested for a given
+    type of variable, shape parameters, recursion coefficients and degree.
+    The location and scale of the variable do not matter because the 
+    tables are defined on the canonical domain of the polynomials. If a 
+    cache directory has been set with
+    :func:`pyapprox.induced_sampling.set_induced_measure_cdf_table_cache_dir`
+    tables are also stored in and loaded from that directory.
+
+    Parameters
+    ----------
+    var : scipy.stats.dist
+        The random variable
+
+    ab : np.ndarray (ii+1,2)
+        The recursion coefficients of the orthonormal polynomials
+
+    ii : integer
+        The degree of the polynomial
+
+    nintervals : integer
+        The number of intervals in the mesh. If None then 200+50*ii
+
+    nquad_samples : integer
+        The number of Gauss-Legendre points used in each interval of the mesh
+
+    Returns
+    -------
+    table : :class:`pyapprox.induced_sampling.InducedMeasureCDFTable`
+        The table
+    """
+    if nintervals is None:
+        nintervals = 200+50*ii
+    shapes = get_distribution_info(var)[2]
+    ab = np.asarray(ab[:ii+1],dtype=float)
+    key = '-'.join(
+        [var.dist.name,str(sorted(shapes.items())),str(ii),str(nintervals),
+         str(nquad_samples)])
+    key = hashlib.sha1(key.encode()+ab.tobytes()).hexdigest()
+
+    lb,ub,pdf = get_continuous_induced_measure_pdf(var)
+    def density(x):
+        return evaluate_orthonormal_polynomial_1d(x,ii,ab)[:,-1]**2*pdf(x)
+
+    if key in _induced_measure_cdf_tables:
+        return _induced_measure_cdf_tables[key]
+
+    filename = None
+    if _induced_measure_cdf_table_cache_dir is not None:
+        filename = os.path.join(
+            _induced_measure_cdf_table_cache_dir,
+            'induced-measure-cdf-%s-%d-%s.npz'%(var.dist.name,ii,key[:16]))
+    if filename is not None and os.path.exists(filename):
+        data = np.load(filename)
+        mesh,cdf_vals,normalization = (
+            data['mesh'],data['cdf_vals'],float(data['normalization']))
+    else:
+        table_lb,table_ub = get_induced_measure_table_bounds(
+            density,ab,ii,lb,ub)
+        mesh = get_induced_measure_table_mesh(
+            table_lb,table_ub,nintervals,np.isfinite(lb),np.isfinite(ub))
+        table = InducedMeasureCDFTable(
+            mesh,np.linspace(0,1,mesh.shape[0]),density,1.,nquad_samples)
+        interval_masses = table.integrate(mesh[:-1],mesh[1:])
+        cdf_vals = np.concatenate([[0],np.cumsum(interval_masses)])
+        normalization = cdf_vals[-1]
+        cdf_vals /= normalization
+        if filename is not None:
+            # write to a temporary file first so that other processes
+            # never read a partially written table
+            tmp_filename = filename[:-4]+'-%d.npz'%os.getpid()
+            np.savez(tmp_filename,mesh=mesh,cdf_vals=cdf_vals,
+                     normalization=normalization)
+            os.replace(tmp_filename,filename)
+    table = InducedMeasureCDFTable(
+        mesh,cdf_vals,density,normalization,nquad_samples)
+    _induced_measure_cdf_tables[key] = table
+    return table
+
+
+def continuous_induced_measure_ppf(var,ab,ii,u_samples,
+                                   quad_tol=1e-8,opt_tol=1e-6,
+                                   tabulate=True):
+    r"""
+    Evaluate the inverse of the CDF of the measure induced by the polynomial
+    of degree ii orthonormal with respect to a continuous random variable.
+
+    Parameters
+    ----------
+    quad_tol : float
+        The tolerance of the adaptive quadrature used to evaluate the CDF.
+        Only used when tabulate is False
+
+    opt_tol : float
+        The tolerance used to terminate the root finding used to invert 
+        the CDF
+
+    tabulate : boolean
+        True - interpolate a table of the CDF, see 
+               :func:`pyapprox.induced_sampling.get_induced_measure_cdf_table`
+        False - invert the CDF at each sample by bisection, where each 
+               evaluation of the CDF uses adaptive quadrature. This is much
+               slower and only supports bounded variables
+    """
+    if tabulate:
+        table = get_induced_measure_cdf_table(var,ab,ii)
+        samples = table.ppf(u_samples,opt_tol)
+        assert np.all(np.isfinite(samples))
+        return samples
+
+    lb,ub,pdf = get_continuous_induced_measure_pdf(var)
     #pdf = var.pdf
     #func = partial(continuous_induced_measure_cdf,pdf,ab,ii,lb,ub,quad_tol)
     from pyapprox.cython.orthonormal_polynomials_1d import\
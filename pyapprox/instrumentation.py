@@ -0,0 +1,194 @@
+"""
+Opt-in instrumentation of the hot paths of pyapprox.
+
+The hot paths, e.g. refinement steps, basis matrix construction, linear
+solves and model evaluations, are wrapped in
+
+    with timer('basis_matrix'):
+        ...
+
+When no profiler is active timer returns a shared object whose __enter__
+and __exit__ do nothing, so the cost of the instrumentation is a global
+lookup and two empty method calls. Activate a profiler with
+
+    with instrument() as profiler:
+        result = adaptive_approximate(fun, variable, 'sparse_grid')
+    print(profiler.summary())
+
+Whole functions are instrumented with the timed decorator. Pass
+instrument=True to adaptive_approximate or approximate to store the
+summary in the profile attribute of the returned ApproximateResult.
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+_profiler = None
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _PhaseTimer(object):
+    __slots__ = ('profiler', 'name', 't0', 'memory0')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.track_memory:
+            self.memory0 = tracemalloc.get_traced_memory()[0]
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter()-self.t0
+        allocated_bytes = 0
+        if self.profiler.track_memory:
+            allocated_bytes = max(
+                tracemalloc.get_traced_memory()[0]-self.memory0, 0)
+        self.profiler.add(self.name, wall_time, allocated_bytes)
+        return False
+
+
+class PhaseProfiler(object):
+    """
+    Accumulate the wall time, number of calls and allocated bytes of named
+    phases and the values of named counters.
+
+    Parameters
+    ----------
+    track_memory : boolean
+        True - record the increase in the memory allocated by python, as
+               measured by tracemalloc, during each phase. Tracing
+               allocations slows down the code considerably
+        False - only record wall times and number of calls
+
+    Attributes
+    ----------
+    phases : dict
+        The wall time, number of calls and allocated bytes of each phase.
+        Phases can be nested so the wall time of a phase includes the time
+        of the phases it contains
+
+    counters : dict
+        The values of the counters, e.g. the number of model evaluations
+    """
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.phases = dict()
+        self.counters = dict()
+
+    def timer(self, name):
+        return _PhaseTimer(self, name)
+
+    def add(self, name, wall_time, allocated_bytes=0):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = {'wall_time': 0., 'ncalls': 0, 'allocated_bytes': 0}
+            self.phases[name] = phase
+        phase['wall_time'] += wall_time
+        phase['ncalls'] += 1
+        phase['allocated_bytes'] += allocated_bytes
+
+    def count(self, name, increment=1):
+        self.counters[name] = self.counters.get(name, 0)+increment
+
+    def summary(self):
+        """
+        Return a copy of the phases and counters recorded so far.
+        """
+        return {'phases': dict(
+                    [(name, dict(phase))
+                     for name, phase in self.phases.items()]),
+                'counters': dict(self.counters)}
+
+    def __repr__(self):
+        msg = '{:<30} {:>12} {:>8} {:>16}\n'.format(
+            'phase', 'wall_time', 'ncalls', 'allocated_bytes')
+        for name, phase in sorted(
+                self.phases.items(), key=lambda item: -item[1]['wall_time']):
+            msg += '{:<30} {:>12.4e} {:>8} {:>16}\n'.format(
+                name, phase['wall_time'], phase['ncalls'],
+                phase['allocated_bytes'])
+        for name, value in self.counters.items():
+            msg += f'{name}: {value}\n'
+        return msg
+
+
+def timer(name):
+    """
+    Return a context manager which records the wall time and allocated
+    bytes of the code it wraps as the phase name of the active profiler.
+    If no profiler is active the context manager does nothing.
+    """
+    if _profiler is None:
+        return _null_timer
+    return _profiler.timer(name)
+
+
+def timed(name):
+    """
+    Decorator which records each call of a function as the phase name of
+    the active profiler.
+    """
+    def decorator(fun):
+        @wraps(fun)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return fun(*args, **kwargs)
+            with _profiler.timer(name):
+                return fun(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, increment=1):
+    """
+    Increment the counter name of the active profiler, if any.
+    """
+    if _profiler is not None:
+        _profiler.count(name, increment)
+
+
+def get_active_profiler():
+    return _profiler
+
+
+@contextmanager
+def instrument(track_memory=False):
+    """
+    Activate a :class:`pyapprox.instrumentation.PhaseProfiler` for the
+    duration of a with block.
+
+    Parameters
+    ----------
+    track_memory : boolean
+        True - record the bytes allocated during each phase using tracemalloc
+        False - only record wall times and number of calls
+    """
+    global _profiler
+    previous_profiler = _profiler
+    profiler = PhaseProfiler(track_memory)
+    started_tracing = track_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    _profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _profiler = previous_profiler
+        if started_tracing:
+            tracemalloc.stop()
@@ -1,4 +1,6 @@
-import os, numpy as np, tempfile, subprocess, shutil, re, glob
+import os, numpy as np, tempfile, subprocess, shutil, re, glob, signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 class AsynchronousEvaluationModel(object):
     """
     Evaluate a model in parallel when model instances are invoked by a shell
@@ -7,14 +9,16 @@ class AsynchronousEvaluationModel(object):
     Parameters
     ----------
     process sample: callable function (default=None)
-        Function that overwrites the basic implementation
-        which reads the sample in from a file called params_filename.
+        Function with signature ``process_sample(sample, workdir)`` that
+        overwrites the basic implementation which writes the sample to a
+        file called params_filename in the work directory workdir.
         This is useful if there are a number of pre-processing steps
         needed by the model before shall command is executed.
 
     load_results: callable function (default=None)
-        Function that overwrites the basic implementation
-        which reads the results from a files called results_filename
+        Function with signature ``load_results(opts, workdir)`` that
+        overwrites the basic implementation which reads the results from
+        a file called results_filename in the work directory workdir.
         This is useful if there are a number of post-processing steps
         needed by the model after the shell command is executed.
         If evaluation fails this function must return None
@@ -41,13 +45,34 @@ class AsynchronousEvaluationModel(object):
         model. A new file is created every time __call__ is exceuted.
         a unique identifier is created based upon the value of evaluation id
         when __call__ is started.
+
+    timeout : float (default=None)
+        The maximum wall time in seconds allowed for each run of the shell
+        command. Runs that exceed this time are killed and treated as 
+        failed. If None runs are never killed.
+
+    max_num_retries : integer (default=0)
+        The number of times the shell command of a failed evaluation is 
+        re-run before the evaluation is considered to have failed.
+
+    Notes
+    -----
+    Each shell command is run in its own work directory without changing
+    the working directory of the Python process. Evaluations are run
+    concurrently by threads so process_sample and load_results must only
+    access files using the absolute path of the work directory they are
+    passed, and not change the working directory.
+
+    Evaluations can be started without waiting for them to complete using
+    submit() and collected as they finish using as_completed().
     """
     def __init__(self, shell_command, max_eval_concurrency=1,
                  workdir_basename=None,link_filenames=[],
                  params_filename='params.in',results_filename='results.out',
                  params_file_header='',process_sample=None,
                  load_results=None, saved_data_basename=None,
-                 save_workdirs='yes', model_name=None):
+                 save_workdirs='yes', model_name=None, timeout=None,
+                 max_num_retries=0):
 
         self.shell_command = shell_command
         self.max_eval_concurrency = max_eval_concurrency
@@ -70,88 +95,50 @@ class AsynchronousEvaluationModel(object):
             saved_data_dir=os.path.split(saved_data_basename)[0]
             if not saved_data_dir=='' and not os.path.exists(saved_data_dir):
                 os.makedirs(saved_data_dir)
+        self.timeout = timeout
+        self.max_num_retries = max_num_retries
 
-        self.running_procs = []
-        self.running_workdirs = []
         self.function_eval_id = 0
         self.num_qoi = 0
 
         self.current_vals = []
-
-    def cleanup_threads(self, opts):
-        verbosity = opts.get("verbosity",0)
-        finished_proc_indices = []
-        for i in range(len(self.running_procs)):
-            proc = self.running_procs[i]
-            if proc.poll() is not None:
-                finished_proc_indices.append(i)
-
-        curdir = os.getcwd()
-        for i in range(len(finished_proc_indices)):
-
-            workdir = self.running_workdirs[finished_proc_indices[i]]
-            os.chdir(workdir)
-
-            function_eval_id = int(re.findall(
-                r'[0-9]+',os.path.split(workdir)[1])[-1])
-
-            if self.load_results is None:
-                if not os.path.exists(self.results_filename):
-                    if verbosity>0:
-                        print('Eval %d: %s was not found in directory %s'%(
-                            function_eval_id, self.results_filename,workdir))
-                    vals = None
-                else:
-                    vals = np.loadtxt(self.results_filename,usecols=[0])
-                    shutil.copy(
-                        self.results_filename,
-                        self.results_filename+'.%d'%function_eval_id)
-            else:
-                try:
-                    vals = self.load_results(opts)
-                except:
-                    vals = None
-                # load results may not have generated a results file
-                # so write one here
-                if vals is not None:
-                    np.savetxt(
-                        self.results_filename+'.%d'%function_eval_id,vals)
-            sample = np.loadtxt(self.params_filename+'.%d'%function_eval_id)
-
-            if ( self.workdir_basename is not None and
-                     self.save_workdirs=='limited'):
-                filenames_to_delete = glob.glob('*')
-                if vals is not None:
-                    filenames_to_delete.remove(
-                        self.results_filename+'.%d'%function_eval_id)
-                filenames_to_delete.remove(
-                    self.params_filename+'.%d'%function_eval_id)
-                if verbosity>0:
-                    filenames_to_delete.remove('stdout.txt')
-                for filename in filenames_to_delete:
-                    os.remove(filename)
-
-            if verbosity>0:
-                print('Model %s: completed eval %d'%(
-                    self.model_name,function_eval_id))
-
-            self.current_vals.append(vals)
-            self.current_samples.append(sample)
-            self.completed_function_eval_ids.append(function_eval_id)
-            
-            os.chdir(curdir)
-            if self.workdir_basename is None or self.save_workdirs=='no':
-                shutil.rmtree(workdir)
-
-
-        self.running_procs = [v for i, v in enumerate(self.running_procs) if i not in finished_proc_indices]
-        self.running_workdirs = [v for i, v in enumerate(self.running_workdirs) if i not in finished_proc_indices]
-
-    def create_work_dir(self):
+        self.executor = None
+        self.eval_id_lock = threading.Lock()
+
+    def __getstate__(self):
+        # the executor and locks cannot be pickled
+        state = self.__dict__.copy()
+        for name in ['executor','eval_id_lock']:
+            del state[name]
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.executor = None
+        self.eval_id_lock = threading.Lock()
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.max_eval_concurrency)
+        return self.executor
+
+    def shutdown(self):
+        """
+        Wait for all submitted evaluations to complete and release the 
+        threads used to monitor them.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def create_work_dir(self, function_eval_id):
         if self.workdir_basename is None:
-            tmpdir = tempfile.mkdtemp(suffix='.%d'%self.function_eval_id)
+            tmpdir = tempfile.mkdtemp(suffix='.%d'%function_eval_id)
         else:
-            tmpdir = self.workdir_basename+'.%d'%self.function_eval_id
+            # use an absolute path so that the work directory does not
+            # depend on the working directory when it is used
+            tmpdir = os.path.abspath(
+                self.workdir_basename+'.%d'%function_eval_id)
             if not os.path.exists(tmpdir):
                 os.makedirs(tmpdir)
             else:
@@ -160,50 +147,163 @@ class AsynchronousEvaluationModel(object):
                 raise Exception(msg)
         return tmpdir
 
-    def asynchronous_evaluate_using_shell_command(self, sample, opts):
-        verbosity = opts.get("verbosity",0)
-
-        curdir = os.getcwd()
-        workdir = self.create_work_dir()
-        os.chdir(workdir)
-
+    def prepare_work_dir(self, sample, function_eval_id):
+        workdir = self.create_work_dir(function_eval_id)
         for filename in self.link_filenames:
-            if not os.path.exists(os.path.split(filename)[1]):
-                os.symlink(
-                    filename,os.path.split(filename)[1])
+            link_filename = os.path.join(workdir,os.path.split(filename)[1])
+            if not os.path.exists(link_filename):
+                os.symlink(filename,link_filename)
             else:
                 msg = '%s exists in %s cannot create soft link'%(
                     filename,workdir)
                 raise Exception(msg)
         # default of savetxt is to write header with # at start of line
         #comments='' removes the #
+        params_filename = os.path.join(workdir,self.params_filename)
         if self.process_sample is not None:
-            self.process_sample(sample)
+            self.process_sample(sample,workdir)
         else:
-            np.savetxt(self.params_filename,sample,
+            np.savetxt(params_filename,sample,
                        header=self.params_file_header,
                        comments='')
-
-        if verbosity>0:
-            out = open("stdout.txt","wb")
-        else:
-            out = open(os.devnull, 'w')
-        proc = subprocess.Popen(
-            self.shell_command,shell=True,stdout=out,stderr=out)
-
-        out.close()
-
-        self.running_procs.append(proc)
-        self.running_workdirs.append(workdir)
-
         # store a copy of the parameters and return values with
         # a unique filename
         shutil.copy(
-            self.params_filename,
-            self.params_filename+'.%d'%self.function_eval_id)
+            params_filename,params_filename+'.%d'%function_eval_id)
+        return workdir
 
-        self.function_eval_id += 1
-        os.chdir(curdir)
+    def load_values(self, workdir, function_eval_id, opts):
+        verbosity = opts.get("verbosity",0)
+        results_filename = os.path.join(workdir,self.results_filename)
+        if self.load_results is None:
+            if not os.path.exists(results_filename):
+                if verbosity>0:
+                    print('Eval %d: %s was not found in directory %s'%(
+                        function_eval_id, self.results_filename,workdir))
+                vals = None
+            else:
+                vals = np.loadtxt(results_filename,usecols=[0])
+                shutil.copy(
+                    results_filename,
+                    results_filename+'.%d'%function_eval_id)
+        else:
+            try:
+                vals = self.load_results(opts,workdir)
+            except:
+                vals = None
+            # load results may not have generated a results file
+            # so write one here
+            if vals is not None:
+                np.savetxt(
+                    results_filename+'.%d'%function_eval_id,vals)
+        return vals
+
+    def run_shell_command(self, workdir, function_eval_id, opts):
+        """
+        Run the shell command in a work directory, retrying if the run fails
+        or exceeds the time limit. Return the values loaded from the work
+        directory or None if all runs failed.
+        """
+        verbosity = opts.get("verbosity",0)
+        results_filename = os.path.join(workdir,self.results_filename)
+        for kk in range(self.max_num_retries+1):
+            if os.path.exists(results_filename):
+                os.remove(results_filename)
+            if verbosity>0:
+                out = open(os.path.join(workdir,"stdout.txt"),"wb")
+            else:
+                out = subprocess.DEVNULL
+            # start a new session so that all processes spawned by the 
+            # shell can be killed if the time limit is exceeded. Sessions
+            # are only supported on POSIX systems
+            proc = subprocess.Popen(
+                self.shell_command,shell=True,stdout=out,stderr=out,
+                cwd=workdir,start_new_session=(os.name!='nt'))
+            try:
+                proc.wait(timeout=self.timeout)
+                vals = self.load_values(workdir,function_eval_id,opts)
+            except subprocess.TimeoutExpired:
+                if os.name=='nt':
+                    # only the shell, not the processes it spawned, is killed
+                    proc.kill()
+                else:
+                    os.killpg(proc.pid,signal.SIGKILL)
+                proc.wait()
+                if verbosity>0:
+                    print('Model %s: eval %d exceeded time limit'%(
+                        self.model_name,function_eval_id))
+                vals = None
+            finally:
+                if verbosity>0:
+                    out.close()
+            if vals is not None:
+                return vals
+        return None
+
+    def cleanup_work_dir(self, workdir, function_eval_id, vals, opts):
+        verbosity = opts.get("verbosity",0)
+        if ( self.workdir_basename is not None and
+                 self.save_workdirs=='limited'):
+            filenames_to_delete = [
+                os.path.split(f)[1] for f in
+                glob.glob(os.path.join(workdir,'*'))]
+            if vals is not None:
+                filenames_to_delete.remove(
+                    self.results_filename+'.%d'%function_eval_id)
+            filenames_to_delete.remove(
+                self.params_filename+'.%d'%function_eval_id)
+            if verbosity>0:
+                filenames_to_delete.remove('stdout.txt')
+            for filename in filenames_to_delete:
+                os.remove(os.path.join(workdir,filename))
+
+        if self.workdir_basename is None or self.save_workdirs=='no':
+            shutil.rmtree(workdir)
+
+    def evaluate(self, sample, function_eval_id, opts):
+        # the work directory is created by the thread running the
+        # evaluation so that at most max_eval_concurrency work directories
+        # exist at once
+        workdir = self.prepare_work_dir(sample,function_eval_id)
+        vals = self.run_shell_command(workdir,function_eval_id,opts)
+        self.cleanup_work_dir(workdir,function_eval_id,vals,opts)
+        if opts.get("verbosity",0)>0:
+            print('Model %s: completed eval %d'%(
+                self.model_name,function_eval_id))
+        return function_eval_id, sample, vals
+
+    def submit(self, sample, opts=dict()):
+        """
+        Start evaluating the model at a sample without waiting for the 
+        evaluation to complete. At most max_eval_concurrency evaluations 
+        are run at once. Evaluations submitted when this limit is reached 
+        are started as others complete.
+
+        Parameters
+        ----------
+        sample : np.ndarray (nvars)
+            The sample at which to evaluate the model
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            The future of the evaluation. future.result() returns the tuple
+            (function_eval_id, sample, vals) where vals is None if the 
+            evaluation failed.
+        """
+        with self.eval_id_lock:
+            function_eval_id = self.function_eval_id
+            self.function_eval_id += 1
+        return self.get_executor().submit(
+            self.evaluate,sample,function_eval_id,opts)
+
+    def as_completed(self, futures, timeout=None):
+        """
+        Yield the tuple (function_eval_id, sample, vals) of each of a set of
+        evaluations, created by submit(), as soon as it completes.
+        """
+        for future in as_completed(futures,timeout):
+            yield future.result()
 
     def __call__(self, samples, opts=dict()):
 
@@ -211,18 +311,18 @@ class AsynchronousEvaluationModel(object):
         self.current_samples = []
         self.completed_function_eval_ids = []
         nsamples = samples.shape[1]
-        for i in range(nsamples):
-            while len(self.running_procs)>=self.max_eval_concurrency:
-                self.cleanup_threads(opts)
-            self.asynchronous_evaluate_using_shell_command(
-                samples[:,i],opts)
-
-        while len(self.running_procs)>0:
-            self.cleanup_threads(opts)
+        if nsamples==0:
+            raise Exception('samples must contain at least one sample')
+        futures = [self.submit(samples[:,i],opts) for i in range(nsamples)]
+        for function_eval_id, sample, vals in self.as_completed(futures):
+            self.current_vals.append(vals)
+            self.current_samples.append(sample)
+            self.completed_function_eval_ids.append(function_eval_id)
 
         if self.saved_data_basename is not None:
+            first_function_eval_id = min(self.completed_function_eval_ids)
             data_filename = self.saved_data_basename+'-%d-%d.npz'%(
-                self.function_eval_id-nsamples,self.function_eval_id)
+                first_function_eval_id,first_function_eval_id+nsamples)
         else:
             data_filename = None
 
@@ -1,7 +1,6 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 import numpy as np
-from pyapprox.models.wrappers import evaluate_1darray_function_on_2d_array
 class GenzFunction(object):
     def __init__( self, func_type, num_vars, c=None, w=None, name=None ):
         """
@@ -25,88 +24,123 @@ class GenzFunction(object):
         return self.value(samples,opts)
 
     def value(self, samples, opts=dict()):
+        """
+        Evaluate the function and/or its gradient at a set of samples.
+
+        Parameters
+        ----------
+        samples : np.ndarray (num_vars,num_samples)
+            Samples in [0,1]^num_vars
+
+        opts : dictionary
+            eval_type : string
+                'value' - return the values (num_samples,1)
+                'grad' - return the gradients (num_samples,num_vars)
+                'value-grad' - return the values followed by the gradients
+                    (num_samples,num_vars+1)
+
+        Notes
+        -----
+        The gradients of the continuous and discontinuous functions are
+        only defined almost everywhere. The one sided derivatives are
+        returned at the kinks and discontinuities.
+        """
         eval_type=opts.get('eval_type','value')
-        if ( ('grad' in eval_type) and
-            (self.func_type == "discontinuous" or self.func_type == "continuous") ):
-            msg =  "gradients cannot be computed for %s Genz function"%self.func_type
-            raise Exception(msg)
         assert samples.min()>=0 and samples.max()<=1.
-        vals = evaluate_1darray_function_on_2d_array(self.value_,samples,{})
+        vals, grads = self.value_and_gradient_(samples,'grad' in eval_type)
         if eval_type=='value':
-            return vals[:,:1]
-        if eval_type=='value-grad':
             return vals
+        if eval_type=='value-grad':
+            return np.hstack((vals,grads))
         if eval_type=='grad':
-            return vals[:,1:]
+            return grads
 
-    def value_( self, samples ):
-        assert samples.ndim == 1
-        if (self.func_type == "discontinuous" or self.func_type == "continuous"):
-            result = np.empty( ( 1 ) , np.double )
-        else:
-            result = np.empty( ( self.num_vars+1 ) , np.double );
+    def value_and_gradient_(self, samples, return_grad=True):
+        """
+        Evaluate the function and its gradient at a set of samples.
+
+        Parameters
+        ----------
+        samples : np.ndarray (num_vars,num_samples)
+            The samples
+
+        return_grad : boolean
+            True - compute the gradients
+            False - only compute the values
+
+        Returns
+        -------
+        vals : np.ndarray (num_samples,1)
+            The values of the function
+
+        grads : np.ndarray (num_samples,num_vars)
+            The gradients of the function. None if return_grad is False
+        """
         self.num_vars = self.c.shape[0]
+        c = self.c[:,np.newaxis]
+        w = (np.zeros(self.num_vars)+self.w)[:,np.newaxis]
+        grads = None
         if ( self.func_type == "oscillatory" ):
-            result[0] = 2.0 * np.pi * self.w[0]
-            for d in range( self.num_vars ):
-                result[0] += self.c[d] * samples[d];
-            for d in range( self.num_vars ):
-                result[1+d] = -self.c[d] * np.sin( result[0] );
-            result[0] = np.cos( result[0] );
+            arg = 2.0*np.pi*w[0,0]+c[:,0].dot(samples)
+            vals = np.cos(arg)
+            if return_grad:
+                grads = -c*np.sin(arg)
         elif ( self.func_type == "product-peak" ):
-            result[0] = 1.0
-            for d in range( self.num_vars ):
-                result[0] *= ( 1.0 / ( self.c[d] * self.c[d] ) +
-                               ( samples[d] - self.w[d] ) *  ( samples[d] - self.w[d] ) )
-            for d in range( self.num_vars ):
-                result[1+d] = 2. * ( samples[d] - self.w[d] ) / result[0]
-            result[0] = 1.0 / result[0]
+            terms = 1.0/c**2+(samples-w)**2
+            vals = 1.0/np.prod(terms,axis=0)
+            if return_grad:
+                grads = -2.*(samples-w)/terms*vals
         elif ( self.func_type == "corner-peak" ):
-            result[0] = 1.0;
-            for d in range( self.num_vars ):
-                result[0] += self.c[d] * samples[d];
-            for d in range( self.num_vars ):
-                result[1+d]  = -self.c[d] * (self.num_vars+1) / \
-                    result[0]**( self.num_vars+2 )
-            result[0]  = 1.0 / result[0]**( self.num_vars+1 )
+            arg = 1.0+c[:,0].dot(samples)
+            vals = arg**(-(self.num_vars+1))
+            if return_grad:
+                grads = -c*(self.num_vars+1)*arg**(-(self.num_vars+2))
         elif ( self.func_type == "gaussian-peak" ):
-            result[0] = 0.0;
-            for d in range( self.num_vars ):
-                result[0] += self.c[d] * self.c[d] * ( samples[d] - self.w[d] ) * \
-                    ( samples[d] - self.w[d] )
-            for d in range( self.num_vars ):
-                result[1+d] = 2. * self.c[d]**2 * (self.w[d]-samples[d]) * \
-                    np.exp( -result[0] )
-            result[0] = np.exp( -result[0] );
+            vals = np.exp(-np.sum(c**2*(samples-w)**2,axis=0))
+            if return_grad:
+                grads = -2.*c**2*(samples-w)*vals
         elif ( self.func_type == "continuous" ):
-            result[0] = 0.0;
-            for d in range( self.num_vars ):
-                result[0] += self.c[d] * np.abs( samples[d] - self.w[d] );
-            result[0] = np.exp( -result[0] );
-            result[1:] = 0.
+            vals = np.exp(-np.sum(c*np.absolute(samples-w),axis=0))
+            if return_grad:
+                grads = -c*np.sign(samples-w)*vals
         elif ( self.func_type == "discontinuous" ):
-            result[0] = 0.0;
             if ( self.num_vars == 1 ):
-                if ( samples[0] <= self.w[0] ):
-                    for d in range( self.num_vars ):
-                            result[0] += self.c[d] * samples[d];
-                    result[0] = np.exp( result[0] );
+                inside = samples[0]<=w[0,0]
             else:
-                if ( ( samples[0] <= self.w[0] ) and ( samples[1] <= self.w[1] ) ):
-                    for d in range( self.num_vars ):
-                        result[0] += self.c[d] * samples[d];
-                    result[0] = np.exp( result[0] );
+                inside = (samples[0]<=w[0,0])&(samples[1]<=w[1,0])
+            vals = np.where(inside,np.exp(c[:,0].dot(samples)),0.)
+            if return_grad:
+                grads = c*vals
         elif (self.func_type=='corner-peak-second-order'):
-            result[0]=0.
-            for d in range(self.num_vars-1):
-                result[0] += (1.+self.c[d]*samples[d] +self.c[d+1]*samples[d+1])**(-3)
+            terms = (1.+c[:-1]*samples[:-1]+c[1:]*samples[1:])
+            vals = np.sum(terms**(-3),axis=0)
+            if return_grad:
+                terms_grads = -3*terms**(-4)
+                grads = np.zeros(samples.shape)
+                grads[:-1] += c[:-1]*terms_grads
+                grads[1:] += c[1:]*terms_grads
         else:
             msg = "ensure func_num in [\"oscillatory\",\"product-peak\","
             msg += "\"corner-peak\",\"gaussian-peak\","
             msg += "\"continuous\",\"discontinuous\"]"
             raise Exception(msg)
 
-        return result
+        if return_grad:
+            grads = grads.T
+        return vals[:,np.newaxis], grads
+
+    def value_( self, samples ):
+        """
+        Evaluate the function and its gradient at a single sample.
+
+        Returns
+        -------
+        result : np.ndarray (num_vars+1)
+            The value followed by the gradient
+        """
+        assert samples.ndim == 1
+        vals, grads = self.value_and_gradient_(samples[:,np.newaxis])
+        return np.concatenate((vals[0],grads[0]))
 
     def set_coefficients( self, c_factor, coef_type, w_factor = 0., seed=0 ):
 
@@ -231,8 +265,8 @@ class GenzFunction(object):
         elif ( self.func_type == "continuous" ):
             prod = 1.0;
             for i in range( self.num_vars ):
-                prod /= (  self.c[i] * ( 2.0 - np.exp( -self.c[i]*self.w[i])-
-                                         np.exp( self.c[i]*(self.w[i]-1.0))));
+                prod *= ( 2.0 - np.exp( -self.c[i]*self.w[i])-
+                          np.exp( self.c[i]*(self.w[i]-1.0)))/self.c[i];
             return prod;
         elif ( self.func_type == "discontinuous" ):
             prod = 1.0;
@@ -273,6 +273,109 @@ class TestAsyncModel(unittest.TestCase):
         assert len(backup_files)==num_iters
         remove_files(backup_files)
 
+    def test_async_model_submit_timeout_and_retries(self):
+        """
+        Test that evaluations can be submitted without blocking, that
+        evaluations exceeding the time limit are killed and that failed
+        evaluations are retried.
+        """
+        workdir_basename='work-dir'
+        cleanup_work_directories(workdir_basename)
+
+        # the first run of the command in each work directory fails
+        shell_command = """if [ -f attempt ]; then python -c "import numpy as np; np.savetxt('results.out',2*np.loadtxt('params.in'))"; else touch attempt; fi"""
+        model = AsynchronousEvaluationModel(
+            shell_command, max_eval_concurrency=2,
+            workdir_basename=workdir_basename, save_workdirs='no',
+            max_num_retries=1)
+        num_vars, num_samples = 2, 5
+        samples = np.random.uniform(-1.,1.,(num_vars,num_samples))
+        futures = [model.submit(samples[:,ii]) for ii in range(num_samples)]
+        function_eval_ids = []
+        for function_eval_id, sample, vals in model.as_completed(futures):
+            assert np.allclose(vals,2*samples[:,function_eval_id])
+            assert np.allclose(sample,samples[:,function_eval_id])
+            function_eval_ids.append(function_eval_id)
+        assert np.allclose(np.sort(function_eval_ids),np.arange(num_samples))
+        assert np.allclose(model(samples),2*samples.T)
+        self.assertRaises(Exception,model,samples[:,:0])
+        model.saved_data_basename = 'async-model-data'
+        self.assertRaises(Exception,model,samples[:,:0])
+        assert glob.glob('async-model-data*')==[]
+        model.shutdown()
+
+        import time
+        model = AsynchronousEvaluationModel(
+            'sleep 10', max_eval_concurrency=2,
+            workdir_basename=workdir_basename, save_workdirs='no',
+            timeout=0.2)
+        t0 = time.time()
+        futures = [model.submit(samples[:,ii]) for ii in range(2)]
+        for function_eval_id, sample, vals in model.as_completed(futures):
+            assert vals is None
+        assert time.time()-t0<5
+        model.shutdown()
+        cleanup_work_directories(workdir_basename)
+
+    def test_async_model_bounds_number_of_work_directories(self):
+        """
+        Test that work directories are only created when evaluations start
+        so no more than max_eval_concurrency exist at once.
+        """
+        workdir_basename='work-dir'
+        cleanup_work_directories(workdir_basename)
+
+        # each evaluation returns the number of existing work directories
+        # twice because the results file must contain more than one value
+        shell_command = "n=$(ls -d ../%s.* | wc -l); "%workdir_basename
+        shell_command += "echo $n > results.out; echo $n >> results.out"
+        model = AsynchronousEvaluationModel(
+            shell_command, max_eval_concurrency=2,
+            workdir_basename=os.path.abspath(workdir_basename),
+            save_workdirs='no')
+        samples = np.random.uniform(-1.,1.,(2,10))
+        try:
+            vals = model(samples)
+        finally:
+            model.shutdown()
+            cleanup_work_directories(workdir_basename)
+        assert np.all(vals<=2)
+
+    def test_async_model_concurrent_process_sample_and_load_results(self):
+        """
+        Test that user provided pre- and post-processing functions can be
+        run concurrently when the work directories are relative paths.
+        """
+        workdir_basename='wd'
+        cleanup_work_directories(workdir_basename)
+
+        def process_sample(sample, workdir):
+            np.savetxt(os.path.join(workdir,'params.in'),sample)
+
+        def load_results(opts, workdir):
+            return np.loadtxt(os.path.join(workdir,'results.out'))
+
+        shell_command = """python -c "import numpy as np; np.savetxt('results.out',2*np.loadtxt('params.in'))" """
+        model = AsynchronousEvaluationModel(
+            shell_command, max_eval_concurrency=4,
+            workdir_basename=workdir_basename, process_sample=process_sample,
+            load_results=load_results)
+        samples = np.random.uniform(-1.,1.,(2,8))
+        curdir = os.getcwd()
+        try:
+            vals = model(samples)
+            # each work directory is created in the working directory
+            workdirs = glob.glob(workdir_basename+'.*')
+            assert len(workdirs)==samples.shape[1]
+            for workdir in workdirs:
+                assert glob.glob(os.path.join(
+                    workdir,workdir_basename+'.*'))==[]
+        finally:
+            model.shutdown()
+            cleanup_work_directories(workdir_basename)
+        assert os.getcwd()==curdir
+        assert np.allclose(vals,2*samples.T)
+
 if __name__== "__main__":    
     async_model_test_suite = unittest.TestLoader().loadTestsFromTestCase(
          TestAsyncModel)
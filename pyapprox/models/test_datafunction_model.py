@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
-from pyapprox.models.wrappers import DataFunctionModel
+import os
+from pyapprox.models.wrappers import DataFunctionModel, ModelDataCache
 
 class ModelWithCounter(object):
     def __init__(self):
@@ -83,6 +84,92 @@ class TestDataFunctionModel(unittest.TestCase):
         assert submodel.counter==np.where(I>=num_samples)[0].shape[0]+counter
         assert np.allclose(values,submodel(samples))# increments counter
 
+    def test_cache_file(self):
+        num_vars=2
+        num_samples=10
+        cache_filename = 'data-function-model-cache.bin'
+        if os.path.exists(cache_filename):
+            os.remove(cache_filename)
+
+        submodel=ModelWithCounter()
+        model = DataFunctionModel(
+            submodel,None,cache_filename=cache_filename,save_frequency=3)
+        samples = np.random.uniform(-1.,1.,(num_vars,num_samples))
+        values = model(samples)
+        assert submodel.counter==num_samples
+
+        # create a new model that loads the data from file
+        model_1 = DataFunctionModel(submodel,cache_filename=cache_filename)
+        assert model_1.cache.nsamples==num_samples
+        new_samples = np.random.uniform(-1.,1.,(num_vars,num_samples))
+        samples_1 = np.hstack((samples,new_samples))
+        values_1 = model_1(samples_1)
+        assert submodel.counter==2*num_samples
+        assert np.allclose(values_1,submodel(samples_1))
+
+        model_2 = DataFunctionModel(submodel,cache_filename=cache_filename)
+        assert model_2.cache.nsamples==2*num_samples
+        assert np.allclose(model_2.samples,samples_1)
+        assert np.allclose(model_2.values,values_1)
+        os.remove(cache_filename)
+
+    def test_cache_file_with_partial_record(self):
+        num_vars=2
+        cache_filename = 'data-function-model-cache-partial.bin'
+        if os.path.exists(cache_filename):
+            os.remove(cache_filename)
+        try:
+            submodel=ModelWithCounter()
+            model = DataFunctionModel(submodel,cache_filename=cache_filename)
+            samples = np.random.uniform(-1.,1.,(num_vars,3))
+            model(samples)
+            # mimic a record only partially written before a crash
+            with open(cache_filename,'ab') as file_object:
+                file_object.write(b'12345')
+
+            model_1 = DataFunctionModel(submodel,cache_filename=cache_filename)
+            assert model_1.cache.nsamples==3
+            new_samples = np.random.uniform(-1.,1.,(num_vars,2))
+            model_1(new_samples)
+
+            model_2 = DataFunctionModel(submodel,cache_filename=cache_filename)
+            samples_1 = np.hstack((samples,new_samples))
+            assert model_2.cache.nsamples==5
+            assert np.allclose(model_2.samples,samples_1)
+            assert np.allclose(model_2.values,submodel(samples_1))
+
+            # data inconsistent with the header of the file cannot be
+            # appended even when the file contains no records
+            os.truncate(cache_filename,16)
+            cache = ModelDataCache(filename=cache_filename)
+            assert cache.nsamples==0
+            self.assertRaises(
+                Exception,cache.append,np.ones((num_vars+1,1)),np.ones((1,1)))
+            assert os.path.getsize(cache_filename)==16
+            cache.append(samples,submodel(samples))
+            assert np.allclose(
+                ModelDataCache(filename=cache_filename).samples,samples)
+        finally:
+            os.remove(cache_filename)
+
+    def test_model_data_cache_tolerance(self):
+        num_vars, num_samples = 3, 3000
+        cache = ModelDataCache(use_hash=False,tol=1e-8)
+        samples = np.random.uniform(-1.,1.,(num_vars,num_samples))
+        values = np.sum(samples**2,axis=0)[:,np.newaxis]
+        for ii in range(0,num_samples,100):
+            cache.append(samples[:,ii:ii+100],values[ii:ii+100])
+            # lookup rebuilds the KD-tree when enough samples are added
+            assert np.allclose(
+                cache.lookup(samples[:,:ii+100]+1e-10),np.arange(ii+100))
+        assert np.all(cache.lookup(samples+1e-6)==-1)
+        assert np.allclose(cache.values,values)
+
+        cache = ModelDataCache(use_hash=True)
+        cache.append(samples,values)
+        assert np.allclose(cache.lookup(samples),np.arange(num_samples))
+        assert np.all(cache.lookup(samples+1e-10)==-1)
+
 
 if __name__== "__main__":    
     data_function_model_test_suite=unittest.TestLoader().loadTestsFromTestCase(
@@ -56,6 +56,50 @@ class TestModelwrappers(unittest.TestCase):
         exact_values = function(samples)
         assert np.allclose(values,exact_values)
 
+    def test_pool_model_options(self):
+        num_vars = 3
+        max_eval_concurrency=min(multiprocessing.cpu_count(),4)
+        num_samples = 103
+        samples = np.random.uniform(0.,1.,(num_vars,num_samples))
+        exact_values = function(samples)
+        for pool_type in ['pool','process','thread']:
+            for max_eval_chunk_size in [1,10,200]:
+                for use_shared_memory in [False]+[True]*int(
+                        shared_memory_available()):
+                    with PoolModel(function,max_eval_concurrency,
+                                   assert_omp=False,
+                                   max_eval_chunk_size=max_eval_chunk_size,
+                                   pool_type=pool_type,
+                                   use_shared_memory=use_shared_memory) \
+                                   as model:
+                        values = model(samples)
+                        assert np.allclose(values,exact_values)
+                        # check the pool is reused
+                        pool = model.pool
+                        model.set_max_eval_concurrency(max_eval_concurrency)
+                        values = model(samples)
+                        assert model.pool is pool
+                        assert np.allclose(values,exact_values)
+                    assert model.pool is None
+
+    def test_pool_model_without_shared_memory(self):
+        # mimic python<3.8 where multiprocessing.shared_memory is missing
+        import sys
+        from unittest.mock import patch
+        with patch.dict(sys.modules,{'multiprocessing.shared_memory':None}):
+            assert not shared_memory_available()
+            self.assertRaises(
+                Exception,PoolModel,function,2,assert_omp=False,
+                use_shared_memory=True)
+            samples = np.random.uniform(0.,1.,(3,10))
+            self.assertRaises(
+                Exception,run_model_samples_in_parallel,function,2,samples,
+                assert_omp=False,use_shared_memory=True)
+            # shared memory is not used by threads
+            with PoolModel(function,2,assert_omp=False,pool_type='thread',
+                           use_shared_memory=True) as model:
+                assert np.allclose(model(samples),function(samples))
+
     def test_data_function_model(self):
         num_vars = 3
         data_basename='data_function-model-data'
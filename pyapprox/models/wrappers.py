@@ -134,35 +134,277 @@ def run_shell_command(shell_command, opts={}):
         subprocess.call(shell_command, shell=True, env=env)
 
 from pyapprox.utilities import hash_array
+class ModelDataCache(object):
+    """
+    Store the samples and values of a model so that they can be retrieved 
+    without re-evaluating the model.
+
+    The storage grows geometrically so adding samples one at a time has 
+    amortized constant cost. Samples are indexed either with a hash of their
+    values, which only matches samples that are exactly equal, or with a
+    KD-tree which matches samples within a tolerance.
+
+    Parameters
+    ----------
+    use_hash : boolean
+        True - samples match only if they are exactly equal
+        False - samples match if the maximum absolute difference between
+        their entries is no larger than tol
+
+    tol : float
+        The tolerance used to match samples when use_hash is False
+
+    filename : string
+        The name of a binary file to which all data added to the cache is
+        appended. If the file already exists its data is memory-mapped,
+        not read, when the cache is created and is only indexed the first 
+        time the cache is queried.
+    """
+    def __init__(self,use_hash=True,tol=1e-16,filename=None):
+        self.use_hash=use_hash
+        self.tol=tol
+        self.filename=filename
+        self.nsamples=0
+        self._samples=None
+        self._values=None
+        self._index=dict()
+        self._nindexed=0
+        self._tree=None
+        self._file_shape=None
+        if self.filename is not None and os.path.exists(self.filename):
+            self._load()
+
+    @property
+    def samples(self):
+        if self._samples is None:
+            return np.zeros((0,0))
+        return self._samples[:,:self.nsamples]
+
+    @property
+    def values(self):
+        if self._values is None:
+            return None
+        return self._values[:self.nsamples]
+
+    def _load(self):
+        header = np.fromfile(self.filename,dtype=np.int64,count=2)
+        if header.shape[0]<2:
+            # remove a partially written header so a new one is written
+            os.truncate(self.filename,0)
+            return
+        nvars, nqoi = header
+        self._file_shape = (nvars,nqoi)
+        record_size = (nvars+nqoi)*np.dtype(float).itemsize
+        # remove any partially written record at the end of the file so
+        # new records are appended at the correct offset
+        nrecords = (os.path.getsize(self.filename)-header.nbytes)//record_size
+        nbytes = header.nbytes+nrecords*record_size
+        if os.path.getsize(self.filename)>nbytes:
+            os.truncate(self.filename,nbytes)
+        if nrecords==0:
+            return
+        data = np.memmap(self.filename,dtype=float,mode='r',
+                         offset=header.nbytes,shape=(nrecords,nvars+nqoi))
+        self._samples = data[:,:nvars].T
+        self._values = data[:,nvars:]
+        self.nsamples = nrecords
+
+    def _save(self,samples,values):
+        if not os.path.exists(self.filename) or \
+           os.path.getsize(self.filename)==0:
+            header = np.array([samples.shape[0],values.shape[1]],
+                              dtype=np.int64)
+            with open(self.filename,'wb') as file_object:
+                file_object.write(header.tobytes())
+            self._file_shape = tuple(header)
+        with open(self.filename,'ab') as file_object:
+            file_object.write(
+                np.hstack([samples.T,values]).astype(float).tobytes())
+
+    def _reserve(self,nvars,nqoi,nsamples):
+        # data memory-mapped from file is copied into memory before it
+        # can be extended
+        if self._samples is not None and self._samples.shape[1]>=nsamples \
+           and not isinstance(self._samples,np.memmap):
+            return
+        capacity = max(nsamples,2*self.nsamples,16)
+        new_samples = np.empty((nvars,capacity),dtype=float)
+        new_values = np.empty((capacity,nqoi),dtype=float)
+        if self.nsamples>0:
+            new_samples[:,:self.nsamples] = self.samples
+            new_values[:self.nsamples] = self.values
+        self._samples, self._values = new_samples, new_values
+
+    def append(self,samples,values):
+        """
+        Add data to the cache. No check is made for samples that are 
+        already in the cache.
+
+        Parameters
+        ----------
+        samples : np.ndarray (nvars,nsamples)
+            The samples to add
+
+        values : np.ndarray (nsamples,nqoi)
+            The values of the model at each sample
+        """
+        assert samples.shape[1]==values.shape[0]
+        nnew_samples = samples.shape[1]
+        if nnew_samples==0:
+            return
+        if self.nsamples>0 and (samples.shape[0]!=self._samples.shape[0] or
+                                values.shape[1]!=self._values.shape[1]):
+            msg = 'samples and values are inconsistent with data in cache'
+            raise Exception(msg)
+        if (self.filename is not None and self._file_shape is not None and
+            self._file_shape!=(samples.shape[0],values.shape[1])):
+            msg = 'samples and values are inconsistent with the data in '
+            msg += f'{self.filename} which has (nvars,nqoi)='
+            msg += f'{self._file_shape}'
+            raise Exception(msg)
+        self._reserve(samples.shape[0],values.shape[1],
+                      self.nsamples+nnew_samples)
+        self._samples[:,self.nsamples:self.nsamples+nnew_samples] = samples
+        self._values[self.nsamples:self.nsamples+nnew_samples] = values
+        self.nsamples += nnew_samples
+        if self.filename is not None:
+            self._save(samples,values)
+
+    def _update_hash_index(self):
+        for ii in range(self._nindexed,self.nsamples):
+            key = hash_array(self._samples[:,ii])
+            if key not in self._index:
+                self._index[key]=ii
+        self._nindexed = self.nsamples
+
+    def _update_tree(self):
+        # Rebuilding the tree after a constant fraction of new samples have
+        # been added keeps the amortized cost of each addition logarithmic.
+        # Samples not in the tree are searched by brute force.
+        nbuffer = self.nsamples-self._nindexed
+        if nbuffer>max(1000,self._nindexed//4):
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.samples.T)
+            self._nindexed = self.nsamples
+
+    def unique_sample_indices(self,samples):
+        """
+        Return the indices of the first instance of each unique sample in
+        a set of samples, using the same matching criteria as the cache.
+        """
+        if samples.shape[1]==0:
+            return np.zeros((0),dtype=int)
+        if self.use_hash:
+            keys = set()
+            indices = []
+            for ii in range(samples.shape[1]):
+                key = hash_array(samples[:,ii])
+                if key not in keys:
+                    keys.add(key)
+                    indices.append(ii)
+            return np.asarray(indices,dtype=int)
+
+        from scipy.spatial import cKDTree
+        neighbors = cKDTree(samples.T).query_ball_point(
+            samples.T,r=self.tol,p=np.inf)
+        return np.asarray([ii for ii in range(samples.shape[1])
+                           if min(neighbors[ii])==ii],dtype=int)
+
+    def lookup(self,samples):
+        """
+        Find the position of samples in the cache.
+
+        Parameters
+        ----------
+        samples : np.ndarray (nvars,nsamples)
+            The samples to find
+
+        Returns
+        -------
+        indices : np.ndarray (nsamples)
+            The index of each sample in the cache. Samples not in the cache 
+            have index -1.
+        """
+        nsamples = samples.shape[1]
+        indices = -np.ones((nsamples),dtype=int)
+        if self.nsamples==0:
+            return indices
+        if self.use_hash:
+            self._update_hash_index()
+            for ii in range(nsamples):
+                indices[ii] = self._index.get(hash_array(samples[:,ii]),-1)
+            return indices
+
+        self._update_tree()
+        if self._tree is not None:
+            dists, idx = self._tree.query(
+                samples.T,k=1,p=np.inf,distance_upper_bound=self.tol)
+            found = np.isfinite(dists)
+            indices[found] = idx[found]
+        buffer_samples = self._samples[:,self._nindexed:self.nsamples]
+        if buffer_samples.shape[1]==0:
+            return indices
+        for ii in np.where(indices<0)[0]:
+            dists = np.absolute(
+                buffer_samples-samples[:,ii:ii+1]).max(axis=0)
+            jj = np.argmax(dists<=self.tol)
+            if dists[jj]<=self.tol:
+                indices[ii] = self._nindexed+jj
+        return indices
+
 class DataFunctionModel(object):
-    def hash_sample(self,sample):
-        # if samples have undergone a transformation thier value
-        # may not be exactly the same so make hash on samples
-        # with fixed precision
-        # sample = np.round(sample, self.digits)
-        # I = np.where(np.abs(sample)<self.tol)[0]
-        # sample[I] = 0.
-        key = hash_array(sample)#,decimals=self.digits)
-        return key
-    
+    """
+    Evaluate a function and store the samples and values so that the 
+    function is never evaluated at the same sample twice.
+
+    Parameters
+    ----------
+    function : callable
+        A function with signature
+
+        ``function(w) -> np.ndarray (nsamples,nqoi)``
+
+        where ``w`` is a np.ndarray of shape (nvars,nsamples).
+
+    data : tuple (np.ndarray (nvars,nsamples), np.ndarray (nsamples,nqoi))
+        Samples and values of the function already computed
+
+    data_basename : string
+        The basename of the .npz files to which new data is saved every
+        save_frequency evaluations. Data in existing files with this
+        basename is loaded when the object is created.
+
+    save_frequency : integer
+        The number of samples evaluated between saves.
+
+    use_hash : boolean
+        True - samples match only if they are exactly equal
+        False - samples match if they are within 10**(-digits) of each other
+
+    cache_filename : string
+        The name of a single binary file to which all new data is appended.
+        Existing data in this file is loaded lazily. This is much faster
+        than saving many .npz files when the number of samples is large.
+    """
     def __init__(self,function,data=None,data_basename=None,
-                 save_frequency=None,use_hash=True,digits=16):
+                 save_frequency=None,use_hash=True,digits=16,
+                 cache_filename=None):
         self.function=function
 
-        self.data=dict()
-        self.samples=np.zeros((0,0))
-        self.values=None
         self.num_evaluations_ran=0
         self.num_evaluations=0 
         self.digits = digits
         self.tol = 10**(-self.digits)
         self.use_hash=use_hash
+        self.cache = ModelDataCache(self.use_hash,self.tol,cache_filename)
+        self.num_evaluations_ran = self.cache.nsamples
 
         self.data_basename = data_basename
         self.save_frequency=save_frequency
         if self.data_basename is not None:
             assert save_frequency is not None
-        if self.save_frequency and self.data_basename is None:
+        if (self.save_frequency and self.data_basename is None and
+            cache_filename is None):
             msg = 'Warning save_frequency not being used because data_basename'
             msg += ' is None'
             print(msg)
@@ -173,88 +415,60 @@ class DataFunctionModel(object):
                 self.add_new_data(file_data)
             
         if data is not None:
-            self.samples,self.values=data
-            assert self.samples.shape[1]==self.values.shape[0]
+            assert data[0].shape[1]==data[1].shape[0]
             self.add_new_data(data)
 
+    @property
+    def samples(self):
+        return self.cache.samples
+
+    @property
+    def values(self):
+        return self.cache.values
 
     def add_new_data(self,data):
         samples,values=data
-        for ii in range(samples.shape[1]):
-            if self.use_hash:
-                key = self.hash_sample(samples[:,ii])
-                if key in self.data:
-                    if not np.allclose(self.values[self.data[key]],values[ii]):
-                        msg = 'Duplicate samples found but values do not match'
-                        raise Exception(msg)
-                    found=True
-                else:
-                    self.data[key]=ii
-                    found=False
-            else:
-                found = False
-                for jj in range(self.samples.shape[1]):
-                    if np.allclose(self.samples[:,jj],samples[:,ii],
-                                   atol=self.tol):
-                        found = True
-                        break
-            if not found:
-                if self.samples.shape[1]>0:
-                    self.samples=np.hstack([self.samples,samples[:,ii:ii+1]])
-                    self.values=np.vstack([self.values,values[ii:ii+1,:]])
-                else:
-                    self.samples=samples[:,ii:ii+1]
-                    self.values=values[ii:ii+1,:]
+        indices = self.cache.lookup(samples)
+        found = indices>=0
+        if np.any(found) and not np.allclose(
+                self.values[indices[found]],values[found]):
+            msg = 'Duplicate samples found but values do not match'
+            raise Exception(msg)
+        new_sample_indices = np.where(~found)[0]
+        # do not add samples repeated within data more than once
+        new_sample_indices = new_sample_indices[
+            self.cache.unique_sample_indices(samples[:,new_sample_indices])]
+        self.cache.append(samples[:,new_sample_indices],
+                          values[new_sample_indices])
                                            
         # set counter so that next file takes into account all previously
         # ran samples
-        self.num_evaluations_ran=self.samples.shape[1]
+        self.num_evaluations_ran=self.cache.nsamples
 
     def _batch_call(self,samples):
         assert self.save_frequency>0
         num_batch_samples = self.save_frequency
         lb = 0
-        vals = None
+        vals = []
         while lb<samples.shape[1]:
             ub = min(lb+num_batch_samples,samples.shape[1])
             num_evaluations_ran=self.num_evaluations_ran
             batch_vals, new_sample_indices = self._call(samples[:,lb:ub])
-            data_filename = self.data_basename+'-%d-%d.npz'%(
-                num_evaluations_ran,
-                num_evaluations_ran+len(new_sample_indices)-1)
-            np.savez(data_filename,vals=batch_vals[new_sample_indices],
-                     samples=samples[:,lb:ub][:,new_sample_indices])
-            if vals is None:
-                vals = batch_vals
-            else:
-                vals = np.vstack((vals,batch_vals))
+            if self.data_basename is not None:
+                data_filename = self.data_basename+'-%d-%d.npz'%(
+                    num_evaluations_ran,
+                    num_evaluations_ran+len(new_sample_indices)-1)
+                np.savez(data_filename,vals=batch_vals[new_sample_indices],
+                         samples=samples[:,lb:ub][:,new_sample_indices])
+            vals.append(batch_vals)
             lb=ub
-        return vals
+        return np.vstack(vals)
 
     def _call(self,samples):
-        evaluated_sample_indices = []
-        new_sample_indices = []
-        for ii in range(samples.shape[1]):
-            if self.use_hash:
-                key = self.hash_sample(samples[:,ii])
-                if key in self.data:
-                    evaluated_sample_indices.append([ii,self.data[key]])
-                else:
-                    new_sample_indices.append(ii)
-            else:
-                found = False
-                for jj in range(self.samples.shape[1]):
-                    if np.allclose(self.samples[:,jj],samples[:,ii],
-                                   atol=self.tol):
-                        found = True
-                        break
-                if found:
-                    evaluated_sample_indices.append([ii,jj])
-                else:
-                    new_sample_indices.append(ii)
-                    
-        evaluated_sample_indices = np.asarray(evaluated_sample_indices)
-        if len(new_sample_indices)>0:
+        indices = self.cache.lookup(samples)
+        new_sample_indices = np.where(indices<0)[0]
+        evaluated_sample_indices = np.where(indices>=0)[0]
+        if new_sample_indices.shape[0]>0:
             new_samples = samples[:,new_sample_indices]
             new_values  = self.function(new_samples)
             num_qoi = new_values.shape[1]
@@ -262,28 +476,13 @@ class DataFunctionModel(object):
             num_qoi = self.values.shape[1]
 
         values = np.empty((samples.shape[1],num_qoi),dtype=float)
-        if len(new_sample_indices)>0:
+        if new_sample_indices.shape[0]>0:
             values[new_sample_indices,:]=new_values
-        if len(new_sample_indices)<samples.shape[1]:
-            values[evaluated_sample_indices[:,0]] = \
-                self.values[evaluated_sample_indices[:,1],:]
-
-        if len(new_sample_indices)>0:
-            if self.samples.shape[1]==0:
-                jj=0
-                self.samples=samples
-                self.values=values
-            else:
-                jj=self.samples.shape[0]
-                self.samples=np.hstack(
-                    (self.samples,samples[:,new_sample_indices]))
-                self.values=np.vstack((self.values,new_values))
+            self.cache.append(new_samples,new_values)
+            self.num_evaluations_ran+=new_sample_indices.shape[0]
+        values[evaluated_sample_indices] = \
+            self.values[indices[evaluated_sample_indices],:]
 
-            for ii in range(len(new_sample_indices)):
-                key = hash_array(samples[:,new_sample_indices[ii]])
-                self.data[key]=jj+ii
-
-            self.num_evaluations_ran+=len(new_sample_indices)
         # increment the number of samples pass to __call__ since object created
         # includes samples drawn from arxiv and samples used to evaluate
         # self.function
@@ -299,15 +498,101 @@ class DataFunctionModel(object):
         return values
 
 
+def shared_memory_available():
+    """
+    Return True if multiprocessing.shared_memory, which was added in
+    python 3.8, can be imported.
+    """
+    import importlib
+    try:
+        importlib.import_module('multiprocessing.shared_memory')
+    except ImportError:
+        return False
+    return True
+
+def check_shared_memory_available():
+    if not shared_memory_available():
+        msg = 'use_shared_memory=True requires multiprocessing.shared_memory '
+        msg += 'which is only available for python>=3.8. '
+        msg += 'Set use_shared_memory=False'
+        raise Exception(msg)
+
+def get_samples_from_shared_memory(shm_name,shape,lb,ub):
+    """
+    Copy the columns lb:ub of an array of samples stored in shared memory.
+    """
+    from multiprocessing import shared_memory, resource_tracker
+    # the process that created the shared memory is responsible for 
+    # unlinking it, so stop this process from tracking it
+    try:
+        # track was added in python 3.13
+        shm = shared_memory.SharedMemory(name=shm_name,track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        # shared memory is only tracked on POSIX systems where it is
+        # registered with the name prefixed by a slash
+        if os.name!='nt':
+            resource_tracker.unregister('/'+shm.name,'shared_memory')
+    samples = np.ndarray(shape,dtype=float,buffer=shm.buf)[:,lb:ub].copy()
+    shm.close()
+    return samples
+
+def evaluate_model_on_samples_chunk(model,chunk,shared_samples_info=None):
+    """
+    Evaluate a model on a contiguous block of samples.
+
+    Parameters
+    ----------
+    chunk : tuple (lb,ub,samples)
+        The column indices lb:ub of the block and the samples of the block.
+        If samples is None the samples are read from shared memory.
+
+    shared_samples_info : tuple (shm_name,shape)
+        The name of the shared memory block storing all the samples and the 
+        shape of the array of samples.
+    """
+    lb, ub, samples = chunk
+    if samples is None:
+        samples = get_samples_from_shared_memory(
+            shared_samples_info[0],shared_samples_info[1],lb,ub)
+    return lb, ub, model(samples)
+
 def run_model_samples_in_parallel(model,max_eval_concurrency,samples,pool=None,
-                                  assert_omp=True):
+                                  assert_omp=True,max_eval_chunk_size=1,
+                                  use_shared_memory=False):
     """
+    Evaluate a model at a set of samples in parallel.
+
+    Parameters
+    ----------
+    pool : multiprocessing.Pool or concurrent.futures.Executor
+        The pool used to evaluate the model. If None a multiprocessing.Pool
+        is created and closed once all samples are evaluated.
+
+    max_eval_chunk_size : integer
+        The number of samples passed to each call of the model. Increasing
+        the chunk size reduces the cost of communication for models that 
+        can be evaluated at many samples at once.
+
+    use_shared_memory : boolean
+        If True the samples are passed to the worker processes via 
+        shared memory rather than being serialized. This option is ignored
+        if pool is a concurrent.futures.ThreadPoolExecutor. Requires
+        python>=3.8
+
+    Returns
+    -------
+    values : np.ndarray (nsamples,nqoi)
+        The values of the model at each sample. Values are stored as the
+        evaluations of each chunk complete.
+
     Warning
     -------
     pool.map serializes each argument and so if model is a class, 
     any of its member variables that are updated in __call__ will not
     persist once each __call__ to pool completes.
     """
+    from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
     num_samples = samples.shape[1]
     if assert_omp and max_eval_concurrency>1:
         if ('OMP_NUM_THREADS' not in os.environ or
@@ -315,15 +600,49 @@ def run_model_samples_in_parallel(model,max_eval_concurrency,samples,pool=None,
             msg = 'User set assert_omp=True but OMP_NUM_THREADS has not been '
             msg += 'set to 1. Run script with OMP_NUM_THREADS=1 python script.py'
             raise Exception(msg)
-        
+
+    close_pool = pool is None
     if pool is None:
         pool = Pool(max_eval_concurrency)
-    result = pool.map(
-        model,[(samples[:,ii:ii+1]) for ii in range(samples.shape[1])])
-    num_qoi = result[0].shape[1]
-    values = np.empty((num_samples,num_qoi))
-    for ii in range(len(result)):
-        values[ii,:]=result[ii][0,:]
+
+    if isinstance(pool,ThreadPoolExecutor):
+        use_shared_memory = False
+
+    shm, shared_samples_info = None, None
+    if use_shared_memory:
+        check_shared_memory_available()
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(
+            create=True,size=max(samples.size*np.dtype(float).itemsize,1))
+        shared_samples = np.ndarray(samples.shape,dtype=float,buffer=shm.buf)
+        shared_samples[:] = samples
+        shared_samples_info = (shm.name,samples.shape)
+
+    chunks = []
+    for lb in range(0,num_samples,max_eval_chunk_size):
+        ub = min(lb+max_eval_chunk_size,num_samples)
+        chunks.append((lb,ub,None if use_shared_memory else samples[:,lb:ub]))
+
+    fun = partial(evaluate_model_on_samples_chunk,model,
+                  shared_samples_info=shared_samples_info)
+    try:
+        if isinstance(pool,Executor):
+            futures = [pool.submit(fun,chunk) for chunk in chunks]
+            results = (future.result() for future in as_completed(futures))
+        else:
+            results = pool.imap_unordered(fun,chunks)
+        values = None
+        for lb, ub, chunk_values in results:
+            if values is None:
+                values = np.empty((num_samples,chunk_values.shape[1]))
+            values[lb:ub,:] = chunk_values
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        if close_pool:
+            pool.close()
+            pool.join()
     return values
 
 
@@ -525,7 +844,8 @@ class WorkTrackingModel(object):
         
 class PoolModel(object):
     def __init__(self,function,max_eval_concurrency,assert_omp=True,
-                 base_model=None):
+                 base_model=None,max_eval_chunk_size=1,pool_type='pool',
+                 use_shared_memory=False):
         
         """
         Evaluate a function at multiple samples in parallel using 
@@ -566,17 +886,44 @@ class PoolModel(object):
              base_model and algorithms or the user want access to the attribtes
              of the base_model.
 
+        max_eval_chunk_size : integer
+            The number of samples passed to each call of function. Use values
+            larger than one for cheap functions that can evaluate many 
+            samples at once.
+
+        pool_type : string
+            The type of pool used to evaluate the function.
+            'pool' - multiprocessing.Pool
+            'process' - concurrent.futures.ProcessPoolExecutor
+            'thread' - concurrent.futures.ThreadPoolExecutor
+
+        use_shared_memory : boolean
+            If True pass the samples to the worker processes using shared 
+            memory. Requires python>=3.8
+
         Notes
         -----
         If defining a custom __getattr__ it seems I cannot have member
         variables with the same name in this class and class definition
         of function
+
+        The pool of workers persists between calls. Call shutdown(), or 
+        use the object as a context manager, to release the workers.
         """
         self.base_model=base_model
+        self.pool_type=pool_type
+        if self.pool_type not in ['pool','process','thread']:
+            raise Exception(f'pool_type {pool_type} not supported')
+        self.pool=None
+        self.max_eval_concurrency=None
         self.set_max_eval_concurrency(max_eval_concurrency)
         self.num_evaluations=0
         self.assert_omp=assert_omp
         self.pool_function=function
+        self.max_eval_chunk_size=max_eval_chunk_size
+        if use_shared_memory and pool_type!='thread':
+            check_shared_memory_available()
+        self.use_shared_memory=use_shared_memory
 
     def set_max_eval_concurrency(self,max_eval_concurrency):
         """
@@ -589,8 +936,45 @@ class PoolModel(object):
             Should be no more than the maximum number of cores on the computer 
             being used
         """
+        if (self.pool is not None and
+            max_eval_concurrency==self.max_eval_concurrency):
+            return
+        self.shutdown()
         self.max_eval_concurrency=max_eval_concurrency
-        self.pool = Pool(self.max_eval_concurrency)
+
+    def get_pool(self):
+        """
+        Return the pool of workers, creating it if it does not exist.
+        """
+        if self.pool is None:
+            if self.pool_type=='pool':
+                self.pool = Pool(self.max_eval_concurrency)
+            elif self.pool_type=='process':
+                from concurrent.futures import ProcessPoolExecutor
+                self.pool = ProcessPoolExecutor(self.max_eval_concurrency)
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                self.pool = ThreadPoolExecutor(self.max_eval_concurrency)
+        return self.pool
+
+    def shutdown(self):
+        """
+        Release the workers used to evaluate the function.
+        """
+        if self.pool is None:
+            return
+        if self.pool_type=='pool':
+            self.pool.close()
+            self.pool.join()
+        else:
+            self.pool.shutdown(wait=True)
+        self.pool=None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.shutdown()
 
     def __call__(self,samples):
         """
@@ -604,7 +988,9 @@ class PoolModel(object):
         """
         vals = run_model_samples_in_parallel(
             self.pool_function,self.max_eval_concurrency,samples,
-            pool=self.pool,assert_omp=self.assert_omp)
+            pool=self.get_pool(),assert_omp=self.assert_omp,
+            max_eval_chunk_size=self.max_eval_chunk_size,
+            use_shared_memory=self.use_shared_memory)
         return vals
 
 from pyapprox.utilities import get_all_sample_combinations
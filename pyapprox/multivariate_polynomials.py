@@ -5,7 +5,8 @@ from pyapprox.utilities import cartesian_product, outer_product
 from pyapprox.orthonormal_polynomials_1d import \
      jacobi_recurrence, evaluate_orthonormal_polynomial_deriv_1d, \
      hermite_recurrence, krawtchouk_recurrence, hahn_recurrence, \
-     discrete_chebyshev_recurrence, evaluate_orthonormal_polynomial_1d
+     discrete_chebyshev_recurrence, evaluate_orthonormal_polynomial_1d, \
+     use_numba_polynomial_kernels, get_numba_polynomial_kernels
 from pyapprox.monomial import monomial_basis_matrix
 from pyapprox.numerically_generate_orthonormal_polynomials_1d import lanczos, \
     modified_chebyshev_orthonormal
@@ -14,6 +15,7 @@ from pyapprox.utilities import \
 from pyapprox.probability_measure_sampling import \
     generate_independent_random_samples
 from pyapprox.manipulate_polynomials import add_polynomials
+from pyapprox.instrumentation import timed
 
 def precompute_multivariate_orthonormal_polynomial_univariate_values(samples,indices,recursion_coeffs,deriv_order,basis_type_index_map):
     num_vars = indices.shape[0]
@@ -41,35 +43,78 @@ def precompute_multivariate_orthonormal_polynomial_univariate_values(samples,ind
     return basis_vals_1d
 
 def evaluate_multivariate_orthonormal_polynomial_values(
-        indices,basis_vals_1d,num_samples):
+        indices,basis_vals_1d,num_samples,values=None):
+    """
+    Compute the values of multivariate polynomials from the values of the 
+    univariate polynomials returned by 
+    precompute_multivariate_orthonormal_polynomial_univariate_values.
+
+    The product over each dimension is accumulated in place so only one 
+    temporary array of size (num_indices,num_samples) is created.
+
+    Parameters
+    ----------
+    values : np.ndarray (num_samples,num_indices)
+        Array used to store the values. If None a new array is created. 
+        Can be a view of a larger preallocated or memory mapped array.
+    """
     num_vars,num_indices = indices.shape
-    temp1 = basis_vals_1d.reshape((num_vars*basis_vals_1d.shape[1],num_samples))
-    temp2 = temp1[indices.ravel()+np.repeat(np.arange(num_vars)*basis_vals_1d.shape[1],num_indices),:].reshape(num_vars,num_indices,num_samples)
-    values = np.prod(temp2,axis=0).T
+    if values is None:
+        values = np.empty((num_samples,num_indices))
+    if use_numba_polynomial_kernels(num_samples):
+        kernels = get_numba_polynomial_kernels()
+        kernels.numba_evaluate_multivariate_orthonormal_polynomial_values(
+            np.asarray(indices,dtype=np.int64),
+            np.ascontiguousarray(basis_vals_1d.transpose(2,0,1)),
+            np.asarray(values))
+        return values
+    temp = np.empty((num_indices,num_samples))
+    np.take(basis_vals_1d[0],indices[0],axis=0,out=temp)
+    values[:] = temp.T
+    for dd in range(1,num_vars):
+        np.take(basis_vals_1d[dd],indices[dd],axis=0,out=temp)
+        values *= temp.T
     return values
 
-def evaluate_multivariate_orthonormal_polynomial_derivs(indices,max_level_1d,basis_vals_1d,num_samples,deriv_order):
-    # TODO Consider combining
-    # evaluate_multivariate_orthonormal_polynomial_values and derivs and
-    # evaluate_multivariate_orthonormal_polynomial_derivs beecause they both
-    # compute temp2
-    
+def evaluate_multivariate_orthonormal_polynomial_derivs(
+        indices,max_level_1d,basis_vals_1d,num_samples,deriv_order,
+        derivs=None):
+    """
+    Compute the derivatives of multivariate polynomials from the values of 
+    the univariate polynomials and their derivatives returned by 
+    precompute_multivariate_orthonormal_polynomial_univariate_values.
+
+    Parameters
+    ----------
+    derivs : np.ndarray (num_vars*num_samples,num_indices)
+        Array used to store the derivatives. If None a new array is created.
+    """
     assert deriv_order==1
     num_vars,num_indices = indices.shape
-
-    #extract derivatives
-    temp1 = basis_vals_1d.reshape((num_vars*basis_vals_1d.shape[1],num_samples))
-    temp2 = temp1[indices.ravel()+np.repeat(np.arange(num_vars)*basis_vals_1d.shape[1],num_indices),:].reshape(num_vars,num_indices,num_samples)
-    values = np.prod(temp2,axis=0).T
-    # derivs are stored immeadiately after values in basis_vals_1d
-    # if max_level_1d[dd]!=max_level_1d.max() then there will be some
-    # uninitialized values at the end of the array but these are never accessed
-    temp3 = temp1[indices.ravel()+np.repeat(max_level_1d+1+np.arange(num_vars)*basis_vals_1d.shape[1],num_indices),:].reshape(num_vars,num_indices,num_samples)
-
-    derivs = np.empty((num_samples*num_vars,num_indices))
+    if derivs is None:
+        derivs = np.empty((num_samples*num_vars,num_indices))
+    if use_numba_polynomial_kernels(num_samples):
+        kernels = get_numba_polynomial_kernels()
+        kernels.numba_evaluate_multivariate_orthonormal_polynomial_derivs(
+            np.asarray(indices,dtype=np.int64),
+            np.asarray(max_level_1d,dtype=np.int64),
+            np.ascontiguousarray(basis_vals_1d.transpose(2,0,1)),
+            np.asarray(derivs))
+        return derivs
+    temp = np.empty((num_indices,num_samples))
     for jj in range(num_vars):
-        derivs[(jj)*num_samples:(jj+1)*num_samples] = (np.prod(temp2[:jj],axis=0)*np.prod(temp2[jj+1:],axis=0)*temp3[jj]).T
-
+        derivs_jj = derivs[jj*num_samples:(jj+1)*num_samples]
+        # derivs are stored immeadiately after values in basis_vals_1d
+        # if max_level_1d[dd]!=max_level_1d.max() then there will be some
+        # uninitialized values at the end of the array but these are never
+        # accessed
+        np.take(basis_vals_1d[jj],indices[jj]+max_level_1d[jj]+1,axis=0,
+                out=temp)
+        derivs_jj[:] = temp.T
+        for dd in range(num_vars):
+            if dd!=jj:
+                np.take(basis_vals_1d[dd],indices[dd],axis=0,out=temp)
+                derivs_jj *= temp.T
     return derivs
 
 def precompute_multivariate_orthonormal_polynomial_univariate_values_deprecated(samples,indices,recursion_coeffs,deriv_order,basis_type_index_map):
@@ -123,7 +168,7 @@ def evaluate_multivariate_orthonormal_polynomial_derivs_deprecated(indices,max_l
 
 def evaluate_multivariate_orthonormal_polynomial(
         samples,indices,recursion_coeffs,deriv_order=0,
-        basis_type_index_map=None):
+        basis_type_index_map=None,max_chunk_size=None,out=None):
 
     """
     Evaluate a multivaiate orthonormal polynomial and its s-derivatives 
@@ -144,9 +189,18 @@ def evaluate_multivariate_orthonormal_polynomial(
     deriv_order : integer in [0,1]
        The maximum order of the derivatives to evaluate.
 
+    max_chunk_size : integer
+        The maximum number of samples evaluated at once. Peak memory is
+        proportional to max_chunk_size*num_indices. If None all samples
+        are evaluated at once.
+
+    out : np.ndarray ((1+deriv_order*num_vars)*num_samples,num_indices)
+        Array used to store the values, e.g. a np.memmap when the values
+        do not fit in memory. If None a new array is created.
+
     Return
     ------
-    values : np.ndarray (1+deriv_order*num_samples,num_indices)
+    values : np.ndarray ((1+deriv_order*num_vars)*num_samples,num_indices)
         The values of the polynomials at the samples
     """
     num_vars, num_indices = indices.shape
@@ -178,20 +232,150 @@ def evaluate_multivariate_orthonormal_polynomial(
     # compute_values =  evaluate_multivariate_orthonormal_polynomial_values_deprecated
     # compute_derivs = evaluate_multivariate_orthonormal_polynomial_derivs_deprecated
 
-    basis_vals_1d = precompute_values(
-        samples,indices,recursion_coeffs,deriv_order,basis_type_index_map)
-    
     num_samples = samples.shape[1]
-    values = compute_values(indices,basis_vals_1d,num_samples)
+    if out is None:
+        out = np.empty(((1+deriv_order*num_vars)*num_samples,num_indices))
+    if max_chunk_size is None:
+        max_chunk_size = num_samples
+
+    for lb in range(0,num_samples,max_chunk_size):
+        ub = min(lb+max_chunk_size,num_samples)
+        basis_vals_1d = precompute_values(
+            samples[:,lb:ub],indices,recursion_coeffs,deriv_order,
+            basis_type_index_map)
+        compute_values(indices,basis_vals_1d,ub-lb,out[lb:ub])
+        if deriv_order==0:
+            continue
+        if ub-lb==num_samples:
+            compute_derivs(
+                indices,max_level_1d,basis_vals_1d,num_samples,deriv_order,
+                out[num_samples:])
+            continue
+        derivs = compute_derivs(
+            indices,max_level_1d,basis_vals_1d,ub-lb,deriv_order)
+        for jj in range(num_vars):
+            out[(jj+1)*num_samples+lb:(jj+1)*num_samples+ub]=\
+                derivs[jj*(ub-lb):(jj+1)*(ub-lb)]
+        
+    return out
 
-    if deriv_order==0:
-        return values
+def generate_multivariate_orthonormal_polynomial_chunks(
+        samples,indices,recursion_coeffs,max_chunk_size,deriv_order=0,
+        basis_type_index_map=None):
+    """
+    Evaluate a multivariate orthonormal polynomial and its derivatives
+    at blocks of samples.
 
-    derivs = compute_derivs(
-        indices,max_level_1d,basis_vals_1d,num_samples,deriv_order)
-    values = np.vstack([values,derivs])
-        
-    return values
+    Yields
+    ------
+    lb : integer
+        The index of the first sample in the block
+
+    ub : integer
+        The index after the last sample in the block
+
+    values : np.ndarray ((1+deriv_order*num_vars)*(ub-lb),num_indices)
+        The output of evaluate_multivariate_orthonormal_polynomial at
+        samples[:,lb:ub]
+    """
+    num_samples = samples.shape[1]
+    for lb in range(0,num_samples,max_chunk_size):
+        ub = min(lb+max_chunk_size,num_samples)
+        yield lb, ub, evaluate_multivariate_orthonormal_polynomial(
+            samples[:,lb:ub],indices,recursion_coeffs,deriv_order,
+            basis_type_index_map)
+
+def get_coefficient_contraction_plan(indices):
+    """
+    Compute the information needed to evaluate a polynomial expansion by
+    summing over the coefficients one dimension at a time.
+
+    The indices are sorted lexiographically so that all indices sharing
+    the same first d entries (prefix) are stored contiguously. Terms with the
+    same prefix share the product of their univariate basis functions
+    in the first d dimensions so the sum over the remaining dimensions
+    can be computed once per prefix.
+
+    Parameters
+    ----------
+    indices : np.ndarray (num_vars,num_indices)
+        The exponents of each polynomial term
+
+    Returns
+    -------
+    sorted_idx : np.ndarray (num_indices)
+        The permutation that sorts the indices lexiographically
+
+    sorted_indices : np.ndarray (num_vars,num_indices)
+        The sorted indices
+
+    prefix_starts : np.ndarray (num_vars+1,num_indices)
+        prefix_starts[d,ii] is True if the ii-th sorted index is the first
+        index with its prefix of length d
+    """
+    num_vars, num_indices = indices.shape
+    # lexsort uses the last key as the primary key
+    sorted_idx = np.lexsort(indices[::-1])
+    sorted_indices = indices[:,sorted_idx]
+    prefix_starts = np.zeros((num_vars+1,num_indices),dtype=bool)
+    prefix_starts[:,0] = True
+    changes = np.diff(sorted_indices,axis=1)!=0
+    prefix_starts[1:,1:] = np.logical_or.accumulate(changes,axis=0)
+    return sorted_idx, sorted_indices, prefix_starts
+
+def evaluate_expansion_by_coefficient_contraction(
+        basis_vals_1d, coefficients, plan):
+    """
+    Evaluate a polynomial expansion by summing over the coefficients one
+    dimension at a time, starting with the last dimension, without forming
+    the basis matrix.
+
+    The memory required is proportional to num_samples*num_qoi times the
+    number of unique prefixes of length num_vars-1 of the indices, which is
+    less than the num_samples*num_indices required by the basis matrix.
+
+    Parameters
+    ----------
+    basis_vals_1d : np.ndarray (num_vars,max_level+1,num_samples)
+        The values of the univariate basis functions returned by
+        precompute_multivariate_orthonormal_polynomial_univariate_values
+
+    coefficients : np.ndarray (num_indices,num_qoi)
+        The coefficients of the expansion
+
+    plan : tuple
+        The output of get_coefficient_contraction_plan
+
+    Returns
+    -------
+    values : np.ndarray (num_samples,num_qoi)
+        The values of the expansion at the samples
+    """
+    sorted_idx, sorted_indices, prefix_starts = plan
+    num_vars = sorted_indices.shape[0]
+    num_qoi = coefficients.shape[1]
+
+    # sum over the last dimension by storing the coefficients of each prefix
+    # of length num_vars-1 in a dense array. The product with the basis
+    # values is then a single matrix multiplication
+    prefix_ids = np.cumsum(prefix_starts[num_vars-1])-1
+    last_indices = sorted_indices[num_vars-1]
+    num_last_basis = last_indices.max()+1
+    dense_coefs = np.zeros((prefix_ids[-1]+1,num_last_basis,num_qoi))
+    dense_coefs[prefix_ids,last_indices] = coefficients[sorted_idx]
+    # values has shape (num_prefixes,num_qoi,num_samples)
+    values = np.tensordot(
+        dense_coefs,basis_vals_1d[num_vars-1,:num_last_basis],axes=(1,0))
+
+    for dd in range(num_vars-2,-1,-1):
+        # multiply each prefix of length dd+1 by the basis function
+        # of its last entry then sum over prefixes with the same entries
+        # in the first dd dimensions
+        prefix_idx = np.where(prefix_starts[dd+1])[0]
+        values *= basis_vals_1d[dd,sorted_indices[dd,prefix_idx]][:,None,:]
+        values = np.add.reduceat(
+            values,np.where(prefix_starts[dd,prefix_idx])[0],axis=0)
+    return values[0].T
 
 def get_recursion_coefficients(
         opts,
@@ -399,9 +583,33 @@ class PolynomialChaosExpansion(object):
             self.update_recursion_coefficients(max_degree+1,self.config_opts)
             self.max_degree=max_degree
 
+    @timed('basis_matrix')
     def basis_matrix(self,samples,opts=dict()):
+        """
+        Evaluate the basis of the polynomial chaos expansion
+
+        Parameters
+        ----------
+        samples : np.ndarray (num_vars,num_samples)
+            The samples at which to evaluate the basis
+
+        opts : dictionary
+            Options. 'deriv_order' (integer in [0,1]) the order of the 
+            derivatives computed. 'max_chunk_size' (integer) the maximum
+            number of samples evaluated at once. 'out' (np.ndarray) a 
+            preallocated, possibly memory mapped, array used to store the
+            basis matrix.
+
+        Returns
+        -------
+        basis_matrix : np.ndarray ((1+deriv_order*num_vars)*num_samples,
+                                   num_indices)
+            The values and derivatives of the basis at the samples
+        """
         assert samples.ndim==2
         assert samples.shape[0]==self.num_vars()
+        if 'max_chunk_size' in opts or 'out' in opts:
+            return self.chunked_basis_matrix(samples,opts)
         canonical_samples = self.var_trans.map_to_canonical_space(
             samples)
         basis_matrix = self.canonical_basis_matrix(canonical_samples,opts)
@@ -412,6 +620,52 @@ class PolynomialChaosExpansion(object):
                 basis_matrix[samples.shape[1]:,:])
         return basis_matrix
 
+    def basis_matrix_chunks(self,samples,max_chunk_size,opts=dict()):
+        """
+        Evaluate the basis of the polynomial chaos expansion at blocks of 
+        samples so that the entire basis matrix is never stored in memory.
+
+        Yields
+        ------
+        lb : integer
+            The index of the first sample in the block
+
+        ub : integer
+            The index after the last sample in the block
+
+        basis_matrix : np.ndarray ((1+deriv_order*num_vars)*(ub-lb),
+                                   num_indices)
+            The basis matrix evaluated at samples[:,lb:ub]
+        """
+        chunk_opts = opts.copy()
+        for name in ['max_chunk_size','out']:
+            chunk_opts.pop(name,None)
+        num_samples = samples.shape[1]
+        for lb in range(0,num_samples,max_chunk_size):
+            ub = min(lb+max_chunk_size,num_samples)
+            yield lb, ub, self.basis_matrix(samples[:,lb:ub],chunk_opts)
+
+    def chunked_basis_matrix(self,samples,opts):
+        num_samples = samples.shape[1]
+        max_chunk_size = opts.get('max_chunk_size',None)
+        if max_chunk_size is None:
+            max_chunk_size = num_samples
+        num_blocks = 1+opts.get('deriv_order',0)*self.num_vars()
+        out = opts.get('out',None)
+        if out is None:
+            out = np.empty((num_blocks*num_samples,self.indices.shape[1]))
+        assert out.shape==(num_blocks*num_samples,self.indices.shape[1])
+        assert out.dtype==float
+        for lb, ub, basis_matrix in self.basis_matrix_chunks(
+                samples,max_chunk_size,opts):
+            nchunk_samples = ub-lb
+            # values are followed by the derivatives with respect to each
+            # variable so each chunk contributes to num_blocks row blocks
+            for kk in range(num_blocks):
+                out[kk*num_samples+lb:kk*num_samples+ub] = basis_matrix[
+                    kk*nchunk_samples:(kk+1)*nchunk_samples]
+        return out
+
     def canonical_basis_matrix(self,canonical_samples,opts=dict()):
         deriv_order = opts.get('deriv_order',0)
         if self.recursion_coeffs[0] is not None:
@@ -444,9 +698,46 @@ class PolynomialChaosExpansion(object):
         return self.indices.copy()
 
     def value(self,samples):
+        if self.recursion_coeffs[0] is not None:
+            return self.value_using_coefficient_contraction(samples)
         basis_matrix = self.basis_matrix(samples)
         return np.dot(basis_matrix,self.coefficients)
 
+    def value_using_coefficient_contraction(self,samples,max_chunk_size=1000):
+        """
+        Evaluate the polynomial chaos expansion without forming the basis 
+        matrix by summing over the coefficients one dimension at a time.
+        See evaluate_expansion_by_coefficient_contraction.
+
+        Parameters
+        ----------
+        samples : np.ndarray (num_vars,num_samples)
+            The samples at which to evaluate the expansion
+
+        max_chunk_size : integer
+            The maximum number of samples evaluated at once.
+
+        Returns
+        -------
+        values : np.ndarray (num_samples,num_qoi)
+            The values of the expansion at the samples
+        """
+        assert samples.ndim==2
+        assert samples.shape[0]==self.num_vars()
+        canonical_samples = self.var_trans.map_to_canonical_space(samples)
+        plan = get_coefficient_contraction_plan(self.indices)
+        num_samples = samples.shape[1]
+        values = np.empty((num_samples,self.coefficients.shape[1]))
+        for lb in range(0,num_samples,max_chunk_size):
+            ub = min(lb+max_chunk_size,num_samples)
+            basis_vals_1d = \
+                precompute_multivariate_orthonormal_polynomial_univariate_values(
+                    canonical_samples[:,lb:ub],self.indices,
+                    self.recursion_coeffs,0,self.basis_type_index_map)
+            values[lb:ub] = evaluate_expansion_by_coefficient_contraction(
+                basis_vals_1d,self.coefficients,plan)
+        return values
+
     def num_vars(self):
         return self.var_trans.num_vars()
 
@@ -0,0 +1,125 @@
+"""
+Compiled, multithreaded implementations of the polynomial evaluation
+kernels in orthonormal_polynomials_1d.py and multivariate_polynomials.py.
+
+Each kernel loops over samples in parallel and releases the GIL. This
+module requires numba. Use get_numba_polynomial_kernels in
+orthonormal_polynomials_1d.py to access it only if numba is installed.
+"""
+import numpy as np
+from math import lgamma, exp, log
+import numba
+from numba import njit, prange
+
+# The threading layer numba chooses by default, TBB if it is installed, is
+# not fork safe and python hangs on exit if a fork based multiprocessing.Pool,
+# e.g. used by PoolModel, is created after these kernels are run. Unless the
+# user has chosen a threading layer use the fork safe workqueue layer. This
+# must be set before the first parallel kernel is run. The workqueue layer
+# cannot be used by more than one thread at once so these kernels are only
+# used by the main thread, see use_numba_polynomial_kernels.
+if numba.config.THREADING_LAYER == 'default':
+    numba.config.THREADING_LAYER = 'workqueue'
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def numba_evaluate_orthonormal_polynomial_deriv_1d(x, nmax, ab, deriv_order):
+    """
+    Evaluate the univariate orthonormal polynomials and its s-derivatives
+    (s=1,...,num_derivs) using a three-term recurrence coefficients.
+
+    See evaluate_orthonormal_polynomial_deriv_1d
+    """
+    num_samples = x.shape[0]
+    num_indices = nmax+1
+    result = np.empty((num_samples, num_indices*(deriv_order+1)))
+
+    # the s-th derivative of the degree s polynomial is constant
+    consts = np.zeros(deriv_order+1)
+    for deriv_num in range(1, deriv_order+1):
+        bsum = 0.
+        for jj in range(deriv_num+1):
+            bsum += log(ab[jj, 1]**2)
+        # use following expression to avoid overflow issues
+        consts[deriv_num] = exp(lgamma(deriv_num+1)-0.5*bsum)
+
+    for ii in prange(num_samples):
+        result[ii, 0] = 1/ab[0, 1]
+        if nmax > 0:
+            result[ii, 1] = 1/ab[1, 1]*((x[ii]-ab[0, 0])*result[ii, 0])
+        for jj in range(2, nmax+1):
+            result[ii, jj] = 1/ab[jj, 1]*(
+                (x[ii]-ab[jj-1, 0])*result[ii, jj-1] -
+                ab[jj-1, 1]*result[ii, jj-2])
+
+        for deriv_num in range(1, deriv_order+1):
+            # offsets of the current and previous derivatives
+            kk = deriv_num*num_indices
+            ll = kk-num_indices
+            for jj in range(min(deriv_num, num_indices)):
+                result[ii, kk+jj] = 0.
+            if deriv_num < num_indices:
+                result[ii, kk+deriv_num] = consts[deriv_num]
+            for jj in range(deriv_num+1, num_indices):
+                result[ii, kk+jj] = (
+                    (x[ii]-ab[jj-1, 0])*result[ii, kk+jj-1] -
+                    ab[jj-1, 1]*result[ii, kk+jj-2] +
+                    deriv_num*result[ii, ll+jj-1])/ab[jj, 1]
+    return result
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def numba_evaluate_multivariate_orthonormal_polynomial_values(
+        indices, basis_vals_1d, values):
+    """
+    Compute the values of multivariate polynomials from the values of the
+    univariate polynomials.
+
+    Parameters
+    ----------
+    indices : np.ndarray (num_vars,num_indices)
+        The exponents of each polynomial term
+
+    basis_vals_1d : np.ndarray (num_samples,num_vars,max_level+1)
+        The values of the univariate polynomials
+
+    values : np.ndarray (num_samples,num_indices)
+        Array used to store the values
+    """
+    num_vars, num_indices = indices.shape
+    num_samples = basis_vals_1d.shape[0]
+    for ii in prange(num_samples):
+        for kk in range(num_indices):
+            val = basis_vals_1d[ii, 0, indices[0, kk]]
+            for dd in range(1, num_vars):
+                val *= basis_vals_1d[ii, dd, indices[dd, kk]]
+            values[ii, kk] = val
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def numba_evaluate_multivariate_orthonormal_polynomial_derivs(
+        indices, max_level_1d, basis_vals_1d, derivs):
+    """
+    Compute the first derivatives of multivariate polynomials from the
+    values and derivatives of the univariate polynomials.
+
+    Parameters
+    ----------
+    basis_vals_1d : np.ndarray (num_samples,num_vars,2*(max_level+1))
+        The values of the univariate polynomials followed by their
+        derivatives
+
+    derivs : np.ndarray (num_vars*num_samples,num_indices)
+        Array used to store the derivatives
+    """
+    num_vars, num_indices = indices.shape
+    num_samples = basis_vals_1d.shape[0]
+    for ii in prange(num_samples):
+        for jj in range(num_vars):
+            for kk in range(num_indices):
+                val = basis_vals_1d[
+                    ii, jj, max_level_1d[jj]+1+indices[jj, kk]]
+                for dd in range(num_vars):
+                    if dd != jj:
+                        val *= basis_vals_1d[ii, dd, indices[dd, kk]]
+                derivs[jj*num_samples+ii, kk] = val
@@ -0,0 +1,41 @@
+"""
+Compiled implementations of the smoothed Heaviside and max functions used
+by the disutility stochastic dominance formulations in
+stochastic_dominance.py. This module requires numba and is only imported
+when a smoother_type=2 function is first evaluated because numba is slow to
+import.
+"""
+import numpy as np
+from numba import jit
+
+
+@jit(nopython=True)
+def numba_smooth_left_heaviside_function_type2(x, eps):
+    vals = np.ones_like(x)
+    for ii in range(x.shape[0]):
+        for jj in range(x.shape[1]):
+            if (x[ii, jj]<0 and x[ii, jj]>-eps):
+                vals[ii, jj] = 6*(-x[ii, jj]/eps)**2-8*(-x[ii, jj]/eps)**3+\
+                    3*(-x[ii, jj]/eps)**4
+            elif (x[ii, jj]>=0):
+                vals[ii, jj] = 0
+    return vals
+
+@jit(nopython=True)
+def numba_smooth_left_heaviside_function_first_derivative_type2(x, eps):
+    vals = np.zeros_like(x)
+    for ii in range(x.shape[0]):
+        for jj in range(x.shape[1]):
+            if (x[ii, jj]<0 and x[ii, jj]>-eps):
+                vals[ii, jj] = 12*x[ii, jj]*(eps+x[ii, jj])**2/eps**4
+    return vals
+
+@jit(nopython=True)
+def numba_smooth_min_function_third_derivative_type2(x, eps):
+    vals = np.zeros_like(x)
+    for ii in range(x.shape[0]):
+        for jj in range(x.shape[1]):
+            if (x[ii, jj]<0 and x[ii, jj]>-eps):
+                vals[ii, jj] = 12*(eps**2+4*eps*x[ii, jj]+3*x[ii, jj]**2)/eps**4
+    return vals
+    
@@ -1,12 +1,21 @@
 import numpy as np
 from scipy.linalg import solve_triangular
 import copy
+from functools import partial
+
+# The maximum number of entries num_factors*num_factors*num_design_pts of the
+# outer products of the design factors formed by AlphabetOptimalDesign.
+# Above this number the criteria are computed directly from the design
+# factors. Set to np.inf to always form the outer products and to 0 to never
+# form them.
+max_outer_products_size = 10**6
 
 def compute_prediction_variance(design_prob_measure,pred_factors,
                                 homog_outer_prods,noise_multiplier=None,
-                                regression_type='lstsq'):
+                                regression_type='lstsq',design_factors=None):
     M0,M1=get_M0_and_M1_matrices(
-        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type)
+        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type,
+        design_factors)
     u = np.linalg.solve(M1,pred_factors.T)
     if M0 is not None:
         M0u = M0.dot(u)
@@ -38,16 +47,80 @@ def compute_homoscedastic_outer_products(factors):
        The outer products of each row of F with itself, i.e. 
        :math:`f(x_i)f(x_i)^T`
     """
+    return factors.T[:,np.newaxis,:]*factors.T[np.newaxis,:,:]
+
+def compute_weighted_sum_of_outer_products(factors,weights):
+    r"""
+    Compute
+
+    .. math:: \sum_{i=1}^M w_i f(x_i)f(x_i)^T = F^T\mathrm{diag}(w)F
+
+    without forming the outer products :math:`f(x_i)f(x_i)^T`.
+
+    Parameters
+    ----------
+    factors : np.ndarray (M,N)
+        The N factors F of the linear model evaluated at the M design pts
+
+    weights : np.ndarray (M)
+        The weights :math:`w_i` of each design point
+
+    Returns
+    -------
+    matrix : np.ndarray (N,N)
+        The weighted sum of the outer products
+    """
+    return (factors.T*weights).dot(factors)
+
+def compute_quadratic_forms_of_factors(factors,matrix):
+    r"""
+    Compute the quadratic forms
+
+    .. math:: f(x_i)^TAf(x_i)=\mathrm{trace}\left[Af(x_i)f(x_i)^T\right]
+              \quad \forall i=1,\ldots,M
+
+    without forming the outer products :math:`f(x_i)f(x_i)^T`.
+
+    Parameters
+    ----------
+    factors : np.ndarray (M,N)
+        The N factors F of the linear model evaluated at the M design pts
+
+    matrix : np.ndarray (N,N)
+        The matrix :math:`A`
+
+    Returns
+    -------
+    values : np.ndarray (M)
+        The quadratic form evaluated at each design point
+    """
+    return np.sum(factors.dot(matrix.T)*factors,axis=1)
+
+def get_homoscedastic_outer_products(factors):
+    r"""
+    Return the outer products computed by
+    :func:`compute_homoscedastic_outer_products` if they have no more than
+    ``max_outer_products_size`` entries, otherwise return None so that the
+    optimality criteria are computed directly from the factors.
+
+    Parameters
+    ---------
+    factors : np.ndarray (M,N)
+        The N factors F of the linear model evaluated at the M design pts
+
+    Returns
+    -------
+    homoscedastic_outer_products : np.ndarray (N,N,M)
+       The outer products of each row of F with itself or None
+    """
     num_design_pts,num_factors = factors.shape
-    homoscedastic_outer_products = np.empty(
-        (num_factors,num_factors,num_design_pts),dtype=float)
-    for ii in range(num_design_pts):
-        homoscedastic_outer_products[:,:,ii]=np.outer(
-            factors[ii,:],factors[ii,:])
-    return homoscedastic_outer_products
+    if num_factors**2*num_design_pts>max_outer_products_size:
+        return None
+    return compute_homoscedastic_outer_products(factors)
 
 def get_M0_and_M1_matrices(
-        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type):
+        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type,
+        design_factors=None):
     r"""
     Compute the matrices :math:`M_0` and :math:`M_1` used to compute the
     asymptotic covariance matrix :math:`C(\mu) = M_1^{-1} M_0 M^{-1}` of the
@@ -71,7 +144,9 @@ def get_M0_and_M1_matrices(
     ----------
     homog_outer_prods : np.ndarray(num_factors,num_factors,num_design_pts)
         The outer products :math:`f(x_i)f(x_i)^T` for each design point 
-        :math:`x_i`
+        :math:`x_i`. If None the matrices are computed directly from
+        ``design_factors`` as :math:`F^T\mathrm{diag}(r)F` which avoids
+        storing num_factors*num_factors*num_design_pts entries.
 
     design_prob_measure : np.ndarray (num_design_pts)
         The weights :math:`r_i` for each design point
@@ -83,6 +158,10 @@ def get_M0_and_M1_matrices(
         The method used to compute the coefficients of the linear model. 
         Currently supported options are ``lstsq`` and ``quantile``.
 
+    design_factors : np.ndarray (num_design_pts,num_factors)
+        The design factors evaluated at each of the design points. Only
+        used if homog_outer_prods is None.
+
     Returns
     -------
     M0 : np.ndarray (num_factors,num_factors)
@@ -92,15 +171,25 @@ def get_M0_and_M1_matrices(
         The matrix :math:`M_1`
     
     """
+    if homog_outer_prods is None:
+        if design_factors is None:
+            msg = 'design_factors must be provided if homog_outer_prods '
+            msg += 'is None'
+            raise Exception(msg)
+        weighted_sum = partial(
+            compute_weighted_sum_of_outer_products,design_factors)
+    else:
+        weighted_sum = homog_outer_prods.dot
+        
     if noise_multiplier is None:
-        return None, homog_outer_prods.dot(design_prob_measure)
+        return None, weighted_sum(design_prob_measure)
     
     if regression_type=='lstsq':
-        M0 = homog_outer_prods.dot(design_prob_measure*noise_multiplier**2)
-        M1 = homog_outer_prods.dot(design_prob_measure)
+        M0 = weighted_sum(design_prob_measure*noise_multiplier**2)
+        M1 = weighted_sum(design_prob_measure)
     elif regression_type=='quantile':
-        M0 = homog_outer_prods.dot(design_prob_measure)
-        M1 = homog_outer_prods.dot(design_prob_measure/noise_multiplier)
+        M0 = weighted_sum(design_prob_measure)
+        M1 = weighted_sum(design_prob_measure/noise_multiplier)
     else:
         msg = f'regression type {regression_type} not supported'
         raise Exception(msg)
@@ -130,6 +219,7 @@ def ioptimality_criterion(homog_outer_prods,design_factors,
                                     num_design_pts)
        The outer_products :math:`f(x_i)f(x_i)^T` for each design point 
        :math:`x_i`
+       If None the criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -168,7 +258,8 @@ def ioptimality_criterion(homog_outer_prods,design_factors,
         assert design_prob_measure.shape[1]==1
         design_prob_measure = design_prob_measure[:,0]
     M0,M1=get_M0_and_M1_matrices(
-        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type)
+        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type,
+        design_factors)
     if noise_multiplier is not None:
         Q,R = np.linalg.qr(M1)
         u = solve_triangular(R,Q.T.dot(pred_factors.T))
@@ -234,6 +325,7 @@ def coptimality_criterion(homog_outer_prods,design_factors,
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
        The hessian M_1 of the error for each design point
+       If None the criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -266,7 +358,8 @@ def coptimality_criterion(homog_outer_prods,design_factors,
         assert design_prob_measure.shape[1]==1
         design_prob_measure = design_prob_measure[:,0]
     M0,M1=get_M0_and_M1_matrices(
-        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type)
+        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type,
+        design_factors)
     if noise_multiplier is not None:
         Q,R = np.linalg.qr(M1)
         u = solve_triangular(R,Q.T.dot(c))
@@ -320,6 +413,7 @@ def doptimality_criterion(homog_outer_prods,design_factors,
                                     num_design_pts)
        The outer_products :math:`f(x_i)f(x_i)^T` for each design point 
        :math:`x_i`
+       If None the criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -354,7 +448,8 @@ def doptimality_criterion(homog_outer_prods,design_factors,
         design_prob_measure = design_prob_measure[:,0]
     #M1 = homog_outer_prods.dot(design_prob_measure)
     M0,M1=get_M0_and_M1_matrices(
-        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type)
+        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type,
+        design_factors)
     M1_inv = np.linalg.inv(M1)
     if noise_multiplier is not None:
         gamma = M0.dot(M1_inv)
@@ -434,6 +529,7 @@ def aoptimality_criterion(homog_outer_prods,design_factors,
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
        The hessian M_1 of the error for each design point
+       If None the criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -467,25 +563,25 @@ def aoptimality_criterion(homog_outer_prods,design_factors,
         assert design_prob_measure.shape[1]==1
         design_prob_measure = design_prob_measure[:,0]
     M0,M1=get_M0_and_M1_matrices(
-        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type)
+        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type,
+        design_factors)
     M1_inv = np.linalg.inv(M1)
     if noise_multiplier is not None:
         gamma = M0.dot(M1_inv)
         value = np.trace(M1_inv.dot(gamma))
         if (return_grad):
-            ident = np.eye(gamma.shape[0])
-            M0_inv = np.linalg.inv(M0)
-            kappa  = M1.dot(M0_inv)
-            gradient = np.zeros(num_design_pts)
-            for ii in range(num_design_pts):
-                if regression_type=='lstsq':
-                    gradient[ii]=np.trace(
-                        M1_inv.dot(homog_outer_prods[:,:,ii]).dot(
-                        -2*gamma.T+noise_multiplier[ii]**2*ident).dot(M1_inv))
-                elif regression_type=='quantile':
-                    gradient[ii]=np.trace(
-                        M1_inv.dot(homog_outer_prods[:,:,ii]).dot(
-                        -2*gamma.T/noise_multiplier[:,np.newaxis][ii]+ident).dot(M1_inv))            
+            # trace(M1_inv.dot(f_i f_i^T).dot(B_i).dot(M1_inv)) is the
+            # quadratic form f_i^T B_i M1_inv^2 f_i so the outer products
+            # f_i f_i^T are never needed
+            temp = M1_inv.dot(M1_inv)
+            gamma_quad_forms = compute_quadratic_forms_of_factors(
+                design_factors,gamma.T.dot(temp))
+            quad_forms = compute_quadratic_forms_of_factors(
+                design_factors,temp)
+            if regression_type=='lstsq':
+                gradient = -2*gamma_quad_forms+noise_multiplier**2*quad_forms
+            elif regression_type=='quantile':
+                gradient = -2*gamma_quad_forms/noise_multiplier+quad_forms
             return value, gradient.T
         else:
             return value
@@ -526,6 +622,7 @@ def roptimality_criterion(beta,homog_outer_prods,design_factors,
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
        The hessian M_1 of the error for each design point
+       If None the criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -565,7 +662,8 @@ def roptimality_criterion(beta,homog_outer_prods,design_factors,
         assert design_prob_measure.shape[1]==1
         design_prob_measure = design_prob_measure[:,0]
     M0,M1=get_M0_and_M1_matrices(
-        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type)
+        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type,
+        design_factors)
     if noise_multiplier is not None:
         Q,R = np.linalg.qr(M1)
         u = solve_triangular(R,Q.T.dot(pred_factors.T))
@@ -626,6 +724,7 @@ def goptimality_criterion(homog_outer_prods,design_factors,
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
        The hessian M_1 of the error for each design point
+       If None the criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -661,7 +760,8 @@ def goptimality_criterion(homog_outer_prods,design_factors,
         assert design_prob_measure.shape[1]==1
         design_prob_measure = design_prob_measure[:,0]
     M0,M1=get_M0_and_M1_matrices(
-        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type)
+        homog_outer_prods,design_prob_measure,noise_multiplier,regression_type,
+        design_factors)
     if noise_multiplier is not None:
         Q,R = np.linalg.qr(M1)
         u = solve_triangular(R,Q.T.dot(pred_factors.T))
@@ -698,7 +798,6 @@ def goptimality_criterion(homog_outer_prods,design_factors,
         return value, gradient.T
 
 from scipy.optimize import Bounds, minimize, LinearConstraint, NonlinearConstraint
-from functools import partial
 
 def minimax_oed_objective(x):
     return x[0]
@@ -878,7 +977,7 @@ class AlphabetOptimalDesign(object):
 
     def solve(self,options=None,init_design=None,return_full=False):
         num_design_pts = self.design_factors.shape[0]
-        homog_outer_prods = compute_homoscedastic_outer_products(
+        homog_outer_prods = get_homoscedastic_outer_products(
             self.design_factors)
 
         objective,jac = self.get_objective_and_jacobian(
@@ -975,7 +1074,7 @@ class AlphabetOptimalDesign(object):
         for ii in range(parameter_samples.shape[1]):
             design_factors = self.design_factors(
                 parameter_samples[:,ii],design_samples)
-            homog_outer_prods = compute_homoscedastic_outer_products(
+            homog_outer_prods = get_homoscedastic_outer_products(
                 design_factors)
             opts = copy.deepcopy(self.opts)
             if opts is not None and 'pred_factors' in opts:
@@ -989,8 +1088,8 @@ class AlphabetOptimalDesign(object):
                 assert noise_multiplier.ndim==1
                 assert noise_multiplier.shape[0]==design_samples.shape[1]
             obj,jac = self.get_objective_and_jacobian(
-                design_factors.copy(),homog_outer_prods.copy(),
-                noise_multiplier,copy.deepcopy(opts))
+                design_factors.copy(),homog_outer_prods,noise_multiplier,
+                copy.deepcopy(opts))
             constraint_obj = partial(minimax_oed_constraint_objective,obj)
             constraint_jac = partial(minimax_oed_constraint_jacobian,jac)
             constraint = NonlinearConstraint(
@@ -1075,7 +1174,7 @@ class AlphabetOptimalDesign(object):
         for ii in range(parameter_samples.shape[1]):
             design_factors = self.design_factors(
                 parameter_samples[:,ii],design_samples)
-            homog_outer_prods = compute_homoscedastic_outer_products(
+            homog_outer_prods = get_homoscedastic_outer_products(
                 design_factors)
             if self.noise_multiplier is None:
                 noise_multiplier=None
@@ -1089,12 +1188,12 @@ class AlphabetOptimalDesign(object):
                 opts['pred_factors']=opts['pred_factors'](
                     parameter_samples[:,ii],opts['pred_samples'])
             obj,jac = self.get_objective_and_jacobian(
-                design_factors.copy(),homog_outer_prods.copy(),
-                noise_multiplier,copy.deepcopy(opts))
+                design_factors.copy(),homog_outer_prods,noise_multiplier,
+                copy.deepcopy(opts))
             objs.append(obj)
             jacs.append(jac)
             
-        num_design_pts = homog_outer_prods.shape[2]
+        num_design_pts = design_samples.shape[1]
         return objs,jacs,num_design_pts
 
     def solve_nonlinear_bayesian(self,samples,design_samples,
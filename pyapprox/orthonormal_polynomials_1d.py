@@ -2,6 +2,35 @@ from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 import numpy as np
 from scipy import special as sp
+from functools import lru_cache
+import threading
+
+# The minimum number of samples for which the multithreaded numba kernels
+# are used, when numba is installed, to evaluate polynomials. Below this
+# number the cost of starting threads outweighs the benefit.
+# Set to np.inf to disable the numba kernels.
+numba_min_num_samples = 1000
+
+@lru_cache(maxsize=None)
+def get_numba_polynomial_kernels():
+    """
+    Return the module containing the numba implementations of the 
+    polynomial evaluation kernels or None if numba is not installed.
+    numba is only imported when this function is first called because
+    it is slow to import.
+    """
+    try:
+        from pyapprox import numba_polynomial_kernels
+        return numba_polynomial_kernels
+    except ImportError:
+        return None
+
+def use_numba_polynomial_kernels(num_samples):
+    # the numba threading layer used is not thread safe so only use the
+    # kernels from the main thread
+    return (num_samples>=numba_min_num_samples and
+            threading.current_thread() is threading.main_thread() and
+            get_numba_polynomial_kernels() is not None)
 
 def charlier_recurrence(N, a):
     r"""
@@ -426,6 +455,11 @@ def evaluate_orthonormal_polynomial_deriv_1d(x, nmax, ab, deriv_order):
     #warnings.filterwarnings("ignore", message="numpy.ndarray size changed")
 
     x = np.asarray(x,dtype=float)
+    if use_numba_polynomial_kernels(x.shape[0]):
+        kernels = get_numba_polynomial_kernels()
+        return kernels.numba_evaluate_orthonormal_polynomial_deriv_1d(
+            x, nmax, np.asarray(ab,dtype=float), deriv_order)
+
     from pyapprox.cython.orthonormal_polynomials_1d import \
         evaluate_orthonormal_polynomial_deriv_1d_pyx
     return evaluate_orthonormal_polynomial_deriv_1d_pyx(
@@ -1,11 +1,10 @@
 #!/usr/bin/env python
 import numpy as np
-import matplotlib.pyplot as plt
 try:
     import ROL
     from ROL.numpy_vector import NumpyVector
     has_ROL = True
-except:
+except ImportError:
     has_ROL = False
 from scipy.optimize import LinearConstraint, NonlinearConstraint, Bounds, \
     OptimizeResult, BFGS
@@ -13,69 +12,70 @@ from scipy.optimize import minimize as scipy_minimize
 from functools import partial
 
 
-class ROLObj(ROL.Objective):
-    def __init__(self, fun, jac, hess=None, hessp=None):
-        ROL.Objective.__init__(self)
-        self.fun = fun
-        self.jac = jac
-        self.hess = hess
-        self.hessp = hessp
-
-        assert callable(self.jac)
-        if self.hessp is not None and self.hess is not None:
-            raise Exception
-        if self.hess is not None:
-            assert callable(self.hess)
-            self.hessVec = self._hessVec
-        if self.hessp is not None:
-            assert callable(self.hessp)
-            self.hessVec = self._hesspVec
-
-    def value(self, x, tol):
-        return self.fun(x.data)
-
-    def gradient(self, g, x, tol):
-        grad = self.jac(x.data)
-        g.data = grad
-
-    def _hessVec(self, hv, v, x, tol):
-        res = self.hess(x.data).dot(v.data)
-        hv.data = res
-
-    def _hesspVec(self, hv, v, x, tol):
-        hv.data = self.hessp(x.data, v.data)
-
-
-class ROLConstraint(ROL.Constraint):
-    def __init__(self, fun, jac, hessp=None):
-        super().__init__()
-        self.fun = fun
-        self.jac = jac
-        self.hessp = hessp
-        
-        assert callable(self.jac)
-        if self.hessp is not None:
-            assert callable(self.hessp)
-            #self.applyAdjointHessian = self._applyAdjointHessian
-
-    def value(self, cvec, x, tol):
-        vals = self.fun(x.data)
-        cvec.data = vals
-
-    def applyJacobian(self, jv, v, x, tol):
-        res = self.jac(x.data).dot(v.data)
-        jv.data = res
-  
-    def applyAdjointJacobian(self, jv, v, x, tol):
-        res = self.jac(x.data).T.dot(v.data)
-        jv.data = res
-
-    def applyAdjointHessian(self, ahuv, u, v, x, tol):
-        # x : optimization variables
-        # u : Lagrange multiplier (size of number of constraints)
-        # v : vector (size of x)
-        res = self.hessp(x.data, u.data).dot(v.data)
-        ahuv.data = res
+if has_ROL:
+    class ROLObj(ROL.Objective):
+        def __init__(self, fun, jac, hess=None, hessp=None):
+            ROL.Objective.__init__(self)
+            self.fun = fun
+            self.jac = jac
+            self.hess = hess
+            self.hessp = hessp
+
+            assert callable(self.jac)
+            if self.hessp is not None and self.hess is not None:
+                raise Exception
+            if self.hess is not None:
+                assert callable(self.hess)
+                self.hessVec = self._hessVec
+            if self.hessp is not None:
+                assert callable(self.hessp)
+                self.hessVec = self._hesspVec
+
+        def value(self, x, tol):
+            return self.fun(x.data)
+
+        def gradient(self, g, x, tol):
+            grad = self.jac(x.data)
+            g.data = grad
+
+        def _hessVec(self, hv, v, x, tol):
+            res = self.hess(x.data).dot(v.data)
+            hv.data = res
+
+        def _hesspVec(self, hv, v, x, tol):
+            hv.data = self.hessp(x.data, v.data)
+
+
+    class ROLConstraint(ROL.Constraint):
+        def __init__(self, fun, jac, hessp=None):
+            super().__init__()
+            self.fun = fun
+            self.jac = jac
+            self.hessp = hessp
+
+            assert callable(self.jac)
+            if self.hessp is not None:
+                assert callable(self.hessp)
+                #self.applyAdjointHessian = self._applyAdjointHessian
+
+        def value(self, cvec, x, tol):
+            vals = self.fun(x.data)
+            cvec.data = vals
+
+        def applyJacobian(self, jv, v, x, tol):
+            res = self.jac(x.data).dot(v.data)
+            jv.data = res
+
+        def applyAdjointJacobian(self, jv, v, x, tol):
+            res = self.jac(x.data).T.dot(v.data)
+            jv.data = res
+
+        def applyAdjointHessian(self, ahuv, u, v, x, tol):
+            # x : optimization variables
+            # u : Lagrange multiplier (size of number of constraints)
+            # v : vector (size of x)
+            res = self.hessp(x.data, u.data).dot(v.data)
+            ahuv.data = res
 
 
 def linear_constraint_fun(A, x):
@@ -1,13 +1,14 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 import numpy as np
-import matplotlib.pyplot as plt
 from pyapprox.utilities import cartesian_product, outer_product, hash_array
 from pyapprox.indexing import nchoosek, compute_hyperbolic_level_indices, \
     argsort_indices_lexiographically_by_row
 from pyapprox.barycentric_interpolation import compute_barycentric_weights_1d,\
      multivariate_barycentric_lagrange_interpolation, \
-     multivariate_hierarchical_barycentric_lagrange_interpolation
+     multivariate_hierarchical_barycentric_lagrange_interpolation, \
+     evaluate_univariate_barycentric_lagrange_basis, \
+     tensor_product_barycentric_lagrange_interpolation_from_basis
 def get_1d_samples_weights(quad_rules,growth_rules,
                            levels,config_variables_idx=None,
                            unique_rule_indices=None):
@@ -507,26 +508,90 @@ def get_subspace_values_using_dictionary(values,subspace_poly_indices,
     return subspace_values
 
 
-def evaluate_sparse_grid_subspace(samples,subspace_index,subspace_values,
-                                  samples_1d,config_variables_idx,output):
+def compute_subspace_barycentric_weights_1d(abscissa_1d):
+    """
+    Compute the barycentric weights of a univariate interpolation rule
+    used by a tensor-product subspace of a sparse grid.
+    """
+    interval_length=2
+    if abscissa_1d.shape[0]>1:
+        interval_length=abscissa_1d.max()-abscissa_1d.min()
+    return compute_barycentric_weights_1d(
+        abscissa_1d,interval_length=interval_length)
+
+def update_sparse_grid_barycentric_weights_1d(samples_1d,
+                                              barycentric_weights_1d=None,
+                                              unique_rule_indices=None):
+    """
+    Compute the barycentric weights of every level of the univariate
+    interpolation rules of a sparse grid.
+
+    Only the levels not already stored in barycentric_weights_1d are computed,
+    so the weights can be updated cheaply after the sparse grid is refined.
+
+    Parameters
+    ----------
+    samples_1d : [[np.ndarray]*num_vars]
+        List of univariate samples for each level and each variable
+
+    barycentric_weights_1d : [[np.ndarray]*num_vars]
+        The barycentric weights already computed. If None all weights are
+        computed.
 
+    unique_rule_indices : list
+        The variables which share the same univariate rule. If provided
+        the weights are computed once for each unique rule and shared by
+        all variables that use that rule.
+
+    Returns
+    -------
+    barycentric_weights_1d : [[np.ndarray]*num_vars]
+        The barycentric weights for each level and each variable
+    """
+    num_vars = len(samples_1d)
+    if barycentric_weights_1d is None:
+        barycentric_weights_1d = [[] for dd in range(num_vars)]
+    if unique_rule_indices is None:
+        unique_rule_indices = [[dd] for dd in range(num_vars)]
+
+    for indices in unique_rule_indices:
+        # all variables using the same rule have the same samples
+        index = indices[0]
+        for ll in range(len(barycentric_weights_1d[index]),
+                        len(samples_1d[index])):
+            weights = compute_subspace_barycentric_weights_1d(
+                samples_1d[index][ll])
+            for kk in indices:
+                barycentric_weights_1d[kk].append(weights)
+    return barycentric_weights_1d
+
+def evaluate_sparse_grid_subspace(samples,subspace_index,subspace_values,
+                                  samples_1d,config_variables_idx,output,
+                                  barycentric_weights_1d=None):
+    """
+    Parameters
+    ----------
+    barycentric_weights_1d : [[np.ndarray]*num_vars]
+        Precomputed barycentric weights for each level and each variable.
+        If None the weights are computed on the fly.
+    """
     if config_variables_idx is None:
         config_variables_idx = samples.shape[0]
     
     active_sample_vars = np.where(subspace_index[:config_variables_idx]>0)[0]
     num_active_sample_vars = active_sample_vars.shape[0]
-    
+
+    subspace_barycentric_weights_1d = []
     abscissa_1d = []
-    barycentric_weights_1d = []
     for dd in range(num_active_sample_vars):
         active_idx=active_sample_vars[dd]
         abscissa_1d.append(samples_1d[active_idx][subspace_index[active_idx]])
-        interval_length=2
-        if abscissa_1d[dd].shape[0]>1:
-            interval_length=abscissa_1d[dd].max()-abscissa_1d[dd].min()
-        barycentric_weights_1d.append(
-            compute_barycentric_weights_1d(
-                abscissa_1d[dd],interval_length=interval_length))
+        if barycentric_weights_1d is None:
+            subspace_barycentric_weights_1d.append(
+                compute_subspace_barycentric_weights_1d(abscissa_1d[dd]))
+        else:
+            subspace_barycentric_weights_1d.append(
+                barycentric_weights_1d[active_idx][subspace_index[active_idx]])
 
     #for dd in len(barycentric_weights_1d):
     #    I = np.argsort(barycentric_weights_1d[dd])
@@ -542,7 +607,7 @@ def evaluate_sparse_grid_subspace(samples,subspace_index,subspace_values,
             print (subspace_values)
         return np.tile(subspace_values,(samples.shape[1],1))
     poly_vals = multivariate_barycentric_lagrange_interpolation( 
-        samples,abscissa_1d,barycentric_weights_1d,subspace_values,
+        samples,abscissa_1d,subspace_barycentric_weights_1d,subspace_values,
         active_sample_vars)
     if output:
         print(('sub',subspace_index,poly_vals))
@@ -557,7 +622,8 @@ def evaluate_sparse_grid(samples, values,
                          sparse_grid_subspace_poly_indices_list,
                          smolyak_coefficients,samples_1d,
                          sparse_grid_subspace_values_indices_list,
-                         config_variables_idx=None,output=False):
+                         config_variables_idx=None,output=False,
+                         barycentric_weights_1d=None):
 
     num_vars, num_samples = samples.shape
     assert values.ndim==2
@@ -590,10 +656,147 @@ def evaluate_sparse_grid(samples, values,
                 values,sparse_grid_subspace_values_indices_list[ii])
             subspace_approx_vals = evaluate_sparse_grid_subspace(
                 samples,subspace_index,subspace_values,
-                samples_1d,config_variables_idx,output)
+                samples_1d,config_variables_idx,output,
+                barycentric_weights_1d)
             approx_values += smolyak_coefficients[ii]*subspace_approx_vals
     return approx_values
 
+def get_sparse_grid_evaluation_plan(values,sparse_grid_subspace_indices,
+                                    smolyak_coefficients,samples_1d,
+                                    sparse_grid_subspace_values_indices_list,
+                                    barycentric_weights_1d,
+                                    config_variables_idx=None):
+    """
+    Precompute the data needed to evaluate a sparse grid so that it can
+    be evaluated repeatedly without recomputing the barycentric weights
+    or regathering the values of each subspace.
+
+    The plan must be recomputed whenever the sparse grid is refined.
+
+    Returns
+    -------
+    plan : list of tuples
+        Each tuple (smolyak_coefficient, active_sample_vars, active_levels,
+        abscissa_1d, barycentric_weights_1d, subspace_values) contains the 
+        data needed to evaluate a subspace with non-zero Smolyak coefficient.
+    """
+    assert values.ndim==2
+    assert sparse_grid_subspace_indices.shape[1]==smolyak_coefficients.shape[0]
+    if config_variables_idx is None:
+        config_variables_idx = sparse_grid_subspace_indices.shape[0]
+
+    plan = []
+    for ii in range(sparse_grid_subspace_indices.shape[1]):
+        if (abs(smolyak_coefficients[ii])<=np.finfo(float).eps):
+            continue
+        subspace_index = sparse_grid_subspace_indices[:,ii]
+        active_sample_vars = np.where(
+            subspace_index[:config_variables_idx]>0)[0]
+        abscissa_1d = [samples_1d[dd][subspace_index[dd]]
+                       for dd in active_sample_vars]
+        subspace_barycentric_weights_1d = [
+            barycentric_weights_1d[dd][subspace_index[dd]]
+            for dd in active_sample_vars]
+        subspace_values = get_subspace_values(
+            values,sparse_grid_subspace_values_indices_list[ii])
+        plan.append((smolyak_coefficients[ii],active_sample_vars,
+                     subspace_index[active_sample_vars],abscissa_1d,
+                     subspace_barycentric_weights_1d,subspace_values))
+    return plan
+
+def evaluate_sparse_grid_from_evaluation_plan(samples,plan,num_qoi):
+    """
+    Evaluate a sparse grid using the data precomputed by 
+    get_sparse_grid_evaluation_plan.
+
+    Parameters
+    ----------
+    samples : np.ndarray (num_vars, num_samples)
+        The samples at which to evaluate the sparse grid
+
+    plan : list of tuples
+        The evaluation plan returned by get_sparse_grid_evaluation_plan
+
+    num_qoi : integer
+        The number of quantities of interest of the sparse grid
+
+    Returns
+    -------
+    approx_values : np.ndarray (num_samples, num_qoi)
+        The values of the sparse grid at the samples
+    """
+    num_samples = samples.shape[1]
+    #must initialize to zero
+    approx_values = np.zeros((num_samples,num_qoi),dtype=float)
+    for coef, active_sample_vars, active_levels, abscissa_1d, \
+            barycentric_weights_1d, subspace_values in plan:
+        if active_sample_vars.shape[0]==0:
+            approx_values += coef*subspace_values
+            continue
+        approx_values += coef*multivariate_barycentric_lagrange_interpolation(
+            samples,abscissa_1d,barycentric_weights_1d,subspace_values,
+            active_sample_vars)
+    return approx_values
+
+def evaluate_sparse_grid_from_evaluation_plan_using_shared_basis(
+        samples,plan,num_qoi,max_eval_chunk_size=None):
+    """
+    Evaluate a sparse grid using the data precomputed by 
+    get_sparse_grid_evaluation_plan.
+
+    The univariate Lagrange basis of each unique pair of variable and level
+    is evaluated at the samples only once and shared by all the subspaces
+    that use it. The samples are evaluated in chunks to limit the memory
+    needed to store the univariate basis matrices.
+
+    Parameters
+    ----------
+    samples : np.ndarray (num_vars, num_samples)
+        The samples at which to evaluate the sparse grid
+
+    plan : list of tuples
+        The evaluation plan returned by get_sparse_grid_evaluation_plan
+
+    num_qoi : integer
+        The number of quantities of interest of the sparse grid
+
+    max_eval_chunk_size : integer
+        The maximum number of samples evaluated at once. If None all 
+        samples are evaluated at once.
+
+    Returns
+    -------
+    approx_values : np.ndarray (num_samples, num_qoi)
+        The values of the sparse grid at the samples
+    """
+    num_samples = samples.shape[1]
+    if max_eval_chunk_size is None:
+        max_eval_chunk_size = max(num_samples,1)
+    #must initialize to zero
+    approx_values = np.zeros((num_samples,num_qoi),dtype=float)
+    for lb in range(0,num_samples,max_eval_chunk_size):
+        ub = min(lb+max_eval_chunk_size,num_samples)
+        chunk_samples = samples[:,lb:ub]
+        basis_matrices = dict()
+        for coef, active_sample_vars, active_levels, abscissa_1d, \
+                barycentric_weights_1d, subspace_values in plan:
+            if active_sample_vars.shape[0]==0:
+                approx_values[lb:ub] += coef*subspace_values
+                continue
+            basis_matrices_1d = []
+            for dd in range(active_sample_vars.shape[0]):
+                key = (active_sample_vars[dd],active_levels[dd])
+                if key not in basis_matrices:
+                    basis_matrices[key] = \
+                        evaluate_univariate_barycentric_lagrange_basis(
+                            chunk_samples[active_sample_vars[dd],:],
+                            abscissa_1d[dd],barycentric_weights_1d[dd])
+                basis_matrices_1d.append(basis_matrices[key])
+            approx_values[lb:ub] += coef*\
+                tensor_product_barycentric_lagrange_interpolation_from_basis(
+                    basis_matrices_1d,subspace_values)
+    return approx_values
+
 def integrate_sparse_grid_subspace(subspace_index,subspace_values,
                                    weights_1d,config_variables_idx):
     subspace_weights = get_subspace_weights(
@@ -683,6 +886,7 @@ def plot_sparse_grid_2d(samples,weights,poly_indices=None,subspace_indices=None,
         The unique polynomial indices of the sparse grid.
 
     """
+    import matplotlib.pyplot as plt
     from pyapprox.visualization import plot_2d_indices
     if samples.shape[0]!=2:
         return
@@ -724,6 +928,7 @@ def plot_sparse_grid_2d(samples,weights,poly_indices=None,subspace_indices=None,
 
 def plot_sparse_grid_3d(samples,weights,poly_indices=None,subspace_indices=None,
                         active_samples=None,active_subspace_indices=None):
+    import matplotlib.pyplot as plt
     from pyapprox.visualization import plot_3d_indices
     if samples.shape[0]!=3:
         return
@@ -7,6 +7,16 @@ from scipy.optimize import minimize, NonlinearConstraint, LinearConstraint, \
     BFGS, Bounds
 from pyapprox.rol_minimize import pyapprox_minimize, has_ROL
 
+
+def get_numba_stochastic_dominance_kernels():
+    """
+    Return the module containing the numba implementations of the smoothed
+    Heaviside functions. numba is only imported when this function is first
+    called because it is slow to import.
+    """
+    from pyapprox import numba_stochastic_dominance_kernels
+    return numba_stochastic_dominance_kernels
+
 def build_inequality_contraints(Y, basis_matrix, p, eta_indices):
     r"""
     Construct the matrix form of the constraints of quadratic program.
@@ -945,7 +955,9 @@ class FSDOptProblem(SmoothDisutilitySSDOptProblem):
         if self.smoother_type == 2:
             if x.ndim == 1:
                 x = x[:, None]
-            vals1 = numba_smooth_left_heaviside_function_type2(x, self.eps)
+            kernels = get_numba_stochastic_dominance_kernels()
+            vals1 = kernels.numba_smooth_left_heaviside_function_type2(
+                x, self.eps)
             return vals1
             # one minus sign because using right heaviside function but want
             # left heaviside function
@@ -967,8 +979,10 @@ class FSDOptProblem(SmoothDisutilitySSDOptProblem):
         if self.smoother_type == 2:
             if x.ndim == 1:
                 x = x[:, None]
-            vals2 = numba_smooth_left_heaviside_function_first_derivative_type2(
-                x, self.eps)
+            kernels = get_numba_stochastic_dominance_kernels()
+            vals2 = kernels.\
+                numba_smooth_left_heaviside_function_first_derivative_type2(
+                    x, self.eps)
             return vals2
             # two minus signs because using right heaviside function but want
             # left heaviside function
@@ -1001,7 +1015,8 @@ class FSDOptProblem(SmoothDisutilitySSDOptProblem):
         elif self.smoother_type == 2:
             if x.ndim == 1:
                 x = x[:, None]
-            return numba_smooth_min_function_third_derivative_type2(
+            kernels = get_numba_stochastic_dominance_kernels()
+            return kernels.numba_smooth_min_function_third_derivative_type2(
                 x, self.eps)
         else:
             msg="incorrect smoother_type"
@@ -1223,36 +1238,3 @@ def solve_FSD_constrained_least_squares_smooth(
         return coef, fsd_opt_problem
     else:
         return coef
-
-
-from numba import jit
-@jit(nopython=True)
-def numba_smooth_left_heaviside_function_type2(x, eps):
-    vals = np.ones_like(x)
-    for ii in range(x.shape[0]):
-        for jj in range(x.shape[1]):
-            if (x[ii, jj]<0 and x[ii, jj]>-eps):
-                vals[ii, jj] = 6*(-x[ii, jj]/eps)**2-8*(-x[ii, jj]/eps)**3+\
-                    3*(-x[ii, jj]/eps)**4
-            elif (x[ii, jj]>=0):
-                vals[ii, jj] = 0
-    return vals
-
-@jit(nopython=True)
-def numba_smooth_left_heaviside_function_first_derivative_type2(x, eps):
-    vals = np.zeros_like(x)
-    for ii in range(x.shape[0]):
-        for jj in range(x.shape[1]):
-            if (x[ii, jj]<0 and x[ii, jj]>-eps):
-                vals[ii, jj] = 12*x[ii, jj]*(eps+x[ii, jj])**2/eps**4
-    return vals
-
-@jit(nopython=True)
-def numba_smooth_min_function_third_derivative_type2(x, eps):
-    vals = np.zeros_like(x)
-    for ii in range(x.shape[0]):
-        for jj in range(x.shape[1]):
-            if (x[ii, jj]<0 and x[ii, jj]>-eps):
-                vals[ii, jj] = 12*(eps**2+4*eps*x[ii, jj]+3*x[ii, jj]**2)/eps**4
-    return vals
-    
@@ -182,6 +182,39 @@ class TestApproximate(unittest.TestCase):
         # plt.plot(train_samples[0,:], train_vals[:,0],'ro')
         # plt.show()
 
+    def test_instrumentation(self):
+        from pyapprox.instrumentation import get_active_profiler
+        nvars = 2
+        univariate_variables = [stats.uniform(-1,2)]*nvars
+        fun = lambda x: np.sum(x**3,axis=0)[:,np.newaxis]
+        result = adaptive_approximate(
+            fun,univariate_variables,'sparse_grid',{'max_nsamples':50})
+        assert not hasattr(result,'profile')
+
+        result = adaptive_approximate(
+            fun,univariate_variables,'sparse_grid',{'max_nsamples':50},
+            instrument=True)
+        assert get_active_profiler() is None
+        phases = result.profile['phases']
+        for name in ['total','refine','model_evaluation']:
+            assert phases[name]['ncalls']>0
+        assert phases['refine']['wall_time']<=phases['total']['wall_time']
+        assert (result.profile['counters']['nmodel_evaluations']==
+                result.approx.samples.shape[1])
+
+        variable = pya.IndependentMultivariateRandomVariable(
+            univariate_variables)
+        train_samples = pya.generate_independent_random_samples(variable,50)
+        train_vals = fun(train_samples)
+        result = approximate(
+            train_samples,train_vals,'polynomial_chaos',
+            {'basis_type':'hyperbolic_cross','variable':variable,
+             'options':{'max_degree':3}},instrument='memory')
+        phases = result.profile['phases']
+        for name in ['total','basis_matrix','linear_solve']:
+            assert phases[name]['ncalls']>0
+        assert phases['total']['allocated_bytes']>0
+
         
 if __name__== "__main__":    
     approximate_test_suite = unittest.TestLoader().loadTestsFromTestCase(
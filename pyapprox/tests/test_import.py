@@ -0,0 +1,98 @@
+import unittest
+import os
+import sys
+import subprocess
+import json
+
+
+def run_in_subprocess(code):
+    """
+    Run python code in a new interpreter, so that the modules imported
+    by the tests are not reused, and return the json printed by the code.
+    """
+    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root_dir]+[p for p in [env.get('PYTHONPATH')] if p])
+    output = subprocess.check_output(
+        [sys.executable, '-c', code], env=env, cwd=root_dir)
+    return json.loads(output.decode().strip().split('\n')[-1])
+
+
+class TestImport(unittest.TestCase):
+
+    def test_import_time(self):
+        # generous budget. Importing every submodule takes seconds
+        time_budget = 0.5
+        code = """
+import time, json
+t0 = time.perf_counter()
+import pyapprox
+print(json.dumps(time.perf_counter()-t0))
+"""
+        import_time = min([run_in_subprocess(code) for ii in range(3)])
+        assert import_time < time_budget, import_time
+
+    def test_slow_optional_dependencies_are_not_imported(self):
+        code = """
+import sys, json
+import pyapprox
+import pyapprox.multivariate_polynomials
+import pyapprox.adaptive_sparse_grid
+import pyapprox.control_variate_monte_carlo
+print(json.dumps([name for name in
+                  ['matplotlib', 'sklearn', 'torch', 'numba']
+                  if name in sys.modules]))
+"""
+        assert run_in_subprocess(code) == []
+
+    def test_lazy_attributes(self):
+        code = """
+import sys, json
+import pyapprox as pya
+assert 'pyapprox.utilities' not in sys.modules
+from pyapprox import cartesian_product
+assert pya.IndependentMultivariateRandomVariable.__module__ == \
+    'pyapprox.variables'
+# the last module listed in _submodules defining a name takes precedence
+assert pya.nchoosek.__module__ == 'pyapprox.indexing'
+assert 'compute_hyperbolic_indices' in dir(pya)
+assert pya.models.__name__ == 'pyapprox.models'
+print(json.dumps('pyapprox.gaussian_process' not in sys.modules))
+"""
+        assert run_in_subprocess(code)
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_in_subprocess(
+                'import pyapprox; pyapprox.not_an_attribute')
+
+    def test_unknown_attributes_do_not_import_submodules(self):
+        code = """
+import sys, json
+import pyapprox as pya
+assert not hasattr(pya, 'not_an_attribute')
+assert not hasattr(pya, '_ipython_canary_method_should_not_exist_')
+loaded = [name for name in sys.modules if name.startswith('pyapprox.')]
+assert pya.np.__name__ == 'numpy'
+print(json.dumps(loaded))
+"""
+        assert run_in_subprocess(code) == []
+
+        # importlib.util is not loaded by the interpreter without site
+        code = """
+import json
+import pyapprox
+print(json.dumps(pyapprox.models.__name__))
+"""
+        root_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        output = subprocess.check_output(
+            [sys.executable, '-S', '-c', code], cwd=root_dir)
+        assert json.loads(output.decode().strip().split('\n')[-1]) == \
+            'pyapprox.models'
+
+
+if __name__ == "__main__":
+    import_test_suite = unittest.TestLoader().loadTestsFromTestCase(
+        TestImport)
+    unittest.TextTestRunner(verbosity=2).run(import_test_suite)
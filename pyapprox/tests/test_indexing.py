@@ -110,6 +110,48 @@ class TestIndexing(unittest.TestCase):
         assert (ii,jj)==(1,2)  
 
 
+    def test_multi_index_set(self):
+        num_vars, level = 3, 4
+        indices = compute_hyperbolic_indices(num_vars,level,1.)
+        index_set = MultiIndexSet(num_vars,init_capacity=2)
+        ids = index_set.add_indices(indices)
+        assert np.allclose(ids,np.arange(indices.shape[1]))
+        assert np.allclose(index_set.indices,indices)
+        # adding an existing index does not change the set
+        assert index_set.add(indices[:,3])==3
+        assert len(index_set)==indices.shape[1]
+        assert np.array([2,2,1]) not in index_set
+
+        for ii in range(indices.shape[1]):
+            index = indices[:,ii]
+            assert index_set.get_id(index)==ii
+            for dd,jj in index_set.get_backward_neighbor_ids(index):
+                assert np.allclose(
+                    indices[:,jj],get_backward_neighbor(index,dd))
+            for dd,jj in enumerate(index_set.get_forward_neighbor_ids(index)):
+                if index.sum()<level:
+                    assert np.allclose(
+                        indices[:,jj],get_forward_neighbor(index,dd))
+                else:
+                    assert jj is None
+
+    def test_multi_index_set_smolyak_coefficients(self):
+        from pyapprox.adaptive_sparse_grid import update_smolyak_coefficients
+        num_vars, level = 3, 3
+        indices = compute_hyperbolic_indices(num_vars,level,1.)
+        # add the indices of a total degree set one at a time
+        index_set = MultiIndexSet(num_vars)
+        smolyak_coeffs = np.zeros(0)
+        true_smolyak_coeffs = np.zeros(0)
+        for ii in range(indices.shape[1]):
+            index_set.add(indices[:,ii])
+            smolyak_coeffs = index_set.update_smolyak_coefficients(
+                indices[:,ii],np.append(smolyak_coeffs,0.))
+            true_smolyak_coeffs = update_smolyak_coefficients(
+                indices[:,ii],indices[:,:ii+1],
+                np.append(true_smolyak_coeffs,0.))
+            assert np.allclose(smolyak_coeffs,true_smolyak_coeffs)
+
 if __name__=='__main__':
     indexing_test_suite = unittest.TestLoader().loadTestsFromTestCase(
          TestIndexing)
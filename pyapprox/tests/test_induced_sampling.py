@@ -38,6 +38,49 @@ class TestInducedSampling(unittest.TestCase):
         #plt.plot(ppf_vals,cdf_vals,'r*',ms=2)
         #plt.show()
         
+    def test_tabulated_continuous_induced_measure_ppf(self):
+        import tempfile
+        from scipy.stats import norm
+        from pyapprox.induced_sampling import _induced_measure_cdf_tables
+        from pyapprox.orthonormal_polynomials_1d import hermite_recurrence
+        degree=5
+        alpha_stat,beta_stat=2,5
+        ab = jacobi_recurrence(
+            degree+1,alpha=beta_stat-1,beta=alpha_stat-1,probability=True)
+        var = beta(alpha_stat,beta_stat,-1,2)
+        u_samples = np.linspace(0,1,21)[1:-1]
+        ppf_vals = continuous_induced_measure_ppf(var,ab,degree,u_samples)
+        true_ppf_vals = continuous_induced_measure_ppf(
+            var,ab,degree,u_samples,1e-12,1e-10,tabulate=False)
+        assert np.allclose(ppf_vals,true_ppf_vals,atol=1e-8)
+
+        # tables do not depend on the location and scale of the variable
+        table = get_induced_measure_cdf_table(var,ab,degree)
+        assert get_induced_measure_cdf_table(
+            beta(alpha_stat,beta_stat,0,1),ab,degree) is table
+
+        # the induced measure of the constant polynomial is the measure
+        # itself
+        ab = hermite_recurrence(1,probability=True)
+        ppf_vals = continuous_induced_measure_ppf(norm(0,1),ab,0,u_samples)
+        assert np.allclose(ppf_vals,norm.ppf(u_samples))
+
+        # tables can be shared between processes using files
+        with tempfile.TemporaryDirectory() as tmpdir:
+            set_induced_measure_cdf_table_cache_dir(tmpdir)
+            try:
+                _induced_measure_cdf_tables.clear()
+                table = get_induced_measure_cdf_table(norm(0,1),ab,0)
+                assert len(os.listdir(tmpdir))==1
+                _induced_measure_cdf_tables.clear()
+                cached_table = get_induced_measure_cdf_table(norm(0,1),ab,0)
+            finally:
+                set_induced_measure_cdf_table_cache_dir(None)
+        assert cached_table is not table
+        assert np.allclose(cached_table.cdf_vals,table.cdf_vals)
+        assert np.allclose(
+            cached_table.ppf(u_samples),table.ppf(u_samples))
+
     def test_discrete_induced_sampling(self):
         degree=3
         
@@ -1,4 +1,4 @@
-import unittest
+import unittest, os
 from scipy import special as sp
 from pyapprox.multivariate_polynomials import *
 from pyapprox.univariate_quadrature import gauss_hermite_pts_wts_1D, \
@@ -447,6 +447,141 @@ class TestMultivariatePolynomials(unittest.TestCase):
             lambda x: poly(x[:,np.newaxis])[0,:],sample[:,0])
         assert np.allclose(jac,fd_jac)
 
+    def test_chunked_basis_matrix(self):
+        degree = 3
+        univariate_variables = [beta(2,3,0,1),norm(-1,2),uniform(-1,2)]
+        variable = IndependentMultivariateRandomVariable(univariate_variables)
+        var_trans = AffineRandomVariableTransformation(variable)
+        num_vars = len(univariate_variables)
+
+        poly = PolynomialChaosExpansion()
+        poly_opts = define_poly_options_from_variable_transformation(var_trans)
+        poly.configure(poly_opts)
+        indices = compute_hyperbolic_indices(num_vars,degree,1.0)
+        poly.set_indices(indices)
+
+        num_samples = 23
+        samples = generate_independent_random_samples(variable,num_samples)
+        for deriv_order in [0,1]:
+            opts = {'deriv_order':deriv_order}
+            basis_matrix = poly.basis_matrix(samples,opts)
+            opts['max_chunk_size'] = 7
+            assert np.allclose(poly.basis_matrix(samples,opts),basis_matrix)
+
+            import tempfile
+            with tempfile.TemporaryDirectory() as tmpdir:
+                out = np.memmap(
+                    os.path.join(tmpdir,'basis_matrix.dat'),dtype=float,
+                    mode='w+',
+                    shape=basis_matrix.shape)
+                opts['out'] = out
+                assert poly.basis_matrix(samples,opts) is out
+                assert np.allclose(out,basis_matrix)
+                del out, opts['out']
+
+            canonical_samples = var_trans.map_to_canonical_space(samples)
+            canonical_basis_matrix = poly.canonical_basis_matrix(
+                canonical_samples,{'deriv_order':deriv_order})
+            assert np.allclose(
+                evaluate_multivariate_orthonormal_polynomial(
+                    canonical_samples,indices,poly.recursion_coeffs,
+                    deriv_order,poly.basis_type_index_map,max_chunk_size=5),
+                canonical_basis_matrix)
+
+            nblocks = 1+deriv_order*num_vars
+            for lb, ub, chunk in poly.basis_matrix_chunks(samples,10,opts):
+                for kk in range(nblocks):
+                    assert np.allclose(
+                        chunk[kk*(ub-lb):(kk+1)*(ub-lb)],
+                        basis_matrix[kk*num_samples+lb:kk*num_samples+ub])
+
+    def test_value_using_coefficient_contraction(self):
+        univariate_variables = [
+            beta(2,3,0,1),norm(-1,2),uniform(-1,2),uniform(0,1)]
+        variable = IndependentMultivariateRandomVariable(univariate_variables)
+        var_trans = AffineRandomVariableTransformation(variable)
+        num_vars = len(univariate_variables)
+
+        poly = PolynomialChaosExpansion()
+        poly_opts = define_poly_options_from_variable_transformation(var_trans)
+        poly.configure(poly_opts)
+        samples = generate_independent_random_samples(variable,31)
+        for degree, hcross_strength in [(3,1.),(6,0.5)]:
+            indices = compute_hyperbolic_indices(
+                num_vars,degree,hcross_strength)
+            # the order of the indices should not matter
+            indices = indices[:,np.random.permutation(indices.shape[1])]
+            poly.set_indices(indices)
+            poly.set_coefficients(np.random.normal(0,1,(indices.shape[1],2)))
+            values = poly.basis_matrix(samples).dot(poly.coefficients)
+            assert np.allclose(poly(samples),values)
+            assert np.allclose(poly.value_using_coefficient_contraction(
+                samples,max_chunk_size=7),values)
+
+        poly.set_indices(np.arange(5)[np.newaxis,:]*np.array([[1],[0],[0],[0]]))
+        poly.set_coefficients(np.ones((5,1)))
+        assert np.allclose(
+            poly(samples),poly.basis_matrix(samples).dot(poly.coefficients))
+
+    @unittest.skipIf(get_numba_polynomial_kernels() is None,
+                     reason="numba package missing")
+    def test_numba_polynomial_kernels(self):
+        from unittest.mock import patch
+        import pyapprox.orthonormal_polynomials_1d as orthonormal_1d
+        num_vars, degree = 3, 4
+        ab = jacobi_recurrence(degree+2,alpha=1,beta=2,probability=True)
+        indices = compute_hyperbolic_indices(num_vars,degree,1.0)
+        samples = np.random.uniform(-1,1,(num_vars,20))
+        for deriv_order in [0,1]:
+            with patch.object(orthonormal_1d,'numba_min_num_samples',np.inf):
+                basis_matrix = evaluate_multivariate_orthonormal_polynomial(
+                    samples,indices,ab,deriv_order)
+                vals_1d = evaluate_orthonormal_polynomial_deriv_1d(
+                    samples[0],degree+1,ab,2)
+            with patch.object(orthonormal_1d,'numba_min_num_samples',0):
+                assert np.allclose(
+                    evaluate_multivariate_orthonormal_polynomial(
+                        samples,indices,ab,deriv_order),basis_matrix)
+                assert np.allclose(evaluate_orthonormal_polynomial_deriv_1d(
+                    samples[0],degree+1,ab,2),vals_1d)
+
+        # the kernels are only used by the main thread
+        from concurrent.futures import ThreadPoolExecutor
+        with patch.object(orthonormal_1d,'numba_min_num_samples',0):
+            with ThreadPoolExecutor(1) as executor:
+                assert not executor.submit(
+                    orthonormal_1d.use_numba_polynomial_kernels,
+                    samples.shape[1]).result()
+
+    @unittest.skipIf(get_numba_polynomial_kernels() is None,
+                     reason="numba package missing")
+    def test_numba_polynomial_kernels_are_fork_safe(self):
+        # python must exit after a fork based process pool is used once the
+        # kernels have been run
+        import subprocess, sys
+        code = """
+import numpy as np, multiprocessing
+from pyapprox.multivariate_polynomials import \\
+    evaluate_multivariate_orthonormal_polynomial
+from pyapprox.orthonormal_polynomials_1d import jacobi_recurrence
+from pyapprox.indexing import compute_hyperbolic_indices
+ab = jacobi_recurrence(4,alpha=0,beta=0,probability=True)
+indices = compute_hyperbolic_indices(2,3,1.0)
+evaluate_multivariate_orthonormal_polynomial(
+    np.random.uniform(-1,1,(2,5000)),indices,ab,0)
+with multiprocessing.get_context('fork').Pool(2) as pool:
+    assert pool.map(abs,[-1,-2])==[1,2]
+"""
+        root_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env = dict(os.environ)
+        env.pop('NUMBA_THREADING_LAYER',None)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [root_dir]+[p for p in [env.get('PYTHONPATH')] if p])
+        subprocess.run(
+            [sys.executable,'-c',code],env=env,check=True,timeout=120,
+            stdout=subprocess.DEVNULL)
+
     def test_hahn_hypergeometric(self):
         degree = 4;
         M,n,N = 20,7,12
@@ -663,6 +663,64 @@ class TestOptimalExperimentalDesign(unittest.TestCase):
         diffs = check_derivative(roptimality_criterion_wrapper,num_design_pts)
         assert diffs.min()<6e-5,diffs
 
+    def test_criteria_without_outer_products(self):
+        poly_degree = 5;
+        num_design_pts = 31
+        design_samples = np.linspace(-1,1,num_design_pts)
+        pred_samples = np.random.uniform(-1,1,11)
+        design_factors = univariate_monomial_basis_matrix(
+            poly_degree,design_samples)
+        pred_factors=univariate_monomial_basis_matrix(poly_degree,pred_samples)
+        homog_outer_prods = compute_homoscedastic_outer_products(design_factors)
+        for ii in range(num_design_pts):
+            assert np.allclose(homog_outer_prods[:,:,ii],np.outer(
+                design_factors[ii,:],design_factors[ii,:]))
+        mu = np.random.uniform(0,1,(num_design_pts)); mu/=mu.sum()
+        criteria = [
+            partial(aoptimality_criterion),partial(coptimality_criterion),
+            partial(doptimality_criterion),
+            partial(goptimality_criterion,pred_factors=pred_factors),
+            partial(ioptimality_criterion,pred_factors=pred_factors),
+            partial(roptimality_criterion,0.5,pred_factors=pred_factors)]
+        for noise_multiplier in [None,design_samples**2+1]:
+            for regression_type in ['lstsq','quantile']:
+                for criterion in criteria:
+                    value,grad = criterion(
+                        homog_outer_prods=homog_outer_prods,
+                        design_factors=design_factors,design_prob_measure=mu,
+                        noise_multiplier=noise_multiplier,
+                        regression_type=regression_type)
+                    factored_value,factored_grad = criterion(
+                        homog_outer_prods=None,
+                        design_factors=design_factors,design_prob_measure=mu,
+                        noise_multiplier=noise_multiplier,
+                        regression_type=regression_type)
+                    assert np.allclose(value,factored_value)
+                    assert np.allclose(grad,factored_grad)
+
+        variance = compute_prediction_variance(
+            mu,pred_factors,homog_outer_prods,design_samples**2+1)
+        factored_variance = compute_prediction_variance(
+            mu,pred_factors,None,design_samples**2+1,
+            design_factors=design_factors)
+        assert np.allclose(variance,factored_variance)
+
+        # never form the outer products when solving for the design
+        import pyapprox.optimal_experimental_design as oed
+        max_outer_products_size = oed.max_outer_products_size
+        oed.max_outer_products_size = 0
+        try:
+            design_samples = np.linspace(-1,1,30)
+            design_factors = univariate_monomial_basis_matrix(
+                3,design_samples)
+            opt_problem = AlphabetOptimalDesign('D',design_factors)
+            mu = opt_problem.solve({'iprint': 1, 'ftol':1e-8})
+        finally:
+            oed.max_outer_products_size = max_outer_products_size
+        I= np.where(mu>1e-5)[0]
+        assert np.allclose(I,[0,8,21,29])
+        assert np.allclose(0.25*np.ones(4),mu[I],atol=1e-5)
+
     def test_homoscedastic_least_squares_roptimal_design(self):
         """
         Check R (beta=0) and I optimal designs are the same
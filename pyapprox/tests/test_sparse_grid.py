@@ -536,6 +536,42 @@ class TestSparseGrid(unittest.TestCase):
             moments[0,:],monomial_mean_uniform_variables(
                 monomial_indices,monomial_coeffs))
 
+    def test_evaluate_sparse_grid_using_shared_basis(self):
+        num_vars = 3; level = 4
+        quad_rules   = [clenshaw_curtis_in_polynomial_order]*num_vars
+        growth_rules = [clenshaw_curtis_rule_growth]*num_vars
+        samples, weights, data_structures=get_sparse_grid_samples_and_weights(
+            num_vars, level, quad_rules, growth_rules)
+
+        poly_indices_dict, poly_indices, subspace_indices,\
+          smolyak_coefficients, subspace_poly_indices, samples_1d, \
+          weights_1d, subspace_values_indices = data_structures
+
+        def function(x):
+            return np.array([np.cos(x.sum(axis=0)),(x**3).sum(axis=0)]).T
+        values = function(samples)
+
+        barycentric_weights_1d = update_sparse_grid_barycentric_weights_1d(
+            samples_1d)
+        plan = get_sparse_grid_evaluation_plan(
+            values,subspace_indices,smolyak_coefficients,samples_1d,
+            subspace_values_indices,barycentric_weights_1d)
+
+        # include sparse grid samples to check interpolation at the abscissa
+        validation_samples = np.hstack(
+            [np.random.uniform(-1.,1.,(num_vars,100)),samples[:,:10]])
+        true_approx_values = evaluate_sparse_grid(
+            validation_samples, values, poly_indices_dict,
+            subspace_indices, subspace_poly_indices, smolyak_coefficients,
+            samples_1d,subspace_values_indices)
+        for max_eval_chunk_size in [None,7]:
+            approx_values = \
+                evaluate_sparse_grid_from_evaluation_plan_using_shared_basis(
+                    validation_samples,plan,values.shape[1],
+                    max_eval_chunk_size)
+            assert np.allclose(approx_values,true_approx_values)
+        assert np.allclose(approx_values[-10:],values[:10])
+
     def test_convert_univariate_lagrange_basis_to_orthonormal_polynomials(self):
         level = 2
         quad_rules   = [clenshaw_curtis_in_polynomial_order]
@@ -1590,6 +1626,135 @@ class TestAdaptiveSparseGrid(unittest.TestCase):
 
         assert np.allclose(exact_mean,pce.mean())
 
+    def test_batch_refinement(self):
+        num_vars = 3
+        max_level = 4
+        function = lambda x: np.hstack(
+            [np.cos(x.sum(axis=0))[:,np.newaxis],
+             np.exp(x[0:1,:].T*x[1:2,:].T)])
+
+        def setup_sparse_grid():
+            admissibility_function = partial(
+                max_level_admissibility_function,max_level,None,None,None)
+            sparse_grid = CombinationSparseGrid(num_vars)
+            sparse_grid.set_refinement_functions(
+                variance_refinement_indicator,admissibility_function,
+                clenshaw_curtis_rule_growth)
+            sparse_grid.set_univariate_rules(
+                clenshaw_curtis_in_polynomial_order)
+            sparse_grid.set_function(function)
+            return sparse_grid
+
+        sparse_grid = setup_sparse_grid()
+        sparse_grid.build()
+
+        # batches of size one must reproduce serial refinement exactly
+        batch_sparse_grid = setup_sparse_grid()
+        batch_sparse_grid.build_batch(1,max_eval_concurrency=2)
+        assert batch_sparse_grid==sparse_grid
+
+        # larger batches refine the subspaces in a different order but
+        # must produce a consistent sparse grid with the same subspaces
+        for recompute_priorities in [False,True]:
+            batch_sparse_grid = setup_sparse_grid()
+            batch_sparse_grid.build_batch(
+                4,max_eval_concurrency=3,
+                recompute_priorities=recompute_priorities)
+            assert np.all(np.isfinite(batch_sparse_grid.values))
+            assert np.allclose(
+                batch_sparse_grid.values,function(batch_sparse_grid.samples))
+            assert set_difference(
+                sparse_grid.subspace_indices,
+                batch_sparse_grid.subspace_indices).shape[1]==0
+            assert np.allclose(
+                batch_sparse_grid.moments(),sparse_grid.moments())
+            validation_samples = np.random.uniform(-1,1,(num_vars,100))
+            assert np.allclose(
+                batch_sparse_grid(validation_samples),
+                sparse_grid(validation_samples))
+
+    def test_checkpoint_restart(self):
+        num_vars = 2
+        max_level = 6
+        function = lambda x: np.hstack(
+            [np.cos(x.sum(axis=0))[:,np.newaxis],
+             np.exp(x[0:1,:].T*x[1:2,:].T)])
+        admissibility_function = partial(
+            max_level_admissibility_function,max_level,None,None,None)
+
+        def setup_sparse_grid(function):
+            sparse_grid = CombinationSparseGrid(num_vars)
+            sparse_grid.set_refinement_functions(
+                variance_refinement_indicator,admissibility_function,
+                clenshaw_curtis_rule_growth)
+            sparse_grid.set_univariate_rules(
+                clenshaw_curtis_in_polynomial_order)
+            sparse_grid.set_function(function)
+            return sparse_grid
+
+        sparse_grid = setup_sparse_grid(function)
+        sparse_grid.build()
+
+        import tempfile
+        with tempfile.TemporaryDirectory() as temp_directory:
+            filename = os.path.join(temp_directory,'checkpoint.pkl')
+
+            # interrupt the build after a few refinements
+            class Interrupt(Exception):
+                pass
+            def callback(sparse_grid):
+                if sparse_grid.subspace_indices_dict.__len__()==6:
+                    raise Interrupt()
+            interrupted_sparse_grid = setup_sparse_grid(function)
+            self.assertRaises(
+                Interrupt,interrupted_sparse_grid.build,callback,filename)
+
+            # restoring the state must not evaluate the function
+            def fail(samples):
+                raise Exception('function should not be evaluated')
+            restored_sparse_grid = setup_sparse_grid(fail)
+            restored_sparse_grid.load_checkpoint(filename)
+            restored_sparse_grid.function = function
+            assert restored_sparse_grid==interrupted_sparse_grid
+
+            # an incomplete final record is ignored
+            with open(filename,'ab') as file_object:
+                file_object.write(b'incomplete record')
+            restored_sparse_grid = setup_sparse_grid(function)
+            restored_sparse_grid.load_checkpoint(filename)
+            assert restored_sparse_grid==interrupted_sparse_grid
+
+            restored_sparse_grid = setup_sparse_grid(function)
+            restored_sparse_grid.resume(filename)
+            assert restored_sparse_grid==sparse_grid
+
+            # the appended records restore the completed sparse grid
+            restored_sparse_grid = setup_sparse_grid(function)
+            restored_sparse_grid.load_checkpoint(filename)
+            assert restored_sparse_grid==sparse_grid
+            validation_samples = np.random.uniform(-1,1,(num_vars,100))
+            assert np.allclose(restored_sparse_grid(validation_samples),
+                               sparse_grid(validation_samples))
+
+            # the univariate rules of each level are only stored once
+            header, records, nbytes = read_checkpoint_records(filename)
+            for dd in range(num_vars):
+                assert sum([len(record['samples_1d'][dd])
+                            for record in records])==len(
+                                    sparse_grid.samples_1d[dd])
+
+            # a fresh build must not overwrite an existing checkpoint
+            size = os.path.getsize(filename)
+            self.assertRaises(
+                Exception,setup_sparse_grid(function).build,None,filename)
+            assert os.path.getsize(filename)==size
+            overwritten_sparse_grid = setup_sparse_grid(function)
+            overwritten_sparse_grid.build(
+                None,filename,overwrite_checkpoint=True)
+            restored_sparse_grid = setup_sparse_grid(function)
+            restored_sparse_grid.load_checkpoint(filename)
+            assert restored_sparse_grid==sparse_grid
+
     def test_error_based_stopping_criteria(self):
         alpha_stat,beta_stat = [1,2]
         num_vars = 2
@@ -1892,6 +2057,33 @@ class TestAdaptiveMultiIndexSparseGrid(unittest.TestCase):
         vals = sparse_grid(validation_samples)
         validation_values = function(validation_samples)
         assert np.allclose(validation_values,vals)
+
+    def test_evaluation_plan(self):
+        num_vars = 2
+        sparse_grid = CombinationSparseGrid(num_vars)
+        admissibility_function = partial(
+            max_level_admissibility_function,np.inf,[6]*2,30,0,verbose=False)
+        def function(samples):
+            return np.hstack([np.cos(samples.sum(axis=0))[:,np.newaxis],
+                              (samples**3).sum(axis=0)[:,np.newaxis]])
+        sparse_grid.setup(function, None, variance_refinement_indicator,
+                          admissibility_function, clenshaw_curtis_rule_growth,
+                          clenshaw_curtis_in_polynomial_order)
+        validation_samples = np.random.uniform(-1,1,(num_vars,20))
+        for ii in range(5):
+            sparse_grid.refine()
+            vals = sparse_grid(validation_samples)
+            assert sparse_grid.evaluation_plan is not None
+            true_vals = evaluate_sparse_grid(
+                validation_samples,sparse_grid.values,
+                sparse_grid.poly_indices_dict,sparse_grid.subspace_indices,
+                sparse_grid.subspace_poly_indices_list,
+                sparse_grid.smolyak_coefficients,sparse_grid.samples_1d,
+                sparse_grid.subspace_values_indices_list)
+            assert np.allclose(vals,true_vals)
+            sparse_grid.set_evaluation_options(True,7)
+            assert np.allclose(sparse_grid(validation_samples),true_vals)
+            sparse_grid.set_evaluation_options(False)
         
             
 if __name__== "__main__":
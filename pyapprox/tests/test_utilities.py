@@ -81,6 +81,27 @@ class TestUtilities(unittest.TestCase):
         assert np.allclose( A[pivots,:num_pivots], np.dot( L, U ) )
         assert np.allclose( pivots, [0,3,1] )
 
+        # test blocked factorization with more than one block
+        A = np.random.normal(0, 1, (20, 12))
+        scipy_LU, scipy_p = lu_factor(A)
+        scipy_pivots = get_final_pivots_from_sequential_pivots(
+            scipy_p, A.shape[0])
+        num_pivots = A.shape[1]
+        L, U, pivots, raw_pivots, it, ncompleted_pivots = \
+            get_pivoted_lu_factor_columns(A, num_pivots, block_size=5)
+        assert ncompleted_pivots == num_pivots
+        assert np.allclose(pivots, scipy_pivots)
+        assert np.allclose(raw_pivots[:num_pivots], scipy_p)
+        assert np.allclose(
+            L[pivots], np.tril(scipy_LU, -1)+np.eye(A.shape[0], num_pivots))
+        assert np.allclose(U, np.triu(scipy_LU)[:num_pivots])
+        LU_factor, raw_pivots = truncated_pivoted_lu_factorization(
+            A, 7, truncate_L_factor=False)
+        LU_factor, raw_pivots, it = continue_pivoted_lu_factorization(
+            LU_factor, raw_pivots, 7, num_pivots)
+        assert it == num_pivots-1
+        assert np.allclose(LU_factor, scipy_LU)
+
         # Modify the above test to first factorize 4,3 A then factorize
         # B = [A; C] where C is 2*3 and if B was factorized without enforcing
         # A then the factors would be different. Then check that first 
@@ -618,6 +639,46 @@ class TestUtilities(unittest.TestCase):
         assert np.allclose(L,full_L)
         assert np.allclose(pivots,full_pivots)
 
+    def test_pivoted_cholesky_decomposition_minimizing_trace_norm(self):
+        nrows, npivots = 12, 6
+        B = np.random.normal(0, 1, (nrows, nrows))
+        A = B.T.dot(B)
+        A_copy = A.copy()
+
+        # the pivot which minimizes the trace of the Schur complement
+        # maximizes the squared norm of its column of the Schur complement
+        # divided by its diagonal entry
+        S = A.copy()
+        true_pivots = []
+        for ii in range(npivots):
+            pivot_vals = np.sum(S**2, axis=0)/np.diag(S)
+            pivot_vals[true_pivots] = -np.inf
+            pivot = np.argmax(pivot_vals)
+            true_pivots.append(pivot)
+            S = S - np.outer(S[:, pivot], S[pivot, :])/S[pivot, pivot]
+
+        npivots_0 = 2
+        L, pivots, error, flag, diag, init_error, ncompleted_pivots = \
+            pivoted_cholesky_decomposition(
+                A, npivots_0, return_full=True, econ=False)
+        assert np.allclose(pivots[:npivots_0], true_pivots[:npivots_0])
+        for nn in range(npivots_0+1, npivots+1):
+            L, pivots, diag, chol_flag, ncompleted_pivots, error = \
+                continue_pivoted_cholesky_decomposition(
+                    A, L, nn, None, 0, True, None, pivots, diag,
+                    ncompleted_pivots, init_error, econ=False)
+            assert ncompleted_pivots == nn
+            # L is grown by more than one column at a time
+            assert L.shape[1] >= nn
+        assert L.shape[1] < nrows
+        assert np.allclose(pivots[:npivots], true_pivots)
+        assert np.allclose(diag[pivots[npivots:]], np.diag(S)[pivots[npivots:]])
+        assert np.allclose(
+            L[:, :npivots].dot(L[:, :npivots].T)[np.ix_(pivots, pivots)][
+                :npivots, :npivots],
+            A[np.ix_(pivots[:npivots], pivots[:npivots])])
+        assert np.allclose(A, A_copy)
+
     def test_update_cholesky_decomposition(self):
         nvars = 5
         B = np.random.normal(0, 1, (nvars,nvars))
@@ -4,6 +4,30 @@ import numpy as np
 from scipy.special import beta as beta_fn
 from functools import partial
 from scipy.linalg import solve_triangular
+from pyapprox.instrumentation import timed
+import importlib
+
+
+class LazyModule(object):
+    """
+    A proxy for a module which is only imported when one of its attributes
+    is first accessed. Use for optional dependencies which are slow to
+    import, e.g. torch.
+
+    Parameters
+    ----------
+    name : string
+        The name of the module
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
 
 def sub2ind(sizes, multi_index):
     r"""
@@ -640,46 +664,162 @@ def sorted_eigh(C):
     W = W*s
     return e.reshape((e.size,1)), W
 
-def continue_pivoted_lu_factorization(LU_factor,raw_pivots,current_iter,
-                                      max_iters,num_initial_rows=0):
-    it = current_iter
-    for it in range(current_iter,max_iters):
-                    
-        # find best pivot
-        if np.isscalar(num_initial_rows) and (it<num_initial_rows):
-            #pivot=np.argmax(np.absolute(LU_factor[it:num_initial_rows,it]))+it
-            pivot = it
-        elif (not np.isscalar(num_initial_rows) and
-              (it<num_initial_rows.shape[0])):
-            pivot=num_initial_rows[it]
-        else:
-            pivot = np.argmax(np.absolute(LU_factor[it:,it]))+it
+def get_pivoted_lu_factor_columns(A, max_iters, num_initial_rows=0,
+                                  block_size=32):
+    r"""
+    Compute the first max_iters columns of the L factor and the leading
+    max_iters x max_iters block of the U factor of a partially pivoted LU
+    factorization of A.
+
+    The factorization is left-looking and blocked. The columns of A are 
+    processed in panels of block_size columns. Each panel is first updated
+    with all the pivots already performed using a triangular solve and a 
+    matrix-matrix product and then factored. Only the first max_iters
+    columns of A are accessed and A is not copied. The pivots are the
+    same as those of the right-looking algorithm, which updates the entire 
+    trailing submatrix after each pivot.
+
+    Parameters
+    ----------
+    A np.ndarray (num_rows,num_cols)
+        The matrix to be factored
 
+    max_iters : integer
+        The number of pivots to perform. Must be <= min(num_rows,num_cols)
+
+    num_initial_rows: integer or np.ndarray()
+        The number of the top rows of A to be chosen as pivots before
+        any remaining rows can be chosen.
+        If object is an array then entries are raw pivots which
+        will be used in order.
+
+    block_size : integer
+        The number of columns in each panel
+
+    Returns
+    -------
+    L_factor : np.ndarray (num_rows,max_iters)
+        The lower triangular factor with a unit diagonal. The rows are
+        in the order of the rows of A, i.e. L_factor[pivots] is lower 
+        triangular
+
+    U_factor : np.ndarray (max_iters,max_iters)
+        The upper triangular factor
+
+    pivots : np.ndarray (num_rows)
+        The final positions of the rows of A
+
+    raw_pivots : np.ndarray (num_rows)
+        The sequential pivots used to during algorithm to swap rows of A. 
 
-        # update pivots vector
-        #swap_rows(pivots,it,pivot)
-        raw_pivots[it]=pivot
-      
-        # apply pivots(swap rows) in L factorization
-        swap_rows(LU_factor,it,pivot)
+    it : integer
+        The last iteration performed
 
-        # check for singularity
-        if abs(LU_factor[it,it])<np.finfo(float).eps:
-            msg = "pivot %1.2e"%abs(LU_factor[it,it])
-            msg += " is to small. Stopping factorization."
-            print (msg)
+    ncompleted_pivots : integer
+        The number of pivots completed. This is less than it+1 if 
+        the factorization stopped because a pivot was too small
+    """
+    num_rows = A.shape[0]
+    L_factor = np.zeros((num_rows, max_iters))
+    U_factor = np.zeros((max_iters, max_iters))
+    pivots = np.arange(num_rows)
+    raw_pivots = np.arange(num_rows)
+    it, ncompleted_pivots = 0, 0
+    for jj in range(0, max_iters, block_size):
+        kk = min(jj+block_size, max_iters)
+        rows = pivots[jj:]
+        panel = np.asarray(A[rows, jj:kk], dtype=float)
+        if jj > 0:
+            U_factor[:jj, jj:kk] = solve_triangular(
+                L_factor[pivots[:jj], :jj], A[pivots[:jj], jj:kk],
+                lower=True, unit_diagonal=True)
+            panel -= L_factor[rows, :jj].dot(U_factor[:jj, jj:kk])
+
+        # right-looking factorization of the panel
+        for ll in range(kk-jj):
+            it = jj+ll
+            if np.isscalar(num_initial_rows) and (it<num_initial_rows):
+                pivot = ll
+            elif (not np.isscalar(num_initial_rows) and
+                  (it<num_initial_rows.shape[0])):
+                pivot = num_initial_rows[it]-jj
+            else:
+                pivot = np.argmax(np.absolute(panel[ll:, ll]))+ll
+            raw_pivots[it] = pivot+jj
+            swap_rows(panel, ll, pivot)
+            swap_rows(pivots, it, pivot+jj)
+
+            # check for singularity
+            if abs(panel[ll, ll])<np.finfo(float).eps:
+                msg = "pivot %1.2e"%abs(panel[ll, ll])
+                msg += " is to small. Stopping factorization."
+                print (msg)
+                break
+
+            panel[ll+1:, ll] /= panel[ll, ll]
+            panel[ll+1:, ll+1:] -= np.outer(panel[ll+1:, ll], panel[ll, ll+1:])
+            ncompleted_pivots = it+1
+
+        rows = pivots[jj:]
+        U_factor[jj:kk, jj:kk] = np.triu(panel[:kk-jj])
+        L_factor[rows, jj:kk] = np.tril(panel, -1)
+        if ncompleted_pivots < kk:
             break
+    L_factor[pivots[:it+1], np.arange(it+1)] = 1.
+    return L_factor, U_factor, pivots, raw_pivots, it, ncompleted_pivots
 
-        # update L_factor
-        LU_factor[it+1:,it] /= LU_factor[it,it];
 
-        # udpate U_factor
-        col_vector = LU_factor[it+1:,it]
-        row_vector = LU_factor[it,it+1:]
+def get_lu_factor_from_factor_columns(A, L_factor, U_factor, pivots,
+                                      ncompleted_pivots):
+    r"""
+    Return the in place LU factorization matrix, with the same shape as A,
+    from the output of 
+    :func:`pyapprox.utilities.get_pivoted_lu_factor_columns`. The rows of
+    the LU factorization matrix are pivoted. The trailing block 
+    to the right of the completed pivots stores the Schur complement.
+    """
+    npivots = ncompleted_pivots
+    LU_factor = np.array(A[pivots], dtype=float)
+    L_11 = L_factor[pivots[:npivots], :npivots]
+    LU_factor[:, :npivots] = np.tril(L_factor[pivots, :npivots], -1)
+    LU_factor[:npivots, :npivots] += U_factor[:npivots, :npivots]
+    if npivots > 0:
+        LU_factor[:npivots, npivots:] = solve_triangular(
+            L_11, LU_factor[:npivots, npivots:], lower=True,
+            unit_diagonal=True)
+        LU_factor[npivots:, npivots:] -= L_factor[
+            pivots[npivots:], :npivots].dot(LU_factor[:npivots, npivots:])
+    return LU_factor
 
-        update = np.outer(col_vector,row_vector)
-        LU_factor[it+1:,it+1:]-= update
-    return LU_factor, raw_pivots, it
+
+def continue_pivoted_lu_factorization(LU_factor,raw_pivots,current_iter,
+                                      max_iters,num_initial_rows=0):
+    r"""
+    Perform the pivots current_iter,...,max_iters-1 of an in place LU 
+    factorization that has completed current_iter pivots.
+
+    The Schur complement stored in the trailing block 
+    LU_factor[current_iter:,current_iter:] is factored with 
+    :func:`pyapprox.utilities.get_pivoted_lu_factor_columns`.
+    """
+    if max_iters <= current_iter:
+        return LU_factor, raw_pivots, current_iter
+    if np.isscalar(num_initial_rows):
+        sub_num_initial_rows = max(num_initial_rows-current_iter, 0)
+    else:
+        sub_num_initial_rows = num_initial_rows[current_iter:]-current_iter
+    schur_complement = LU_factor[current_iter:, current_iter:]
+    L_factor, U_factor, pivots, sub_raw_pivots, it, ncompleted_pivots = \
+        get_pivoted_lu_factor_columns(
+            schur_complement, max_iters-current_iter, sub_num_initial_rows)
+    LU_factor[current_iter:, current_iter:] = \
+        get_lu_factor_from_factor_columns(
+            schur_complement, L_factor, U_factor, pivots, ncompleted_pivots)
+    LU_factor[current_iter:, :current_iter] = \
+        LU_factor[current_iter:, :current_iter][pivots]
+    raw_pivots[current_iter:current_iter+it+1] = \
+        sub_raw_pivots[:it+1]+current_iter
+    return LU_factor, raw_pivots, it+current_iter
 
 def unprecondition_LU_factor(LU_factor,precond_weights,num_pivots=None):
     r"""
@@ -730,6 +870,7 @@ def split_lu_factorization_matrix(LU_factor,num_pivots=None):
     U_factor[num_pivots:,num_pivots:] = LU_factor[num_pivots:,num_pivots:]
     return L_factor, U_factor
 
+@timed('pivoted_lu_factorization')
 def truncated_pivoted_lu_factorization(A,max_iters,num_initial_rows=0,
                                        truncate_L_factor=True):
     r"""
@@ -777,22 +918,17 @@ def truncated_pivoted_lu_factorization(A,max_iters,num_initial_rows=0,
         msg += " increasing the number of columns of A"
         raise Exception(msg)
 
-    # Use L to store both L and U during factoriation then copy out U in post
-    # processing
-    LU_factor = A.copy()
-    raw_pivots = np.arange(num_rows)#np.empty(num_rows,dtype=int)
-    LU_factor,raw_pivots,it = continue_pivoted_lu_factorization(
-        LU_factor,raw_pivots,0,max_iters,num_initial_rows)
+    L_factor, U_factor, pivots, raw_pivots, it, ncompleted_pivots = \
+        get_pivoted_lu_factor_columns(A, max_iters, num_initial_rows)
         
     if not truncate_L_factor:
+        LU_factor = get_lu_factor_from_factor_columns(
+            A, L_factor, U_factor, pivots, ncompleted_pivots)
         return LU_factor, raw_pivots
     else:
-        pivots = get_final_pivots_from_sequential_pivots(
-            raw_pivots)[:it+1]
-        L_factor, U_factor = split_lu_factorization_matrix(LU_factor,it+1)
-        L_factor = L_factor[:it+1,:it+1]
-        U_factor = U_factor[:it+1,:it+1]
-        return L_factor, U_factor, pivots
+        L_factor = L_factor[pivots[:it+1], :it+1]
+        U_factor = U_factor[:it+1, :it+1]
+        return L_factor, U_factor, pivots[:it+1]
     
 def add_columns_to_pivoted_lu_factorization(LU_factor,new_cols,raw_pivots):
     r"""
@@ -808,33 +944,17 @@ def add_columns_to_pivoted_lu_factorization(LU_factor,new_cols,raw_pivots):
     """
     assert LU_factor.shape[0]==new_cols.shape[0]
     assert raw_pivots.shape[0]<=new_cols.shape[0]
-    num_new_cols = new_cols.shape[1]
     num_pivots = raw_pivots.shape[0]
-    for it in range(num_pivots):
-        pivot = raw_pivots[it]
-        swap_rows(new_cols,it,pivot)
-
-        # update U_factor
-        # recover state of col vector from permuted LU factor
-        # Let  (jj,kk) represent iteration and pivot pairs
-        # then if lu factorization produced sequence of pairs
-        # (0,4),(1,2),(2,4) then LU_factor[:,0] here will be col_vector
-        # in LU algorithm with the second and third permutations
-        # so undo these permutations in reverse order
-        col_vector = LU_factor[it+1:,it].copy()
-        for ii in range(num_pivots-it-1):
-            # (it+1) necessary in two lines below because only dealing
-            # with compressed col vector which starts at row it in LU_factor
-            jj=raw_pivots[num_pivots-1-ii]-(it+1)
-            kk=num_pivots-ii-1-(it+1)
-            swap_rows(col_vector,jj,kk)
-        row_vector = new_cols[it,:]
-
-        update = np.outer(col_vector,row_vector)
-        new_cols[it+1:,:] -= update
-
-        #new_cols = add_rows_to_pivoted_lu_factorization(
-        #    new_cols[:it+1,:],new_cols[it+1:,:],num_pivots)
+    # apply all the pivots to the new columns then apply the updates of all
+    # the pivots with one triangular solve and one matrix-matrix product
+    new_cols = new_cols[get_final_pivots_from_sequential_pivots(
+        raw_pivots, new_cols.shape[0])]
+    if num_pivots > 0:
+        new_cols[:num_pivots] = solve_triangular(
+            LU_factor[:num_pivots, :num_pivots], new_cols[:num_pivots],
+            lower=True, unit_diagonal=True)
+        new_cols[num_pivots:] -= LU_factor[num_pivots:, :num_pivots].dot(
+            new_cols[:num_pivots])
 
     LU_factor = np.hstack((LU_factor,new_cols))
     return LU_factor
@@ -1099,6 +1219,7 @@ def cholesky_decomposition(Amat):
         
     return L
 
+@timed('pivoted_cholesky_decomposition')
 def pivoted_cholesky_decomposition(A,npivots,init_pivots=None,tol=0.,
                                    error_on_small_tol=False,
                                    pivot_weights=None,
@@ -1117,22 +1238,37 @@ def pivoted_cholesky_decomposition(A,npivots,init_pivots=None,tol=0.,
 
     where P is the standard pivot matrix which can be obtained from the 
     pivot vector using the function 
+
+    A can also be an object with attribute shape, function diagonal()
+    returning the diagonal of the matrix and __getitem__ supporting 
+    A[rows,col] for an integer col, e.g. an operator that computes columns of
+    a matrix on demand. In this case only the diagonal and the npivots 
+    pivot columns of the matrix are ever computed.
+
+    A is never copied or modified. Only the diagonal of A and the
+    (nrows,npivots) factor L are stored.
+
+    When econ is False the pivot maximizing the norm of the corresponding
+    column of the Schur complement divided by its diagonal entry is chosen.
+    The Schur complement is never formed. The column norms are updated
+    using one matrix-vector product with A per pivot.
     """
-    Amat = A.copy()
-    nrows = Amat.shape[0]
-    assert Amat.shape[1]==nrows
+    if isinstance(A,np.ndarray):
+        diag = np.diagonal(A).astype(float)
+    else:
+        diag = np.array(A.diagonal(),dtype=float)
+    nrows = A.shape[0]
+    assert A.shape[1]==nrows
     assert npivots<=nrows
 
-    #L = np.zeros(((nrows,npivots)))
-    L = np.zeros(((nrows,nrows)))
-    #diag1 = np.diag(Amat).copy() # returns a copy of diag
-    diag = Amat.ravel()[::Amat.shape[0]+1] #returns a view of diag
-    #assert np.allclose(diag,diag1)
+    # only store the columns of L that are computed.
+    # continue_pivoted_cholesky_decomposition will add more columns if needed
+    L = np.zeros(((nrows,npivots)))
     pivots = np.arange(nrows)
     init_error = np.absolute(diag).sum()
     L, pivots, diag, chol_flag, ncompleted_pivots, error = \
         continue_pivoted_cholesky_decomposition(
-            Amat, L, npivots, init_pivots, tol,
+            A, L, npivots, init_pivots, tol,
             error_on_small_tol,
             pivot_weights, pivots, diag,
             0, init_error, econ)
@@ -1141,19 +1277,59 @@ def pivoted_cholesky_decomposition(A,npivots,init_pivots=None,tol=0.,
         return L[:,:ncompleted_pivots], pivots[:ncompleted_pivots], error,\
             chol_flag
     else:
-        return L, pivots, error, chol_flag, diag.copy(), init_error, \
+        return L, pivots, error, chol_flag, diag, init_error, \
             ncompleted_pivots
 
 
+def get_schur_complement_column_norms(Amat, L, pivots, ncompleted_pivots,
+                                      block_size=1000):
+    r"""
+    Return the squared norms of the columns of the Schur complement 
+    :math:`S=A_{22}-L_{2}L_{2}^T` of the rows and columns of Amat that have
+    not been pivoted, indexed by the rows of Amat. The Schur complement is
+    formed block_size columns at a time.
+    """
+    ii = ncompleted_pivots
+    rows = pivots[ii:]
+    norms = np.zeros(Amat.shape[0])
+    for lb in range(0, rows.shape[0], block_size):
+        cols = rows[lb:lb+block_size]
+        schur_complement = Amat[np.ix_(rows, cols)]-L[rows, :ii].dot(
+            L[cols, :ii].T)
+        norms[cols] = np.sum(schur_complement**2, axis=0)
+    return norms
+
+
 def continue_pivoted_cholesky_decomposition(Amat, L, npivots, init_pivots, tol,
                                             error_on_small_tol,
                                             pivot_weights, pivots, diag,
                                             ncompleted_pivots, init_error,
-                                            econ):
-    Amat = Amat.copy()  # Do not overwrite incoming Amat
+                                            econ=True):
+    r"""
+    Add pivots to a pivoted Cholesky decomposition computed by
+    :func:`pyapprox.utilities.pivoted_cholesky_decomposition` with 
+    return_full=True.
+
+    The factor L, the pivots and the diagonal of the Schur complement diag
+    are updated in place when possible and returned. Amat is not copied.
+    When L has fewer than npivots columns its number of columns is at 
+    least doubled so that repeatedly adding a few pivots has amortized 
+    linear cost. Consequently L can have more columns than the number of
+    completed pivots returned. The remaining columns are zero.
+    """
+    if not isinstance(Amat,np.ndarray) and econ is False:
+        msg = 'econ must be True when Amat is not a np.ndarray'
+        raise Exception(msg)
     if econ is False and pivot_weights is not None:
         msg = 'pivot weights not used when econ is False' 
         raise Exception(msg)
+    nrows = L.shape[0]
+    if L.shape[1]<npivots:
+        ncols = min(nrows, max(npivots, 2*L.shape[1]))
+        L = np.hstack([L,np.zeros((nrows,ncols-L.shape[1]))])
+    if econ is False:
+        schur_norms = get_schur_complement_column_norms(
+            Amat, L, pivots, ncompleted_pivots)
     chol_flag = 0
     assert ncompleted_pivots < npivots
     for ii in range(ncompleted_pivots, npivots):
@@ -1165,13 +1341,8 @@ def continue_pivoted_cholesky_decomposition(Amat, L, npivots, init_pivots, tol,
                     pivot = np.argmax(
                         pivot_weights[pivots[ii:]]*diag[pivots[ii:]])+ii
             else:
-                schur_complement = (
-                    Amat[np.ix_(pivots[ii:], pivots[ii:])]-
-                    L[pivots[ii:], :ii].dot(L[pivots[ii:], :ii].T))
-                schur_diag = np.diagonal(schur_complement)
                 pivot = np.argmax(
-                    np.linalg.norm(schur_complement, axis=0)**2/schur_diag)
-                pivot += ii
+                    schur_norms[pivots[ii:]]/diag[pivots[ii:]])+ii
         else:
             pivot = np.where(pivots==init_pivots[ii])[0][0]
             assert pivot >= ii
@@ -1190,6 +1361,18 @@ def continue_pivoted_cholesky_decomposition(Amat, L, npivots, init_pivots, tol,
 
         L[pivots[ii+1:], ii]=(Amat[pivots[ii+1:], pivots[ii]]-
             L[pivots[ii+1:], :ii].dot(L[pivots[ii], :ii]))/L[pivots[ii], ii]
+        if econ is False:
+            # update the column norms of the Schur complement S using
+            # S_new = S-l*l.T where l is the new column of L. Only the
+            # product of S with l is needed
+            rows = pivots[ii+1:]
+            col = np.zeros(nrows)
+            col[rows] = L[rows, ii]
+            schur_col = (Amat.dot(col)[rows]-L[rows, :ii].dot(
+                L[rows, :ii].T.dot(col[rows])))
+            schur_norms[rows] += (
+                -diag[pivots[ii]]*col[rows]**2-2*col[rows]*schur_col +
+                col[rows]**2*col[rows].dot(col[rows]))
         diag[pivots[ii+1:]] -= L[pivots[ii+1:], ii]**2
 
         # for jj in range(ii+1,nrows):